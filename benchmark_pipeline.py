@@ -0,0 +1,280 @@
+# benchmark_pipeline.py
+
+import os, re, sys, json, time, shutil, hashlib, platform, argparse, subprocess
+from contextlib import redirect_stdout
+from datetime import datetime
+import numpy as np
+from src.synthetic_project import DEFAULT_PROJECT_NAME, generate_project
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- Configuración ---
+BENCHMARK_DIR = "benchmarks"
+HISTORY_FILE = os.path.join(BENCHMARK_DIR, "benchmark_history.json")
+WORKSPACE_DIR = os.path.join(BENCHMARK_DIR, "workspace")
+LOG_FILENAME = "pipeline.log"
+SOURCE_DIR = "1_tibco_project_source"
+SHARED_FILES = ["config", "template.html"]
+DEFAULT_PHASES = "1,2,3,5"
+# Una fase es una regresión si tarda (o consume) más de un 20% que la última ejecución comparable.
+REGRESSION_TOLERANCE = float(os.getenv("BENCHMARK_REGRESSION_TOLERANCE", "0.2"))
+MIN_COMPARABLE_SECONDS = 1.0  # Por debajo, el ruido domina la medida
+STUB_EMBEDDING_DIM = 384
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de escalado del pipeline sobre un proyecto TIBCO sintético.")
+    parser.add_argument("--processes", type=int, default=1000, help="Número de procesos (.process) a generar.")
+    parser.add_argument("--activities", type=int, default=6, help="Actividades por proceso.")
+    parser.add_argument("--depth", type=int, default=4, help="Niveles del grafo de llamadas.")
+    parser.add_argument("--fan-out", type=int, default=3, help="Subprocesos a los que llama cada proceso.")
+    parser.add_argument("--schema-pool", type=int, default=20, help="Esquemas distintos que comparten los procesos.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--phases", default=DEFAULT_PHASES,
+                        help="Fases a medir, separadas por comas. Las llamadas al LLM y los embeddings se simulan.")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para las fases 2 y 5.")
+    parser.add_argument("--html-mode", choices=["single", "site"], default="single")
+    parser.add_argument("--label", default="", help="Etiqueta libre guardada en el historial.")
+    parser.add_argument("--generate-only", metavar="DIR",
+                        help="Solo genera el proyecto sintético en DIR (ej. '1_tibco_project_source') y termina.")
+    return parser.parse_args()
+
+
+# --- Simulaciones: el benchmark mide el pipeline, no la latencia del LLM ni el modelo de embeddings ---
+class StubLLM:
+    """Sustituye a llm_client.generate_text: respuesta determinista y recuento de llamadas y tokens."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    def __call__(self, prompt: str, use_cache: bool = True, json_output: bool = False) -> str:
+        from src.rate_limiter import estimate_tokens
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(prompt)
+        if json_output:
+            return '{"interactions": []}'
+        return f"Respuesta simulada {hashlib.md5(prompt.encode('utf-8')).hexdigest()[:12]}."
+
+
+class StubEmbeddingModel:
+    """Modelo de embeddings determinista (hash del texto) con la interfaz de encode() de sentence-transformers."""
+
+    def encode(self, texts, normalize_embeddings: bool = False, **kwargs):
+        vectors = np.empty((len(texts), STUB_EMBEDDING_DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(STUB_EMBEDDING_DIM)
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+
+def install_stubs() -> StubLLM:
+    from src import embedding_service, llm_client
+    stub = StubLLM()
+    llm_client.generate_text = stub
+    embedding_service._model = StubEmbeddingModel()
+    return stub
+
+
+# --- Medidas ---
+def reset_peak_rss() -> bool:
+    """Reinicia el pico de memoria residente del proceso (Linux); así cada fase tiene su propio pico."""
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status", 'r') as f:
+            match = re.search(r"VmHWM:\s+(\d+)\s+kB", f.read())
+        if match: return round(int(match.group(1)) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # kB en Linux, bytes en macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def workers_peak_rss_mb():
+    """Mayor pico de memoria entre los procesos hijos terminados (trabajadores de las fases 2 y 5)."""
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1) if peak else None
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def count_artifacts():
+    """(artefactos, procesos) del mapa de la Fase 1."""
+    try:
+        with open(os.path.join("2_intermediate_data", "project_map.json"), 'r', encoding='utf-8') as f:
+            artifacts = json.load(f).get("artifacts", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0, 0
+    return len(artifacts), sum(1 for data in artifacts.values() if data.get("type") == "process")
+
+
+# --- Ejecución ---
+def prepare_workspace(workspace: str):
+    """Espacio de trabajo limpio con la configuración y la plantilla del repositorio."""
+    if os.path.isdir(workspace):
+        shutil.rmtree(workspace)
+    os.makedirs(workspace)
+    for name in SHARED_FILES:
+        if os.path.isdir(name):
+            shutil.copytree(name, os.path.join(workspace, name))
+        elif os.path.exists(name):
+            shutil.copy2(name, os.path.join(workspace, name))
+
+
+def run_phase(phase: str, args, rag_handler):
+    if phase == "1":
+        from src.step1_discover import run_discovery_phase
+        run_discovery_phase()
+    elif phase == "2":
+        from src.step2_preprocess import run_preprocessing_phase
+        run_preprocessing_phase(workers=args.workers)
+    elif phase == "3":
+        from src.step3_documenter import OUTPUT_DOCS_DIR, run_atomic_documentation_phase
+        run_atomic_documentation_phase()
+        rag_handler.update_from_generated_docs(OUTPUT_DOCS_DIR)
+    elif phase == "4":
+        from src.step4_assembler import run_assembly_phase
+        run_assembly_phase(rag_handler)
+    elif phase == "5":
+        from src.step5_build_html import run_html_build_phase
+        run_html_build_phase(workers=args.workers, mode=args.html_mode)
+
+
+def run_benchmark(args) -> dict:
+    """
+    Genera el proyecto sintético en un espacio de trabajo limpio, ejecuta las fases pedidas en un
+    solo proceso (como run_pipeline.py) y mide por fase el tiempo, el pico de memoria y los archivos
+    por segundo: archivos del árbol en la Fase 1, artefactos del mapa en la 2 y procesos en la 3-5.
+    """
+    phases = sorted({p.strip() for p in args.phases.split(",") if p.strip()})
+    history_path = os.path.abspath(HISTORY_FILE)
+    workspace = os.path.abspath(WORKSPACE_DIR)
+    print(f"--- Benchmark del pipeline: fases {','.join(phases)} sobre un proyecto sintético ---")
+    prepare_workspace(workspace)
+
+    start = time.monotonic()
+    project = generate_project(os.path.join(workspace, SOURCE_DIR), processes=args.processes,
+                               activities=args.activities, depth=args.depth, fan_out=args.fan_out,
+                               schema_pool=args.schema_pool, seed=args.seed)
+    generate_seconds = round(time.monotonic() - start, 2)
+    print(f"  -> Proyecto generado: {project['files']} archivos, {project['processes']} procesos, "
+          f"{project['calls']} llamadas ({generate_seconds}s).")
+
+    base_dir = os.getcwd()
+    os.chdir(workspace)
+    results = {}
+    try:
+        llm_stub, rag_handler = None, None
+        with open(LOG_FILENAME, 'w', encoding='utf-8') as log, redirect_stdout(log):
+            for phase in phases:
+                if phase in ("3", "4") and llm_stub is None:
+                    # Fuera de la medida, como la inicialización de run_pipeline.py.
+                    llm_stub = install_stubs()
+                    from src.rag_handler import RAGHandler
+                    rag_handler = RAGHandler()
+                calls_before = (llm_stub.calls, llm_stub.prompt_tokens) if llm_stub else (0, 0)
+                reset_peak_rss()
+                phase_start = time.monotonic()
+                run_phase(phase, args, rag_handler)
+                seconds = time.monotonic() - phase_start
+                artifacts, processes = count_artifacts()
+                files = {"1": project["files"], "2": artifacts}.get(phase, processes)
+                results[phase] = {"seconds": round(seconds, 3), "peak_rss_mb": peak_rss_mb(), "files": files,
+                                  "files_per_second": round(files / seconds, 1) if seconds else None}
+                if llm_stub is not None and phase in ("3", "4"):
+                    results[phase]["llm_calls"] = llm_stub.calls - calls_before[0]
+                    results[phase]["prompt_tokens"] = llm_stub.prompt_tokens - calls_before[1]
+                print(f"[BENCHMARK] Fase {phase}: {results[phase]}", file=sys.__stdout__)
+    finally:
+        os.chdir(base_dir)
+
+    record = {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+              "label": args.label, "python": platform.python_version(), "platform": platform.platform(),
+              "cpu_count": os.cpu_count(), "phases_run": phases, "workers": args.workers, "html_mode": args.html_mode,
+              "parameters": {key: value for key, value in project.items() if key != "project_root"},
+              "generate_seconds": generate_seconds, "phases": results,
+              "total_seconds": round(sum(r["seconds"] for r in results.values()), 3),
+              "workers_peak_rss_mb": workers_peak_rss_mb()}
+    history = load_history(history_path)
+    report_regressions(record, history)
+    history.append(record)
+    save_history(history, history_path)
+    print(f"\n--- Benchmark completado en {record['total_seconds']}s. Historial: '{HISTORY_FILE}' "
+          f"({len(history)} ejecuciones). Log de las fases: '{os.path.join(WORKSPACE_DIR, LOG_FILENAME)}' ---")
+    return record
+
+
+def load_history(path: str = HISTORY_FILE) -> list:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def save_history(history: list, path: str = HISTORY_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2, ensure_ascii=False)
+
+
+def report_regressions(record: dict, history: list):
+    """Compara cada fase con la última ejecución con los mismos parámetros, fases, trabajadores y máquina."""
+    def comparable(entry):
+        return all(entry.get(key) == record.get(key) for key in ("parameters", "phases_run", "workers", "html_mode", "cpu_count"))
+    previous = next((entry for entry in reversed(history) if comparable(entry)), None)
+    if previous is None:
+        print("  -> Sin ejecuciones anteriores comparables en el historial.")
+        return
+    print(f"\n  -> Comparación con la ejecución del {previous['timestamp']} (commit {previous.get('commit')}):")
+    for phase, current in record["phases"].items():
+        before = previous.get("phases", {}).get(phase)
+        if not before: continue
+        changes = []
+        for metric in ("seconds", "peak_rss_mb"):
+            old, new = before.get(metric), current.get(metric)
+            if not old or new is None: continue
+            ratio = new / old
+            regression = ratio > 1 + REGRESSION_TOLERANCE and \
+                (metric != "seconds" or max(old, new) >= MIN_COMPARABLE_SECONDS)
+            changes.append(f"{metric} {old} -> {new} ({ratio - 1:+.0%}){' [REGRESIÓN]' if regression else ''}")
+        status = "[WARN]" if any("REGRESIÓN" in change for change in changes) else "      "
+        print(f"    {status} Fase {phase}: " + "; ".join(changes))
+
+
+def main():
+    args = parse_args()
+    if args.generate_only:
+        project = generate_project(args.generate_only, processes=args.processes, activities=args.activities,
+                                   depth=args.depth, fan_out=args.fan_out, schema_pool=args.schema_pool,
+                                   seed=args.seed)
+        print(f"Proyecto sintético '{DEFAULT_PROJECT_NAME}' generado en '{project['project_root']}': "
+              f"{project['files']} archivos, {project['processes']} procesos.")
+        return
+    run_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,16 @@
 
 import os
 from src.vector_db_client import VectorDBClient
-from langchain_community.document_loaders import PyPDFLoader
+from src.pdf_ingestion import PDFIngestionPipeline, PageChunker, format_ingestion_stats
+from src.embedding_service import format_embedding_stats, get_embedding_engine
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 # --- Configuración ---
 KNOWLEDGE_SOURCE_DIR = "knowledge_base_source"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 150
+INGEST_WORKERS = None  # None = todos los núcleos
+INGEST_BATCH_SIZE = 256
 
 
 def run_knowledge_base_build():
@@ -39,26 +42,33 @@ def run_knowledge_base_build():
         chunk_overlap=CHUNK_OVERLAP
     )
 
-    total_chunks = 0
-    for doc_name in docs_to_process:
-        try:
-            full_path = os.path.join(KNOWLEDGE_SOURCE_DIR, doc_name)
-            print(f"  -> Procesando: {doc_name}")
-
-            # 1. Cargar el documento PDF
-            loader = PyPDFLoader(full_path)
-            documents = loader.load()
-
-            # 2. Dividir el texto en fragmentos (chunks)
-            chunks = text_splitter.split_documents(documents)
-            print(f"     - Documento dividido en {len(chunks)} fragmentos.")
-
-            # 3. Añadir los fragmentos a la base de datos vectorial
-            db_client.add_documents(chunks)
-            total_chunks += len(chunks)
-
-        except Exception as e:
-            print(f"    [ERROR] Falló el procesamiento de {doc_name}: {e}")
+    # Extracción de páginas en paralelo (PyMuPDF) e inserción en lotes de tamaño fijo
+    paths = [os.path.join(KNOWLEDGE_SOURCE_DIR, doc_name) for doc_name in docs_to_process]
+    ordinals = {path: 0 for path in paths}
+
+    def make_chunker(path):
+        print(f"  -> Procesando: {os.path.basename(path)}")
+        return PageChunker(text_splitter.split_text, {"source": path})
+
+    def sink(batch):
+        texts, metadatas, ids = [], [], []
+        for path, text, metadata in batch:
+            ids.append(f"{path}_page{metadata['page']}_{ordinals[path]}")
+            ordinals[path] += 1
+            texts.append(text); metadatas.append(metadata)
+        db_client.add_chunks(texts, metadatas, ids)
+
+    def on_document_end(path, error):
+        if error:
+            print(f"    [ERROR] Falló el procesamiento de {os.path.basename(path)}: {error}")
+        else:
+            print(f"     - Documento dividido en {ordinals[path]} fragmentos.")
+
+    pipeline = PDFIngestionPipeline(workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE)
+    stats = pipeline.run(paths, make_chunker, sink, on_document_end)
+    total_chunks = stats["chunks"]
+    print(f"  -> {format_ingestion_stats(stats)}")
+    print(f"  -> Embeddings: {format_embedding_stats(get_embedding_engine().stats())}")
 
     print(f"\n--- Construcción Finalizada. Se han indexado {total_chunks} fragmentos de texto. ---")
 
@@ -0,0 +1,26 @@
+# compact_knowledge_base.py
+
+from src.rag_handler import RAGHandler
+
+
+def run_compaction():
+    """
+    Elimina de la base de conocimiento RAG los fragmentos huérfanos y compacta la base de
+    datos en disco, informando del espacio recuperado.
+    """
+    print("--- Compactando la Base de Conocimiento RAG ---")
+    stats = RAGHandler().compact()
+    if not stats:
+        print("[ERROR] No se pudo abrir la base de datos vectorial.")
+        return
+    if stats.get("skipped"):
+        print("\n--- Compactación omitida. ---")
+        return
+    mb = 1024 * 1024
+    print(f"\n--- Compactación Finalizada. {stats['orphans_removed']} fragmentos huérfanos eliminados; "
+          f"{stats['bytes_before'] / mb:.1f} MB -> {stats['bytes_after'] / mb:.1f} MB "
+          f"({stats['bytes_reclaimed'] / mb:.1f} MB recuperados). ---")
+
+
+if __name__ == "__main__":
+    run_compaction()
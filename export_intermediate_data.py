@@ -0,0 +1,19 @@
+# export_intermediate_data.py
+
+import sys
+from src.intermediate_store import JSON_TREE_DIR, export_json_tree, open_store
+
+
+def run_export(output_dir: str = JSON_TREE_DIR):
+    """Vuelca el almacén intermedio (SQLite) al árbol de JSON con sangría, para depuración."""
+    print(f"--- Exportando los artefactos pre-procesados a '{output_dir}' ---")
+    store = open_store()
+    if not store.available():
+        print("[ERROR] No se encontró el almacén intermedio. Ejecuta antes la Fase 2.")
+        return
+    count = export_json_tree(store, output_dir)
+    print(f"\n--- Exportación Finalizada. {count} artefactos escritos en '{output_dir}'. ---")
+
+
+if __name__ == "__main__":
+    run_export(*sys.argv[1:2])
@@ -1,47 +1,113 @@
 # run_pipeline.py (Ubicado en la raíz del proyecto)
 
+import argparse
 from src.step1_discover import run_discovery_phase
 from src.step2_preprocess import run_preprocessing_phase
-from src.step3_documenter import run_atomic_documentation_phase
-from src.step4_assembler import run_assembly_phase
 from src.step5_build_html import run_html_build_phase
-from src.llm_client import initialize_llm
-from src.rag_handler import RAGHandler
 
 KNOWLEDGE_BASE_SOURCE_DIR = "knowledge_base_source"
+ALL_PHASES = "1,2,3,4,5"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pipeline de documentación de proyectos TIBCO BW.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Número de procesos para el pre-procesamiento en paralelo (Fase 2); en modo portafolio, "
+                             "tamaño del pool compartido entre proyectos.")
+    parser.add_argument("--phases", default=ALL_PHASES,
+                        help="Fases a ejecutar, separadas por comas (ej. '1,2,5'). Por defecto, todas.")
+    parser.add_argument("--html-mode", choices=["single", "site"], default="single",
+                        help="Fase 5: un único HTML ('single') o un sitio paginado con carga bajo demanda ('site').")
+    parser.add_argument("--portfolio", action="store_true",
+                        help="Procesa todos los proyectos de '1_tibco_project_source' en una sola ejecución, "
+                             "cada uno en 'portfolio/<proyecto>/', compartiendo LLM, caché y base RAG.")
+    return parser.parse_args()
+
+
+def print_llm_stats():
+    from src.llm_client import get_cache_stats, get_client_stats
+    cache_stats = get_cache_stats()
+    if cache_stats:
+        print(f"\n  -> Caché del LLM: {cache_stats['hits']} aciertos, {cache_stats['misses']} fallos "
+              f"(tasa de acierto {cache_stats['hit_rate']:.0%}), {cache_stats['evictions']} entradas expulsadas.")
+    client_stats = get_client_stats()
+    if client_stats.get("requests"):
+        print(f"  -> Llamadas al LLM: {client_stats['requests']} (latencia media {client_stats['latency_avg']}s, "
+              f"máx. {client_stats['latency_max']:.2f}s), {client_stats['retries']} reintentos, "
+              f"{client_stats['throttles']} respuestas 429, {client_stats['failures']} fallos definitivos. "
+              f"Concurrencia final: {client_stats['concurrency_limit']}.")
+
+
+def run_portfolio_pipeline(args, phases, rag_handler):
+    """Modo portafolio: la documentación externa se ingiere una sola vez y sirve a todos los proyectos."""
+    from src.portfolio import PORTFOLIO_DIR, run_portfolio
+    if "3" in phases:
+        rag_handler.populate_from_external_docs(KNOWLEDGE_BASE_SOURCE_DIR)
+    run_portfolio(phases, workers=args.workers, html_mode=args.html_mode, rag_handler=rag_handler)
+    if rag_handler is not None:
+        print_llm_stats()
+        query_stats = rag_handler.query_cache_stats()
+        print(f"  -> Consultas RAG: {query_stats['hits']} aciertos de caché, {query_stats['misses']} búsquedas.")
+    print("\n===== PIPELINE DE PORTAFOLIO COMPLETADO =====")
+    print(f"Revisa la documentación de cada proyecto en '{PORTFOLIO_DIR}/<proyecto>/3_output_documentation/'")
 
 
 def main():
     """Orquesta la ejecución de todo el pipeline con Agente de Análisis y RAG."""
+    args = parse_args()
     print("===== INICIANDO PIPELINE CON AGENTE DE ANÁLISIS Y RAG DE DOBLE FUENTE =====")
 
+    phases = {p.strip() for p in args.phases.split(",") if p.strip()}
+    uses_llm = bool(phases & {"3", "4"})
+
     # --- Inicialización de Componentes ---
-    rag_handler = RAGHandler()
-    if not initialize_llm():
-        print("[ERROR] El pipeline se detuvo porque el cliente LLM no pudo inicializarse.")
+    # El cliente LLM y la base vectorial (con su modelo de embeddings) solo se importan e inicializan
+    # si alguna fase los usa; las fases 1, 2 y 5 arrancan sin ese coste.
+    rag_handler = None
+    if uses_llm:
+        from src.llm_client import initialize_llm
+        from src.rag_handler import RAGHandler
+        rag_handler = RAGHandler()
+        if not initialize_llm():
+            print("[ERROR] El pipeline se detuvo porque el cliente LLM no pudo inicializarse.")
+            return
+
+    if args.portfolio:
+        run_portfolio_pipeline(args, phases, rag_handler)
         return
 
     # --- FASE 1: Descubrir artefactos y dependencias ---
-    run_discovery_phase()
+    if "1" in phases:
+        run_discovery_phase()
 
     # --- FASE 2: Enriquecer los artefactos con su estructura interna ---
-    run_preprocessing_phase()
+    if "2" in phases:
+        run_preprocessing_phase(workers=args.workers)
 
-    # --- FASE 3A: Poblar la base de conocimiento RAG con la documentación externa (PDFs) ---
-    rag_handler.populate_from_external_docs(KNOWLEDGE_BASE_SOURCE_DIR)
+    if "3" in phases:
+        from src.step3_documenter import run_atomic_documentation_phase
 
-    # --- FASE 3B: El Agente documenta cada proceso, consultando el RAG si es necesario ---
-    # (La versión actual de step3 no consulta, pero está lista para hacerlo si se añade la lógica)
-    run_atomic_documentation_phase()
+        # --- FASE 3A: Poblar la base de conocimiento RAG con la documentación externa (PDFs) ---
+        rag_handler.populate_from_external_docs(KNOWLEDGE_BASE_SOURCE_DIR)
 
-    # --- FASE 3C: Actualizar la base de conocimiento con los documentos recién generados ---
-    rag_handler.update_from_generated_docs("3_output_documentation")
+        # --- FASE 3B: El Agente documenta cada proceso, consultando el RAG si es necesario ---
+        # (La versión actual de step3 no consulta, pero está lista para hacerlo si se añade la lógica)
+        run_atomic_documentation_phase()
+
+        # --- FASE 3C: Actualizar la base de conocimiento con los documentos recién generados ---
+        rag_handler.update_from_generated_docs("3_output_documentation")
 
     # --- FASE 4: Ensamblar un resumen de alto nivel usando el conocimiento COMPLETO de RAG ---
-    run_assembly_phase(rag_handler)
+    if "4" in phases:
+        from src.step4_assembler import run_assembly_phase
+        run_assembly_phase(rag_handler)
 
     # --- FASE 5: Construir el documento HTML final ---
-    run_html_build_phase()
+    if "5" in phases:
+        run_html_build_phase(mode=args.html_mode)
+
+    if uses_llm:
+        print_llm_stats()
 
     print("\n===== PIPELINE COMPLETADO =====")
     print(f"Revisa la documentación final en el archivo: '3_output_documentation/TIBCO_Migration_Specification.html'")
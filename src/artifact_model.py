@@ -0,0 +1,261 @@
+# src/artifact_model.py
+
+import os, re
+from lxml import etree as ET
+
+# Modelo de un proceso TIBCO construido con un único parseo del XML, en la Fase 2, incluidas sus
+# dependencias ('dependency_names'). La Fase 1 no parsea el XML: obtiene las dependencias con un escaneo
+# de los bytes del archivo (scan_dependency_names) y la Fase 2 las corrige con las del modelo si difieren.
+
+NAMESPACES = {'pd': 'http://xmlns.tibco.com/bw/process/2003',
+              'xsl': 'http://www.w3.org/1999/XSL/Transform', 'xsd': 'http://www.w3.org/2001/XMLSchema'}
+
+REPO_PATH_PATTERN = re.compile(r'/([\w/.-]+)')
+GLOBAL_VAR_PATTERN = re.compile(r'%%([\w/.-]+)%%')
+# Escaneo sin parsear: texto de un elemento que es una ruta del repositorio (<x>/Processes/A.process</x>).
+REPO_PATH_SCAN_PATTERN = re.compile(r'>\s*/([\w/.-]+)\s*</')
+HTTP_RESPONSE_ACTIVITY = "com.tibco.plugin.http.HTTPResponseActivity"
+# A partir de este tamaño el proceso se analiza en streaming (iterparse) en lugar de cargar el árbol completo.
+STREAMING_THRESHOLD_BYTES = int(os.getenv("PROCESS_STREAMING_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+# Las consultas se evalúan en C (lxml) sobre el árbol ya parseado: Python solo ve los pocos nodos candidatos.
+REPO_PATH_XPATH = ET.XPath("descendant-or-self::*[starts-with(normalize-space(text()), '/')][not(*)]")
+GLOBAL_VAR_XPATH = ET.XPath("descendant-or-self::text()[contains(., '%%')] | descendant-or-self::*/@*[contains(., '%%')]")
+
+
+# --- Funciones de Ayuda ---
+def get_text(element, query, namespaces, default=None):
+    if element is None: return default
+    node = element.find(query, namespaces)
+    return node.text if node is not None else default
+
+
+def element_to_string(element):
+    if element is None: return "No definido"
+    for elem in element.getiterator():
+        if '}' in elem.tag: elem.tag = elem.tag.split('}', 1)[1]
+    ET.indent(element, space="  ")
+    return ET.tostring(element, pretty_print=True, encoding='unicode')
+
+
+def parse_xslt_logic(element, namespaces):
+    if element is None: return None
+    choose_node = element.find('xsl:choose', namespaces)
+    if choose_node is not None:
+        logic = {"type": "conditional", "conditions": []}
+        for when_node in choose_node.findall('xsl:when', namespaces):
+            value_node = when_node.find('.//xsl:value-of', namespaces)
+            logic["conditions"].append({
+                "if": when_node.get("test"),
+                "then": value_node.get('select') if value_node is not None else "N/A"
+            })
+        otherwise_node = choose_node.find('xsl:otherwise', namespaces)
+        if otherwise_node is not None:
+            value_node = otherwise_node.find('.//xsl:value-of', namespaces)
+            logic["conditions"].append({
+                "if": "otherwise",
+                "then": value_node.get('select') if value_node is not None else "N/A"
+            })
+        return logic
+    value_of_node = element.find('.//xsl:value-of', namespaces)
+    if value_of_node is not None:
+        return {"type": "direct", "source": value_of_node.get('select')}
+    copy_of_node = element.find('.//xsl:copy-of', namespaces)
+    if copy_of_node is not None:
+        return {"type": "copy", "source": copy_of_node.get('select')}
+    return {"type": "unknown"}
+
+
+# --- Funciones de Análisis Semántico ---
+def analyze_process_metadata(root, namespaces):
+    starter = root.find('pd:starter', namespaces)
+    if starter is None: return classify_process(None, False)
+    has_response = root.find(f'.//pd:activity[pd:type="{HTTP_RESPONSE_ACTIVITY}"]', namespaces) is not None
+    return classify_process(get_text(starter, 'pd:type', namespaces, ""), has_response)
+
+
+def classify_process(starter_type, has_http_response: bool):
+    """Paradigma, estilo y patrón del proceso según el tipo de su starter (None si no tiene starter)."""
+    metadata = {"paradigm": "Subproceso", "style": "N/A", "pattern": "N/A"}
+    if starter_type is None: return metadata
+    if "HTTPEventSource" in starter_type:
+        metadata["paradigm"] = "Servicio Web";
+        metadata["style"] = "REST"
+        metadata[
+            "pattern"] = "Síncrono (Request-Reply)" if has_http_response else "Asíncrono (Fire-and-Forget)"
+    elif "SOAPEventSource" in starter_type:
+        metadata["paradigm"] = "Servicio Web";
+        metadata["style"] = "SOAP";
+        metadata["pattern"] = "Síncrono (Request-Reply)"
+    elif "TimerEventSource" in starter_type:
+        metadata["paradigm"] = "Proceso Programado (Batch)";
+        metadata["pattern"] = "Asíncrono"
+    elif "JMSEventSource" in starter_type:
+        metadata["paradigm"] = "Consumidor de Mensajes";
+        metadata["pattern"] = "Asíncrono"
+    return metadata
+
+
+def scan_dependency_names(content: bytes):
+    """
+    Dependencias de un proceso sin parsear el XML (Fase 1): textos de elemento que son una ruta del
+    repositorio (ej. <processName>/Processes/X.process</processName>) y referencias %%Var%%.
+    """
+    text = content.decode('utf-8', errors='ignore')
+    dependencies = set()
+    for path in REPO_PATH_SCAN_PATTERN.findall(text):
+        dependencies.add(os.path.basename(path))
+    add_global_var_dependencies(text, dependencies)
+    return sorted(dependencies)
+
+
+def add_tree_dependencies(elem, dependencies: set, global_vars: bool = True):
+    """Mismas dependencias que scan_dependency_names, sobre el (sub)árbol ya parseado: solo elementos hoja."""
+    for leaf in REPO_PATH_XPATH(elem):
+        add_repo_path_dependency(leaf.text, dependencies)
+    if global_vars:
+        for value in GLOBAL_VAR_XPATH(elem):
+            add_global_var_dependencies(value, dependencies)
+
+
+def add_repo_path_dependency(text, dependencies: set):
+    match = REPO_PATH_PATTERN.fullmatch((text or "").strip())
+    if match: dependencies.add(os.path.basename(match.group(1)))
+
+
+def add_global_var_dependencies(value, dependencies: set):
+    for var in GLOBAL_VAR_PATTERN.findall(value):
+        dependencies.add(os.path.basename(var.split('/')[0]) + ".substvar")
+
+
+def build_process_model(root, namespaces=NAMESPACES):
+    """Construye el modelo del proceso (metadatos, starter, esquemas, actividades y transiciones)."""
+    model = {'metadata': analyze_process_metadata(root, namespaces)}
+    model['name'] = get_text(root, 'pd:name', namespaces)
+    starter = root.find('pd:starter', namespaces)
+    model['starter'] = {"name": starter.get('name'), "type": get_text(starter, 'pd:type', namespaces)} \
+        if starter is not None else None
+    model['input_schema_xml'] = element_to_string(root.find('pd:startType', namespaces))
+    model['output_schema_xml'] = element_to_string(root.find('pd:endType', namespaces))
+
+    model['process_variables'] = build_process_variables(root.find('pd:processVariables', namespaces), namespaces)
+    model['activities'] = [build_activity(act, namespaces) for act in root.findall('.//pd:activity', namespaces)]
+    model['transitions'] = [build_transition(t, namespaces) for t in root.findall('pd:transition', namespaces)]
+    return model
+
+
+def build_process_variables(variables_element, namespaces):
+    process_variables = []
+    if variables_element is not None:
+        for var_container in variables_element:
+            var_def = var_container.find('.//xsd:element', namespaces)
+            if var_def is not None:
+                process_variables.append({"name": var_def.get("name"), "schema_xml": element_to_string(var_def)})
+    return process_variables
+
+
+def build_activity(act, namespaces):
+    config_element = act.find('config')
+    config_data = {c.tag.split('}')[-1]: c.text for c in config_element} if config_element is not None else {}
+
+    input_bindings = act.find('pd:inputBindings', namespaces)
+    mappings = []
+    input_schema = None
+    if input_bindings is not None and len(list(input_bindings)) > 0:
+        payload_root = list(input_bindings)[0]
+        input_schema = element_to_string(payload_root)  # Captura el esquema de entrada de la actividad
+        for field in payload_root:
+            mappings.append({
+                "target_field": field.tag.split('}')[-1],
+                "mapping_logic": parse_xslt_logic(field, namespaces)
+            })
+
+    return {
+        "name": act.get('name'), "type": get_text(act, 'pd:type', namespaces),
+        "config": config_data, "input_bindings": mappings,
+        "activity_input_schema_xml": input_schema
+    }
+
+
+def build_transition(transition, namespaces):
+    return {"from": get_text(transition, 'pd:from', namespaces), "to": get_text(transition, 'pd:to', namespaces),
+            "condition": get_text(transition, 'pd:conditionType', namespaces)}
+
+
+def stream_process_model(file_path: str, namespaces=NAMESPACES) -> dict:
+    """
+    Mismo modelo que build_process_model, pero con iterparse: cada actividad, transición o bloque de
+    primer nivel se procesa al cerrarse y se elimina del árbol. La memoria pico depende de la
+    actividad más grande, no del tamaño del archivo.
+    """
+    pd = "{%s}" % namespaces['pd']
+    found = {}  # Primer hijo directo de la raíz con cada etiqueta (equivalente a root.find('pd:x'))
+    activities, transitions = [], []
+    has_http_response = False
+    root, pending = None, None
+    dependencies = set()
+
+    def finish(elem):
+        nonlocal has_http_response
+        add_tree_dependencies(elem, dependencies)  # Antes de eliminar el subárbol (y su texto de cola)
+        add_global_var_dependencies(elem.tail or "", dependencies)
+        if elem.tag == pd + "activity":
+            activities.append(build_activity(elem, namespaces))
+            has_http_response = has_http_response or get_text(elem, 'pd:type', namespaces) == HTTP_RESPONSE_ACTIVITY
+        elif elem.getparent() is root:
+            if elem.tag == pd + "transition":
+                transitions.append(build_transition(elem, namespaces))
+            elif elem.tag == pd + "name":
+                found.setdefault("name", elem.text)
+            elif elem.tag == pd + "starter" and "starter" not in found:
+                found["starter"] = {"name": elem.get('name'), "type": get_text(elem, 'pd:type', namespaces)}
+                found["starter_type"] = get_text(elem, 'pd:type', namespaces, "")
+            elif elem.tag == pd + "startType":
+                found.setdefault("input_schema_xml", element_to_string(elem))
+            elif elem.tag == pd + "endType":
+                found.setdefault("output_schema_xml", element_to_string(elem))
+            elif elem.tag == pd + "processVariables" and "process_variables" not in found:
+                found["process_variables"] = build_process_variables(elem, namespaces)
+        elem.getparent().remove(elem)
+
+    for event, elem in ET.iterparse(file_path, events=("start", "end"), recover=True):
+        # El elemento terminado se procesa en el evento siguiente, cuando su texto de cola ya está completo.
+        if pending is not None:
+            finish(pending)
+            pending = None
+        if event == "start":
+            if root is None: root = elem
+            continue
+        if not isinstance(elem.tag, str): continue
+        if elem.tag == pd + "activity" or (root is not None and elem.getparent() is root):
+            pending = elem
+    if pending is not None: finish(pending)  # Documento truncado (recover=True) sin cierre de la raíz
+
+    model = {'metadata': classify_process(found.get("starter_type"), has_http_response)}
+    model['name'] = found.get("name")
+    model['starter'] = found.get("starter")
+    model['input_schema_xml'] = found.get("input_schema_xml", element_to_string(None))
+    model['output_schema_xml'] = found.get("output_schema_xml", element_to_string(None))
+    model['process_variables'] = found.get("process_variables", [])
+    model['activities'] = activities
+    model['transitions'] = transitions
+    if root is not None:  # Solo queda la raíz: su texto y sus atributos
+        for value in GLOBAL_VAR_XPATH(root):
+            add_global_var_dependencies(value, dependencies)
+    model['dependency_names'] = sorted(dependencies)
+    return model
+
+
+def parse_process(file_path: str) -> dict:
+    """Modelo del proceso con un único parseo del XML (en streaming a partir de STREAMING_THRESHOLD_BYTES)."""
+    if os.path.getsize(file_path) >= STREAMING_THRESHOLD_BYTES:
+        return stream_process_model(file_path)
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    root = ET.fromstring(content, ET.XMLParser(recover=True))
+    dependencies = set()
+    add_tree_dependencies(root, dependencies, global_vars=False)
+    # Los nombres %%Var%% no contienen caracteres escapables: basta una búsqueda sobre el texto crudo.
+    add_global_var_dependencies(content.decode('utf-8', errors='ignore'), dependencies)
+    model = build_process_model(root)
+    model['dependency_names'] = sorted(dependencies)
+    return model
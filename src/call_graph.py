@@ -0,0 +1,183 @@
+# src/call_graph.py
+
+import os, json
+from collections import deque
+
+GRAPH_FILE = os.path.join("2_intermediate_data", "call_graph.json")
+
+
+def strongly_connected_components(nodes, callees):
+    """Tarjan iterativo. Devuelve las componentes en orden inverso topológico (las llamadas antes que los llamadores)."""
+    index, lowlink, on_stack = {}, {}, set()
+    stack, components = [], []
+    counter = 0
+    for root in nodes:
+        if root in index: continue
+        work = [(root, iter(callees.get(root, [])))]
+        index[root] = lowlink[root] = counter; counter += 1
+        stack.append(root); on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter; counter += 1
+                    stack.append(child); on_stack.add(child)
+                    work.append((child, iter(callees.get(child, []))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            if advanced: continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop(); on_stack.discard(member)
+                    component.append(member)
+                    if member == node: break
+                components.append(sorted(component))
+    return components
+
+
+def build_call_graph(project_map: dict) -> dict:
+    """
+    Índice del grafo de llamadas del proyecto: llamadores y llamados directos, componentes
+    fuertemente conexas (recursión), orden topológico, cierre transitivo por componente y
+    profundidad desde los puntos de entrada. Se calcula una sola vez en la Fase 1.
+    """
+    artifacts = project_map.get("artifacts", {})
+    nodes = sorted(artifacts)
+    callees = {path: [d for d in artifacts[path].get("dependencies", []) if d in artifacts] for path in nodes}
+    callers = {path: [] for path in nodes}
+    for path in nodes:
+        for dependency in callees[path]:
+            callers[dependency].append(path)
+
+    components = strongly_connected_components(nodes, callees)
+    component_of = {member: i for i, component in enumerate(components) for member in component}
+    # Cierre transitivo sobre el grafo condensado: las componentes llegan en orden inverso topológico,
+    # así que el alcance de cada llamado ya está calculado cuando se procesa su llamador.
+    reach = []
+    for i, component in enumerate(components):
+        reachable = set()
+        for member in component:
+            for dependency in callees[member]:
+                j = component_of[dependency]
+                if j != i:
+                    reachable.add(j)
+                    reachable.update(reach[j])
+        if len(component) > 1 or any(m in callees[m] for m in component):
+            reachable.add(i)  # Componente recursiva: se alcanza a sí misma
+        reach.append(sorted(reachable))
+
+    # Recorrido en anchura desde los puntos de entrada: profundidad mínima y orden de lectura.
+    depth, bfs_order = {}, []
+    queue = deque((entry, 0) for entry in project_map.get("entry_points", []))
+    while queue:
+        path, level = queue.popleft()
+        if path in depth or path not in artifacts: continue
+        depth[path] = level
+        bfs_order.append(path)
+        for dependency in callees[path]:
+            if dependency.endswith(".process") and dependency not in depth:
+                queue.append((dependency, level + 1))
+
+    return {"entry_points": list(project_map.get("entry_points", [])),
+            "callees": callees, "callers": callers,
+            "components": components, "component_reach": reach,
+            "topological_order": [member for component in components for member in component],
+            "depth": depth, "bfs_order": bfs_order}
+
+
+def save_call_graph(graph: dict, path: str = GRAPH_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(graph, separators=(',', ':')))  # json.dumps compacto usa el codificador en C
+
+
+class CallGraph:
+    """API de consulta sobre el índice persistido: búsquedas O(1) u O(grado), sin recorridos repetidos."""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.entry_points = data.get("entry_points", [])
+        self._callees = data.get("callees", {})
+        self._callers = data.get("callers", {})
+        self._components = data.get("components", [])
+        self._component_of = {member: i for i, component in enumerate(self._components) for member in component}
+        self._reach = [set(r) for r in data.get("component_reach", [])]
+        self._depth = data.get("depth", {})
+
+    @classmethod
+    def load(cls, path: str = GRAPH_FILE):
+        """Devuelve None si la Fase 1 aún no generó el índice."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def __contains__(self, path):
+        return path in self._callees
+
+    def callees(self, path):
+        return self._callees.get(path, [])
+
+    def callers(self, path):
+        return self._callers.get(path, [])
+
+    def component(self, path):
+        """Procesos mutuamente recursivos con `path` (incluido él mismo)."""
+        i = self._component_of.get(path)
+        return self._components[i] if i is not None else []
+
+    def is_recursive(self, path) -> bool:
+        i = self._component_of.get(path)
+        return i is not None and i in self._reach[i]
+
+    def reaches(self, source, target) -> bool:
+        """¿`source` llama, directa o indirectamente, a `target`?"""
+        i, j = self._component_of.get(source), self._component_of.get(target)
+        if i is None or j is None: return False
+        return j in self._reach[i]
+
+    def transitive_callees(self, path):
+        i = self._component_of.get(path)
+        if i is None: return []
+        members = [m for j in self._reach[i] for m in self._components[j]]
+        return sorted(m for m in members if m != path or i in self._reach[i])
+
+    def depth(self, path):
+        """Profundidad mínima desde un punto de entrada (None si no es alcanzable)."""
+        return self._depth.get(path)
+
+    def topological_order(self, bottom_up: bool = True):
+        """Artefactos con los llamados antes que sus llamadores (o al revés si bottom_up=False)."""
+        order = self.data.get("topological_order", [])
+        return list(order) if bottom_up else list(reversed(order))
+
+    def process_levels(self):
+        """
+        Nivel de dependencia de cada proceso: 0 si no llama a otros procesos y, si no, uno más que
+        el mayor nivel de los procesos a los que llama. Los procesos recursivos comparten nivel.
+        """
+        levels, component_levels = {}, []
+        for i, component in enumerate(self._components):
+            level = 0
+            for member in component:
+                for callee in self._callees.get(member, []):
+                    j = self._component_of[callee]
+                    if j != i and callee.endswith(".process"):
+                        level = max(level, component_levels[j] + 1)
+            component_levels.append(level)
+            for member in component:
+                if member.endswith(".process"): levels[member] = level
+        return levels
+
+    def bfs_order(self):
+        """Procesos alcanzables desde los puntos de entrada, en orden de recorrido en anchura."""
+        return list(self.data.get("bfs_order", []))
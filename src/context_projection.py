@@ -0,0 +1,183 @@
+# src/context_projection.py
+
+import json, re
+from .rate_limiter import CHARS_PER_TOKEN, estimate_tokens
+
+DEFAULT_BUDGET_TOKENS = 3000
+TRUNCATION_MARK = "…[truncado]"
+SCHEMA_KEYS = ("activity_input_schema_xml", "input_schema_xml", "output_schema_xml")
+OMITTED_SCHEMA = "[esquema omitido por el presupuesto de contexto]"
+XPATH_VARIABLE_PATTERN = re.compile(r'\$([\w.-]+)')
+
+
+def to_compact_json(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def xpath_variable(activity_name: str) -> str:
+    """Nombre con el que TIBCO expone la salida de una actividad en XPath ($Nombre-Con-Guiones)."""
+    return "$" + activity_name.replace(' ', '-')
+
+
+def project_subprocess(subprocess_data: dict, budget_tokens: int = None) -> str:
+    """
+    Contrato del subproceso: lo único que necesita el prompt de interacción. Si el subproceso ya
+    está documentado, su resumen generado sustituye a los metadatos.
+    """
+    description_key = "summary" if subprocess_data.get("summary") else "metadata"
+    contract = {key: subprocess_data.get(key) for key in ("name", description_key, "input_schema_xml", "output_schema_xml")}
+    return to_compact_json(contract) if budget_tokens is None else fit_json_to_budget(contract, budget_tokens)
+
+
+class ProcessContextProjector:
+    """
+    Serializa una sola vez un proceso llamador y genera, para cada interacción, una proyección
+    con la actividad que llama, sus vecinas en el grafo de transiciones, las actividades que
+    consumen su salida y los esquemas relevantes, respetando un presupuesto de tokens.
+    """
+
+    def __init__(self, process_data: dict, budget_tokens: int = DEFAULT_BUDGET_TOKENS, resolve_schema=None):
+        """`resolve_schema` expande las referencias "schema:<hash>" para buscar las variables XPath de los mapeos."""
+        self.budget_tokens = budget_tokens
+        self.activities = {a.get("name"): a for a in process_data.get("activities", [])}
+        self.header = to_compact_json({key: process_data.get(key) for key in ("name", "metadata", "starter")})
+        self.variables = {v.get("name"): to_compact_json(v) for v in process_data.get("process_variables", [])}
+        self.input_schema = to_compact_json(process_data.get("input_schema_xml"))
+
+        # Serialización única de cada actividad: completa y resumida (sin el esquema XML).
+        self.full_json, self.brief_json, self.readers = {}, {}, {}
+        # Texto en el que se buscan las variables XPath: el JSON más el XML del mapeo si es una referencia.
+        self.search_text = {}
+        for name, activity in self.activities.items():
+            self.full_json[name] = to_compact_json(activity)
+            self.brief_json[name] = to_compact_json({"name": name, "type": activity.get("type")})
+            schema = activity.get("activity_input_schema_xml")
+            resolved = resolve_schema(schema) if resolve_schema is not None else schema
+            self.search_text[name] = self.full_json[name] + (resolved if resolved != schema else "")
+            # Índice inverso: variable XPath ($Actividad) -> actividades que la leen en sus mapeos
+            for variable in set(XPATH_VARIABLE_PATTERN.findall(self.search_text[name])):
+                self.readers.setdefault("$" + variable, []).append(name)
+
+        self.predecessors, self.successors = {}, {}
+        for t in process_data.get("transitions", []):
+            self.successors.setdefault(t.get("from"), []).append(t.get("to"))
+            self.predecessors.setdefault(t.get("to"), []).append(t.get("from"))
+
+    def activity_json(self, activity_name: str) -> str:
+        return self.full_json.get(activity_name, "null")
+
+    def _consumers(self, activity_name: str):
+        """Actividades cuyos mapeos leen la salida de `activity_name`."""
+        return [name for name in self.readers.get(xpath_variable(activity_name), []) if name != activity_name]
+
+    def build_interaction_context(self, activity_name: str, subprocess_data: dict):
+        """
+        Devuelve (proceso principal, subproceso, actividad que llama) en JSON compacto dentro del
+        presupuesto: primero la actividad, después el contrato del subproceso y con el resto la proyección.
+        """
+        calling_json = self.activity_json(activity_name)
+        if estimate_tokens(calling_json) > self.budget_tokens // 2:
+            calling_json = fit_json_to_budget(self.activities[activity_name], self.budget_tokens // 2)
+        remaining = self.budget_tokens - estimate_tokens(calling_json)
+        subprocess_json = project_subprocess(subprocess_data, remaining // 2)
+        remaining -= estimate_tokens(subprocess_json)
+        return self.project(activity_name, remaining), subprocess_json, calling_json
+
+    def project(self, activity_name: str, budget_tokens: int = None) -> str:
+        """Proyección compacta del proceso llamador para la interacción de `activity_name`."""
+        return self._project([activity_name], "calling_activity", to_compact_json(activity_name),
+                             self.budget_tokens if budget_tokens is None else budget_tokens)
+
+    def project_many(self, activity_names, budget_tokens: int = None) -> str:
+        """Proyección común para varias interacciones documentadas en un mismo prompt."""
+        return self._project(list(activity_names), "calling_activities", to_compact_json(list(activity_names)),
+                             self.budget_tokens if budget_tokens is None else budget_tokens)
+
+    def _project(self, activity_names, calling_key: str, calling_value: str, budget_tokens: int) -> str:
+        neighbours, consumers, calling_text = [], [], ""
+        for activity_name in activity_names:
+            for n in self.predecessors.get(activity_name, []) + self.successors.get(activity_name, []):
+                if n in self.activities and n not in activity_names and n not in neighbours:
+                    neighbours.append(n)
+            calling_text += self.search_text.get(activity_name, "")
+        for activity_name in activity_names:
+            for n in self._consumers(activity_name):
+                if n not in neighbours and n not in activity_names and n not in consumers:
+                    consumers.append(n)
+        variables = [v for name, v in self.variables.items() if xpath_variable(name) in calling_text]
+
+        # Secciones en orden de prioridad: (clave, valor completo, entradas reducidas o None para omitir)
+        sections = [("process", self.header, None),
+                    (calling_key, calling_value, None),
+                    ("output_consumers", self._join(self.full_json, consumers), [self.brief_json[n] for n in consumers]),
+                    ("neighbours", self._join(self.full_json, neighbours), [self.brief_json[n] for n in neighbours]),
+                    ("process_variables", "[" + ",".join(variables) + "]", variables),
+                    ("process_input_schema", self.input_schema, None)]
+
+        parts, used = [], 0
+        for key, full_value, entries in sections:
+            part = f'"{key}":{full_value}'
+            if used + estimate_tokens(part) > budget_tokens:
+                if not entries: continue
+                # Se conservan las primeras entradas que caben, completas: el JSON nunca se corta.
+                kept = take_entries(entries, (budget_tokens - used) * CHARS_PER_TOKEN - len(key) - 5)
+                if not kept: continue
+                part = f'"{key}":[' + ",".join(kept) + "]"
+            cost = estimate_tokens(part)
+            if used + cost <= budget_tokens:
+                parts.append(part)
+                used += cost
+        return "{" + ",".join(parts) + "}"
+
+    @staticmethod
+    def _join(serialized: dict, names) -> str:
+        return "[" + ",".join(serialized[name] for name in names) + "]"
+
+
+def take_entries(entries, max_chars: int):
+    """Prefijo de `entries` (JSON ya serializados) que cabe en `max_chars` al unirlos con comas."""
+    kept, used = [], 0
+    for entry in entries:
+        used += len(entry) + 1
+        if used > max_chars: break
+        kept.append(entry)
+    return kept
+
+
+def fit_json_to_budget(data: dict, budget_tokens: int) -> str:
+    """
+    Serializa `data` (una actividad o el contrato de un subproceso) dentro del presupuesto sin romper
+    el JSON. Por orden: se omiten los esquemas XML en línea (las referencias "schema:<hash>" se
+    conservan, su texto se añade aparte), se recorta el resumen (texto libre) y se descartan las
+    últimas entradas de las listas (mapeos), indicando cuántas se omitieron.
+    """
+    text = to_compact_json(data)
+    max_chars = max(0, budget_tokens) * CHARS_PER_TOKEN
+    if len(text) <= max_chars: return text
+    data = dict(data)
+    for key in SCHEMA_KEYS:
+        if isinstance(data.get(key), str) and "<" in data[key]:
+            data[key] = OMITTED_SCHEMA
+    text = to_compact_json(data)
+
+    summary = data.get("summary")
+    if len(text) > max_chars and isinstance(summary, str):
+        keep_chars = max(0, len(summary) - (len(text) - max_chars) - len(TRUNCATION_MARK))
+        data["summary"] = fit_to_budget(summary, keep_chars // CHARS_PER_TOKEN)
+        text = to_compact_json(data)
+
+    for key, value in list(data.items()):
+        if len(text) <= max_chars: break
+        if not isinstance(value, list) or not value: continue
+        entries = [to_compact_json(entry) for entry in value]
+        kept = take_entries(entries, len(",".join(entries)) - (len(text) - max_chars) - len(f',"{key}_omitted":{len(value)}'))
+        data[key] = value[:len(kept)]
+        data[f"{key}_omitted"] = len(value) - len(kept)
+        text = to_compact_json(data)
+    return text
+
+
+def fit_to_budget(text: str, budget_tokens: int) -> str:
+    """Recorta un bloque de texto que por sí solo excede el presupuesto."""
+    max_chars = max(0, budget_tokens) * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else text[:max_chars] + TRUNCATION_MARK
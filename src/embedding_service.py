@@ -0,0 +1,155 @@
+# src/embedding_service.py
+
+import os, threading, time
+import numpy as np
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Ruta local del modelo. Si no existe se usa el nombre y sentence-transformers lo descarga la primera vez.
+EMBEDDING_MODEL_PATH = os.path.abspath(os.getenv("EMBEDDING_MODEL_PATH", os.path.join("models", EMBEDDING_MODEL_NAME)))
+EMBEDDING_DEVICE = "cpu"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Backend de inferencia en CPU: "torch" (float32), "int8" (cuantización dinámica de las capas lineales)
+# u "onnx" (ONNX Runtime; EMBEDDING_ONNX_FILE permite elegir un modelo cuantizado, ej. onnx/model_qint8_avx2.onnx).
+# Los backends cuantizados producen vectores ligeramente distintos: una colección debe indexarse y
+# consultarse con el mismo backend.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE")
+
+_model = None
+_model_lock = threading.Lock()
+_embedding_function = None
+_engine = None
+_instances_lock = threading.Lock()  # Función y motor compartidos; no espera a la carga del modelo
+
+
+def resolve_model_path() -> str:
+    if os.path.isdir(EMBEDDING_MODEL_PATH):
+        return EMBEDDING_MODEL_PATH
+    print(f"    [WARN] No se encontró el modelo local '{EMBEDDING_MODEL_PATH}'; se usará '{EMBEDDING_MODEL_NAME}'.")
+    return EMBEDDING_MODEL_NAME
+
+
+def get_embedding_model():
+    """Carga el modelo de embeddings la primera vez que se necesita y lo comparte en todo el proceso."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer  # Importación costosa: solo bajo demanda
+                start = time.monotonic()
+                model_path = resolve_model_path()
+                _model = _load_model(SentenceTransformer, model_path)
+                print(f"     - Modelo de embeddings '{model_path}' ({EMBEDDING_BACKEND}) cargado en "
+                      f"{time.monotonic() - start:.1f}s.")
+    return _model
+
+
+def _load_model(model_class, model_path: str):
+    if EMBEDDING_BACKEND == "onnx":
+        model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+        return model_class(model_path, device=EMBEDDING_DEVICE, backend="onnx", model_kwargs=model_kwargs)
+    model = model_class(model_path, device=EMBEDDING_DEVICE)
+    if EMBEDDING_BACKEND == "int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif EMBEDDING_BACKEND != "torch":
+        print(f"    [WARN] Backend de embeddings desconocido '{EMBEDDING_BACKEND}'; se usa 'torch'.")
+    return model
+
+
+def is_model_loaded() -> bool:
+    return _model is not None
+
+
+class SharedEmbeddingFunction(SentenceTransformerEmbeddingFunction):
+    """
+    Función de embeddings de ChromaDB compatible con 'sentence_transformer', pero sin cargar el
+    modelo al construirse: lo obtiene del servicio compartido en la primera llamada.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, device: str = EMBEDDING_DEVICE,
+                 normalize_embeddings: bool = False, **kwargs):
+        self.model_name = model_name
+        self.device = device
+        self.normalize_embeddings = normalize_embeddings
+        self.kwargs = kwargs
+
+    @property
+    def _model(self):
+        return get_embedding_model()
+
+    def __call__(self, input):
+        return get_embedding_engine().embed(list(input), normalize=self.normalize_embeddings)
+
+    @staticmethod
+    def build_from_config(config: dict) -> "SharedEmbeddingFunction":
+        return get_embedding_function()
+
+
+def get_embedding_function() -> SharedEmbeddingFunction:
+    global _embedding_function
+    if _embedding_function is None:
+        with _instances_lock:
+            if _embedding_function is None:
+                _embedding_function = SharedEmbeddingFunction()
+    return _embedding_function
+
+
+class EmbeddingEngine:
+    """
+    Calcula embeddings en lotes de tamaño fijo, ordenando antes los textos por longitud para que
+    cada lote tenga poco relleno (padding). Los vectores se devuelven en el orden original y se
+    pasan ya calculados a ChromaDB.
+    """
+
+    def __init__(self, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+        self.texts = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def embed(self, texts, normalize: bool = False):
+        if not texts: return []
+        model = get_embedding_model()
+        start = time.monotonic()
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = [None] * len(texts)
+        batches = 0
+        for offset in range(0, len(order), self.batch_size):
+            indices = order[offset:offset + self.batch_size]
+            vectors = model.encode([texts[i] for i in indices], batch_size=len(indices), convert_to_numpy=True,
+                                   normalize_embeddings=normalize, show_progress_bar=False)
+            for i, vector in zip(indices, vectors):
+                embeddings[i] = np.asarray(vector, dtype=np.float32)
+            batches += 1
+        with self._lock:
+            self.texts += len(texts)
+            self.batches += batches
+            self.seconds += time.monotonic() - start
+        return embeddings
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"texts": self.texts, "batches": self.batches, "seconds": round(self.seconds, 2),
+                    "chunks_per_second": round(self.texts / self.seconds, 1) if self.seconds else 0.0,
+                    "batch_size": self.batch_size, "backend": EMBEDDING_BACKEND}
+
+
+def get_embedding_engine() -> EmbeddingEngine:
+    global _engine
+    if _engine is None:
+        with _instances_lock:
+            if _engine is None:
+                _engine = EmbeddingEngine()
+    return _engine
+
+
+def embed_texts(texts):
+    return get_embedding_engine().embed(texts)
+
+
+def format_embedding_stats(stats: dict) -> str:
+    return (f"{stats['texts']} fragmentos embebidos en {stats['seconds']}s ({stats['chunks_per_second']} fragmentos/s, "
+            f"lotes de {stats['batch_size']}, backend {stats['backend']})")
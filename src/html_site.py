@@ -0,0 +1,172 @@
+# src/html_site.py
+
+import os, json
+from .lexical_index import tokenize
+
+SITE_DIRNAME = "site"
+SECTIONS_DIRNAME = "sections"
+SITE_MANIFEST_FILENAME = "manifest.json"
+SEARCH_INDEX_FILENAME = "search_index.js"
+MIN_TERM_LENGTH = 3
+
+# Contenido de la página índice: buscador, secciones vacías y el cargador bajo demanda.
+# Las secciones y el índice de búsqueda son scripts (no fetch), así el sitio funciona también desde file://.
+SITE_CONTENT_HEAD = """<div id="site-search">
+    <input type="search" id="site-search-input" placeholder="Buscar procesos, actividades, variables..." autocomplete="off">
+    <ul id="site-search-results"></ul>
+</div>"""
+
+SITE_LOADER_SCRIPT = """<script>
+window.tibcoSite = (function () {
+    const MERMAID_URL = 'https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.esm.min.mjs';
+    const requested = new Set();
+    let searchIndex = null;
+
+    function loadScript(src) {
+        const script = document.createElement('script');
+        script.src = src;
+        document.head.appendChild(script);
+    }
+
+    // Carga una sección la primera vez que se abre o entra en pantalla.
+    function load(id) {
+        if (!id || requested.has(id) || !document.getElementById(id)) return;
+        requested.add(id);
+        loadScript('sections/' + id + '.js');
+    }
+
+    async function receive(id, html) {
+        const placeholder = document.getElementById(id);
+        if (!placeholder) return;
+        placeholder.outerHTML = html;
+        const section = document.getElementById(id);
+        const nodes = section.querySelectorAll('.mermaid');
+        if (nodes.length) {
+            const { default: mermaid } = await import(MERMAID_URL);
+            mermaid.initialize({ startOnLoad: false });
+            await mermaid.run({ nodes: nodes });
+        }
+        if (decodeURIComponent(location.hash.slice(1)) === id) section.scrollIntoView();
+    }
+
+    function openHash() { load(decodeURIComponent(location.hash.slice(1))); }
+
+    const observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) { observer.unobserve(entry.target); load(entry.target.id); }
+        });
+    }, { rootMargin: '400px' });
+    document.querySelectorAll('section.document-part[data-lazy]').forEach(function (s) { observer.observe(s); });
+    window.addEventListener('hashchange', openHash);
+    openHash();
+
+    // Búsqueda: el índice precalculado solo se descarga al usar el buscador.
+    const input = document.getElementById('site-search-input');
+    const results = document.getElementById('site-search-results');
+    input.addEventListener('focus', function () { if (!searchIndex) loadScript('search_index.js'); }, { once: true });
+    input.addEventListener('input', search);
+
+    function receiveSearchIndex(index) { searchIndex = index; search(); }
+
+    function search() {
+        results.innerHTML = '';
+        const terms = input.value.toLowerCase().split(/\\s+/).filter(function (t) { return t.length > 0; });
+        if (!searchIndex || !terms.length) return;
+        let matches = null;
+        terms.forEach(function (term) {
+            const docs = new Set();
+            searchIndex.docs.forEach(function (doc, i) { if (doc[1].toLowerCase().includes(term)) docs.add(i); });
+            Object.keys(searchIndex.terms).forEach(function (t) {
+                if (t.startsWith(term)) searchIndex.terms[t].forEach(function (i) { docs.add(i); });
+            });
+            matches = matches === null ? docs : new Set([...matches].filter(function (i) { return docs.has(i); }));
+        });
+        [...matches].slice(0, 20).forEach(function (i) {
+            const item = document.createElement('li');
+            const link = document.createElement('a');
+            link.href = '#' + searchIndex.docs[i][0];
+            link.textContent = searchIndex.docs[i][1];
+            item.appendChild(link);
+            results.appendChild(item);
+        });
+    }
+
+    return { receive: receive, receiveSearchIndex: receiveSearchIndex };
+})();
+</script>"""
+
+
+def extract_search_terms(md_text: str):
+    """Términos de búsqueda de un documento: identificadores y palabras distintas, sin números sueltos."""
+    return sorted({term for term in tokenize(md_text) if len(term) >= MIN_TERM_LENGTH and not term.isdigit()})
+
+
+def to_script_json(data) -> str:
+    """JSON seguro para incrustar en un <script> (sin '</' que cierre la etiqueta)."""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).replace("</", "<\\/")
+
+
+def placeholder_section(anchor_id: str, title: str) -> str:
+    return f'<section id="{anchor_id}" class="document-part" data-lazy><h2>{title}</h2></section>'
+
+
+def build_search_index(entries, read_terms) -> dict:
+    """{"docs": [[ancla, título]], "terms": {término: [índices de documento]}}"""
+    index = {"docs": [], "terms": {}}
+    for i, (anchor_id, title, key) in enumerate(entries):
+        index["docs"].append([anchor_id, title])
+        for term in read_terms(key):
+            index["terms"].setdefault(term, []).append(i)
+    return index
+
+
+def write_text(path: str, text: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_site(output_dir: str, template: str, values: dict, entries, read_section, read_terms, write_page):
+    """
+    Genera el sitio paginado: index.html con el índice y secciones vacías, un script por documento
+    en sections/ (solo se reescriben los que cambiaron) y un índice de búsqueda precalculado.
+    `entries` = [(ancla, título, clave del fragmento)].
+    """
+    site_dir = os.path.join(output_dir, SITE_DIRNAME)
+    sections_dir = os.path.join(site_dir, SECTIONS_DIRNAME)
+    os.makedirs(sections_dir, exist_ok=True)
+    manifest_path = os.path.join(site_dir, SITE_MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        previous = {}
+
+    current, written = {}, 0
+    for anchor_id, _, key in entries:
+        current[anchor_id] = key
+        section_path = os.path.join(sections_dir, f"{anchor_id}.js")
+        if previous.get(anchor_id) == key and os.path.exists(section_path): continue
+        write_text(section_path, f"tibcoSite.receive({to_script_json(anchor_id)}, {to_script_json(read_section(key))});\n")
+        written += 1
+    for anchor_id in set(previous) - set(current):
+        section_path = os.path.join(sections_dir, f"{anchor_id}.js")
+        if os.path.exists(section_path): os.remove(section_path)
+
+    search_index = build_search_index(entries, read_terms)
+    write_text(os.path.join(site_dir, SEARCH_INDEX_FILENAME),
+               f"tibcoSite.receiveSearchIndex({to_script_json(search_index)});\n")
+
+    def content():
+        yield SITE_CONTENT_HEAD
+        for anchor_id, title, _ in entries:
+            yield placeholder_section(anchor_id, title)
+        yield SITE_LOADER_SCRIPT
+
+    index_path = os.path.join(site_dir, "index.html")
+    write_page(template, {**values, "CONTENT": content}, index_path)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(current, f, indent=1, sort_keys=True)
+    print(f"    -> Sitio paginado guardado en: {index_path} ({written} secciones actualizadas, "
+          f"{len(search_index['terms'])} términos en el índice de búsqueda)")
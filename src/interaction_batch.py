@@ -0,0 +1,106 @@
+# src/interaction_batch.py
+
+import json, re
+from concurrent.futures import Future
+from .context_projection import project_subprocess, to_compact_json
+from .rate_limiter import estimate_tokens
+
+DEFAULT_BATCH_BUDGET_TOKENS = 12000
+CODE_FENCE_PATTERN = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def build_batch_prompt(template: str, projector, targets) -> str:
+    """Prompt único para todas las interacciones de un proceso; el contexto del llamador va una sola vez."""
+    names = [activity.get("name") for activity, _, _ in targets]
+    interactions = ",".join(
+        '{"activity_name":%s,"calling_activity":%s,"subprocess":%s}' % (
+            to_compact_json(activity.get("name")), projector.activity_json(activity.get("name")),
+            project_subprocess(subprocess_data))
+        for activity, subprocess_data, _ in targets)
+    prompt = template.replace("{main_process_json}", projector.project_many(names))
+    return prompt.replace("{interactions_json}", "[" + interactions + "]")
+
+
+def parse_batch_response(text: str, activity_names) -> dict:
+    """
+    Separa la respuesta estructurada en fragmentos Markdown por actividad.
+    Las secciones ausentes o mal formadas simplemente no aparecen en el resultado.
+    """
+    try:
+        data = json.loads(CODE_FENCE_PATTERN.sub("", text.strip()))
+    except ValueError:
+        return {}
+    items = data.get("interactions", []) if isinstance(data, dict) else data
+    sections = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict): continue
+        name, markdown = item.get("activity_name"), item.get("markdown")
+        if name in activity_names and isinstance(markdown, str) and markdown.strip():
+            sections[name] = markdown.strip()
+    return sections
+
+
+def forward_result(source: Future, target: Future):
+    """Resuelve `target` con el resultado (o la excepción) de `source` cuando este termine."""
+    def _copy(done: Future):
+        if done.exception() is not None:
+            target.set_exception(done.exception())
+        else:
+            target.set_result(done.result())
+
+    source.add_done_callback(_copy)
+
+
+def submit_interaction_batch(targets, template: str, projector, submit_llm, submit_single,
+                             budget_tokens: int = DEFAULT_BATCH_BUDGET_TOKENS):
+    """
+    Documenta en una sola petición estructurada las interacciones `targets` = [(actividad, subproceso, Future)].
+    Si el prompt excede el presupuesto, la petición falla o falta alguna sección, esas interacciones
+    se resuelven con prompts individuales mediante `submit_single(actividad, subproceso)`.
+    No lanza excepciones: cada Future de `targets` queda resuelto o enlazado a una petición (si no,
+    quien lo espere, quizás otro proceso que comparte el análisis, se quedaría bloqueado).
+    Devuelve True si se usó la petición agrupada.
+    """
+    def fall_back(pending):
+        for activity, subprocess_data, target in pending:
+            try:
+                forward_result(submit_single(activity, subprocess_data), target)
+            except Exception as e:
+                target.set_exception(e)
+
+    if len(targets) < 2:
+        fall_back(targets)
+        return False
+    try:
+        prompt = build_batch_prompt(template, projector, targets)
+    except Exception as e:
+        print(f"    [WARN] No se pudo construir el lote de interacciones ({e}); se usan prompts individuales.")
+        fall_back(targets)
+        return False
+    if estimate_tokens(prompt) > budget_tokens:
+        print(f"    [INFO] El lote de {len(targets)} interacciones excede el presupuesto; se usan prompts individuales.")
+        fall_back(targets)
+        return False
+
+    def distribute(batch: Future):
+        sections = {} if batch.exception() is not None else \
+            parse_batch_response(batch.result(), {activity.get("name") for activity, _, _ in targets})
+        missing = []
+        for activity, subprocess_data, target in targets:
+            markdown = sections.get(activity.get("name"))
+            if markdown is None:
+                missing.append((activity, subprocess_data, target))
+            else:
+                target.set_result(markdown)
+        if missing:
+            print(f"    [WARN] {len(missing)} secciones del lote no se pudieron interpretar; se reintentan por separado.")
+            fall_back(missing)
+
+    try:
+        batch = submit_llm(prompt)
+    except Exception as e:
+        print(f"    [WARN] No se pudo enviar el lote de interacciones ({e}); se usan prompts individuales.")
+        fall_back(targets)
+        return False
+    batch.add_done_callback(distribute)
+    return True
@@ -0,0 +1,143 @@
+# src/interaction_store.py
+
+import os, json, re, hashlib, threading
+from concurrent.futures import Future
+from .interaction_batch import forward_result
+
+STORE_FILE = os.path.join("2_intermediate_data", "interaction_analyses.json")
+XMLNS_PATTERN = re.compile(r'\s+xmlns(:\w+)?="[^"]*"')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_bindings(activity: dict) -> str:
+    """Mapeo de entrada de la actividad sin espacios ni declaraciones de namespace, para comparar llamadas."""
+    schema_xml = activity.get("activity_input_schema_xml") or ""
+    schema_xml = WHITESPACE_PATTERN.sub(" ", XMLNS_PATTERN.sub("", schema_xml)).replace("> <", "><").strip()
+    fields = sorted(b.get("target_field") or "" for b in activity.get("input_bindings", []))
+    return json.dumps([fields, schema_xml], ensure_ascii=False)
+
+
+def make_interaction_key(subprocess_name: str, activity: dict, subprocess_contract: str, prompt_template: str) -> str:
+    """
+    Clave de una interacción: subproceso + mapeo normalizado de la actividad que llama.
+    Incluye el contrato del subproceso y la plantilla para invalidar análisis obsoletos.
+    """
+    payload = json.dumps([subprocess_name, normalize_bindings(activity), subprocess_contract, prompt_template],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def adapt_analysis(markdown: str, original_activity: str, activity_name: str) -> str:
+    """Adapta un análisis existente a otra actividad que llama al subproceso con el mismo mapeo."""
+    if original_activity == activity_name: return markdown
+    return markdown.replace(f"`{original_activity}`", f"`{activity_name}`")
+
+
+class InteractionAnalysisStore:
+    """
+    Almacén persistente de análisis de interacciones. Evita repetir la llamada al LLM cuando varios
+    procesos invocan el mismo subproceso con el mismo mapeo, incluidas las llamadas aún en curso.
+    """
+
+    def __init__(self, path: str = STORE_FILE):
+        self.path = path
+        self.entries = {}
+        self.reused = 0
+        self.generated = 0
+        self._pending = {}
+        self._owners = {}  # Clave planificada -> (proceso, actividad) que la analiza
+        self._owned = {}   # Proceso -> claves planificadas que aún no ha enviado
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            entries = dict(self.entries)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def plan(self, key: str, process_path: str, activity_name: str):
+        """
+        Asigna `key` a su primer punto de llamada en el orden de una ejecución en serie (se planifica
+        en ese orden). Los demás esperan y adaptan ese análisis aunque se documenten antes en paralelo.
+        """
+        with self._lock:
+            if key in self.entries or key in self._pending: return
+            self._owners[key] = (process_path, activity_name)
+            self._owned.setdefault(process_path, set()).add(key)
+            self._pending[key] = (activity_name, Future())
+
+    def abandon(self, process_path: str, error: Exception):
+        """Falla las claves planificadas que `process_path` no llegó a enviar, para no bloquear a quien las espera."""
+        with self._lock:
+            keys = self._owned.pop(process_path, set())
+            planned = [self._pending.pop(key)[1] for key in keys]
+            for key in keys:
+                del self._owners[key]
+        for future in planned:
+            future.set_exception(error)
+
+    def get_or_submit(self, key: str, activity_name: str, subprocess_name: str, submit,
+                      process_path: str = None) -> Future:
+        """
+        Devuelve un Future con el análisis para `activity_name`. Si ya existe (o está en curso, o está
+        planificado para otro punto de llamada) un análisis equivalente se adapta; si no, se llama a
+        `submit()`, que debe devolver un Future.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.reused += 1
+                future = Future()
+                future.set_result(adapt_analysis(entry["markdown"], entry["activity_name"], activity_name))
+                return future
+            owner = self._owners.get(key)
+            pending = self._pending.get(key)
+            if pending is not None and owner != (process_path, activity_name):
+                self.reused += 1
+                original_activity, original_future = pending
+                return self._chain(original_future, original_activity, activity_name)
+            self.generated += 1
+            future = submit()
+            if owner is not None:
+                # El propietario envía la llamada; quienes ya esperaban reciben su resultado.
+                del self._owners[key]
+                self._owned[process_path].discard(key)
+                forward_result(future, pending[1])
+            else:
+                self._pending[key] = (activity_name, future)
+        future.add_done_callback(lambda f: self._store(key, activity_name, subprocess_name, f))
+        return future
+
+    def _chain(self, original_future: Future, original_activity: str, activity_name: str) -> Future:
+        future = Future()
+
+        def _copy_result(done: Future):
+            if done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(adapt_analysis(done.result(), original_activity, activity_name))
+
+        original_future.add_done_callback(_copy_result)
+        return future
+
+    def _store(self, key: str, activity_name: str, subprocess_name: str, future: Future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.exception() is None and not future.result().startswith("Error:"):
+                self.entries[key] = {"subprocess": subprocess_name, "activity_name": activity_name,
+                                     "markdown": future.result()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"reused": self.reused, "generated": self.generated, "stored": len(self.entries)}
@@ -0,0 +1,318 @@
+# src/intermediate_store.py
+
+import os, json, sqlite3, threading, zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from . import schema_table
+
+INTERMEDIATE_DIR = "2_intermediate_data"
+JSON_TREE_DIR = os.path.join(INTERMEDIATE_DIR, "preprocessed")
+JSON_SCHEMAS_DIR = os.path.join(INTERMEDIATE_DIR, "schemas")  # Tabla de esquemas del formato "json"
+SQLITE_FILE = os.path.join(INTERMEDIATE_DIR, "preprocessed.sqlite3")
+# "sqlite": una fila comprimida por artefacto en un único archivo (por defecto).
+# "json": el árbol anterior, un JSON con sangría por artefacto en preprocessed/.
+STORE_FORMAT = os.getenv("INTERMEDIATE_STORE_FORMAT", "sqlite")
+DECODE_CACHE_SIZE = 512
+COMPRESSION_LEVEL = 1  # zlib rápido: el JSON de los artefactos (XML de esquemas) comprime mucho
+WRITE_BATCH_SIZE = 500
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ArtifactStore(ABC):
+    """
+    Almacén de los artefactos pre-procesados, indexado por su ruta en el proyecto (clave de project_map).
+    Las lecturas son perezosas, por artefacto, y los objetos decodificados se guardan en una caché LRU:
+    un subproceso llamado desde cien actividades se decodifica una sola vez. Los objetos devueltos
+    por load() son compartidos y no deben modificarse.
+    """
+
+    def __init__(self, cache_size: int = DECODE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._decoded = OrderedDict()
+        self._schemas = {}  # Los esquemas únicos son pocos frente a sus referencias: se cachean todos
+        self._cache_lock = threading.Lock()
+
+    def load(self, path: str):
+        """Artefacto decodificado, o None si no existe."""
+        with self._cache_lock:
+            if path in self._decoded:
+                self._decoded.move_to_end(path)
+                return self._decoded[path]
+        raw = self.load_bytes(path)
+        if raw is None: return None
+        data = json.loads(raw)
+        with self._cache_lock:
+            self._decoded[path] = data
+            while len(self._decoded) > self.cache_size:
+                self._decoded.popitem(last=False)
+        return data
+
+    def _invalidate(self, paths):
+        with self._cache_lock:
+            for path in paths:
+                self._decoded.pop(path, None)
+
+    def write_many(self, items):
+        """Escribe [(ruta, datos)] de una vez."""
+        items = list(items)
+        self._invalidate(path for path, _ in items)
+        self._write(items)
+
+    def delete(self, paths):
+        paths = list(paths)
+        self._invalidate(paths)
+        self._delete(paths)
+
+    def exists(self, path: str) -> bool:
+        return self.load_bytes(path) is not None
+
+    # --- Tabla de esquemas: cada XML de esquema se guarda una vez, direccionado por su hash ---
+
+    def load_schema(self, schema_hash: str):
+        """Texto del esquema, o None si no está en la tabla."""
+        with self._cache_lock:
+            if schema_hash in self._schemas:
+                return self._schemas[schema_hash]
+        text = self._load_schema(schema_hash)
+        if text is not None:
+            with self._cache_lock:
+                self._schemas[schema_hash] = text
+        return text
+
+    def resolve_schema(self, value):
+        """Si `value` es una referencia "schema:<hash>" devuelve el XML; cualquier otro valor se devuelve tal cual."""
+        schema_hash = schema_table.ref_hash(value)
+        if schema_hash is None: return value
+        text = self.load_schema(schema_hash)
+        return text if text is not None else value
+
+    def write_schemas(self, schemas: dict):
+        """Añade {hash: texto}; los hashes ya presentes no se reescriben."""
+        if schemas: self._write_schemas(schemas)
+
+    def delete_schemas(self, hashes):
+        hashes = list(hashes)
+        with self._cache_lock:
+            for schema_hash in hashes:
+                self._schemas.pop(schema_hash, None)
+        if hashes: self._delete_schemas(hashes)
+
+    # --- Operaciones que implementa cada formato ---
+
+    @abstractmethod
+    def available(self) -> bool:
+        """True si el almacén ya existe en disco."""
+
+    @abstractmethod
+    def paths(self):
+        """Rutas de todos los artefactos, ordenadas."""
+
+    @abstractmethod
+    def load_bytes(self, path: str):
+        """JSON del artefacto sin decodificar, o None si no existe."""
+
+    @abstractmethod
+    def _write(self, items):
+        """Persiste [(ruta, datos)]; la caché ya se invalidó."""
+
+    @abstractmethod
+    def _delete(self, paths):
+        """Elimina los artefactos; las rutas inexistentes se ignoran."""
+
+    @abstractmethod
+    def schema_sizes(self) -> dict:
+        """{hash: bytes} de cada esquema de la tabla."""
+
+    @abstractmethod
+    def _load_schema(self, schema_hash: str):
+        """Texto del esquema leído del disco, o None."""
+
+    @abstractmethod
+    def _write_schemas(self, schemas: dict):
+        """Persiste {hash: texto} sin reescribir los hashes existentes."""
+
+    @abstractmethod
+    def _delete_schemas(self, hashes):
+        """Elimina los esquemas; los hashes inexistentes se ignoran."""
+
+
+class JsonTreeStore(ArtifactStore):
+    """Formato anterior: preprocessed/<ruta>.json con sangría, legible directamente."""
+
+    def __init__(self, root: str = JSON_TREE_DIR, schemas_root: str = JSON_SCHEMAS_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.root = os.path.abspath(root)
+        self.schemas_root = os.path.abspath(schemas_root)
+
+    def file_path(self, path: str) -> str:
+        return os.path.join(self.root, path + ".json")
+
+    def schema_path(self, schema_hash: str) -> str:
+        return os.path.join(self.schemas_root, schema_hash + ".xml")
+
+    def available(self) -> bool:
+        return os.path.isdir(self.root)
+
+    def paths(self):
+        if not self.available(): return []
+        return sorted(os.path.relpath(os.path.join(root, file), self.root).replace('\\', '/')[:-len(".json")]
+                      for root, _, files in os.walk(self.root) for file in files if file.endswith(".json"))
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self.file_path(path))
+
+    def load_bytes(self, path: str):
+        try:
+            with open(self.file_path(path), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, items):
+        for path, data in items:
+            file_path = self.file_path(path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+
+    def _delete(self, paths):
+        for path in paths:
+            if os.path.exists(self.file_path(path)): os.remove(self.file_path(path))
+
+    def schema_sizes(self) -> dict:
+        if not os.path.isdir(self.schemas_root): return {}
+        return {file[:-len(".xml")]: os.path.getsize(os.path.join(self.schemas_root, file))
+                for file in os.listdir(self.schemas_root) if file.endswith(".xml")}
+
+    def _load_schema(self, schema_hash: str):
+        try:
+            with open(self.schema_path(schema_hash), 'r', encoding='utf-8', newline='') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_schemas(self, schemas: dict):
+        os.makedirs(self.schemas_root, exist_ok=True)
+        for schema_hash, text in schemas.items():
+            if os.path.exists(self.schema_path(schema_hash)): continue
+            with open(self.schema_path(schema_hash), 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+
+    def _delete_schemas(self, hashes):
+        for schema_hash in hashes:
+            if os.path.exists(self.schema_path(schema_hash)): os.remove(self.schema_path(schema_hash))
+
+
+class SQLiteStore(ArtifactStore):
+    """Un único archivo SQLite con una fila por artefacto: JSON compacto comprimido con zlib."""
+
+    def __init__(self, db_path: str = SQLITE_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = os.path.abspath(db_path)
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self, create: bool = False):
+        if self._connection is None:
+            if not create and not os.path.exists(self.db_path): return None
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS artifacts (path TEXT PRIMARY KEY, data BLOB NOT NULL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS schemas "
+                                     "(hash TEXT PRIMARY KEY, size INTEGER NOT NULL, data BLOB NOT NULL)")
+        return self._connection
+
+    def available(self) -> bool:
+        return os.path.exists(self.db_path)
+
+    def paths(self):
+        with self._lock:
+            connection = self._connect()
+            if connection is None: return []
+            return [row[0] for row in connection.execute("SELECT path FROM artifacts ORDER BY path")]
+
+    def exists(self, path: str) -> bool:
+        with self._lock:
+            connection = self._connect()
+            return connection is not None and \
+                connection.execute("SELECT 1 FROM artifacts WHERE path = ?", (path,)).fetchone() is not None
+
+    def load_bytes(self, path: str):
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT data FROM artifacts WHERE path = ?", (path,)).fetchone() \
+                if connection is not None else None
+        return zlib.decompress(row[0]) if row else None
+
+    def _write(self, items):
+        rows = [(path, zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL))
+                for path, data in items]
+        with self._lock:
+            connection = self._connect(create=True)
+            with connection:  # Una transacción por lote
+                connection.executemany("INSERT OR REPLACE INTO artifacts (path, data) VALUES (?, ?)", rows)
+
+    def _delete(self, paths):
+        with self._lock:
+            connection = self._connect()
+            if connection is None: return
+            with connection:
+                connection.executemany("DELETE FROM artifacts WHERE path = ?", [(path,) for path in paths])
+
+    def schema_sizes(self) -> dict:
+        with self._lock:
+            connection = self._connect()
+            if connection is None: return {}
+            return dict(connection.execute("SELECT hash, size FROM schemas"))
+
+    def _load_schema(self, schema_hash: str):
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT data FROM schemas WHERE hash = ?", (schema_hash,)).fetchone() \
+                if connection is not None else None
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def _write_schemas(self, schemas: dict):
+        rows = []
+        for schema_hash, text in schemas.items():
+            encoded = text.encode('utf-8')
+            rows.append((schema_hash, len(encoded), zlib.compress(encoded, COMPRESSION_LEVEL)))
+        with self._lock:
+            connection = self._connect(create=True)
+            with connection:
+                connection.executemany("INSERT OR IGNORE INTO schemas (hash, size, data) VALUES (?, ?, ?)", rows)
+
+    def _delete_schemas(self, hashes):
+        with self._lock:
+            connection = self._connect()
+            if connection is None: return
+            with connection:
+                connection.executemany("DELETE FROM schemas WHERE hash = ?", [(h,) for h in hashes])
+
+
+def open_store(store_format: str = None) -> ArtifactStore:
+    """Almacén del directorio de trabajo actual (uno por ruta absoluta, compartido entre fases)."""
+    store_format = store_format or STORE_FORMAT
+    if store_format not in ("sqlite", "json"):
+        print(f"    [WARN] Formato de almacén intermedio desconocido '{store_format}'; se usa 'sqlite'.")
+        store_format = "sqlite"
+    location = os.path.abspath(SQLITE_FILE if store_format == "sqlite" else JSON_TREE_DIR)
+    with _stores_lock:
+        if location not in _stores:
+            _stores[location] = SQLiteStore(location) if store_format == "sqlite" else JsonTreeStore(location)
+        return _stores[location]
+
+
+def export_json_tree(store: ArtifactStore, output_dir: str = JSON_TREE_DIR) -> int:
+    """
+    Vuelca el almacén al árbol de JSON con sangría (depuración); devuelve el número de artefactos.
+    Las referencias a la tabla de esquemas se expanden: cada JSON se lee sin consultar la tabla.
+    """
+    target = JsonTreeStore(output_dir)
+    paths = store.paths()
+    for i in range(0, len(paths), WRITE_BATCH_SIZE):
+        target.write_many((path, schema_table.expand_schemas(json.loads(store.load_bytes(path)), store.resolve_schema))
+                          for path in paths[i:i + WRITE_BATCH_SIZE])
+    return len(paths)
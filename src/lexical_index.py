@@ -0,0 +1,119 @@
+# src/lexical_index.py
+
+import os, json, math, re
+from collections import Counter
+
+# Identificadores TIBCO: clases (com.tibco.plugin...), rutas (/Processes/x.process), variables (%%Var%%, $Var)
+TOKEN_PATTERN = re.compile(r"[\w$%][\w.$%/:\-]*")
+PART_SEPARATORS = re.compile(r"[.$%/:\-_]+")
+TRAILING_PUNCTUATION = ".:-/"
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+
+def tokenize(text: str):
+    """Términos de un texto: cada identificador completo (en minúsculas) más sus partes."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        token = token.rstrip(TRAILING_PUNCTUATION)
+        if not token: continue
+        terms.append(token)
+        parts = [p for p in PART_SEPARATORS.split(token) if p]
+        if len(parts) > 1 or (parts and parts[0] != token):
+            terms.extend(parts)
+    return terms
+
+
+def is_identifier_query(query_text: str) -> bool:
+    """Una consulta de un solo token con separadores o mayúsculas internas se trata como identificador exacto."""
+    query_text = query_text.strip()
+    if not query_text or any(c.isspace() for c in query_text): return False
+    return bool(re.search(r"[.$%/:_]", query_text) or re.search(r"[a-z][A-Z]", query_text))
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """Combina varias listas de IDs ordenadas por relevancia (Reciprocal Rank Fusion)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 persistido en JSON junto a la colección de ChromaDB.
+    Permite responder consultas por identificador exacto sin calcular embeddings.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.documents = {}  # id -> [longitud, [términos distintos]]
+        self.postings = {}   # término -> {id: frecuencia}
+        self.total_length = 0
+        self.dirty = False
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        self.documents = data.get("documents", {})
+        self.postings = data.get("postings", {})
+        self.total_length = sum(length for length, _ in self.documents.values())
+        return True
+
+    def save(self):
+        if not self.dirty: return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"documents": self.documents, "postings": self.postings}, f, ensure_ascii=False,
+                      separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def add(self, doc_id: str, text: str):
+        if doc_id in self.documents: self.remove([doc_id])
+        frequencies = Counter(tokenize(text))
+        length = sum(frequencies.values())
+        self.documents[doc_id] = [length, list(frequencies)]
+        self.total_length += length
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        self.dirty = True
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            entry = self.documents.pop(doc_id, None)
+            if entry is None: continue
+            length, terms = entry
+            self.total_length -= length
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is None: continue
+                posting.pop(doc_id, None)
+                if not posting: del self.postings[term]
+            self.dirty = True
+
+    def search(self, query_text: str, n_results: int, exclude=None):
+        """Devuelve [(id, puntuación)] ordenados por BM25, sin los IDs de `exclude`."""
+        if not self.documents: return []
+        doc_count = len(self.documents)
+        average_length = self.total_length / doc_count or 1
+        scores = {}
+        for term in set(tokenize(query_text)):
+            posting = self.postings.get(term)
+            if not posting: continue
+            idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, frequency in posting.items():
+                if exclude and doc_id in exclude: continue
+                length = self.documents[doc_id][0]
+                norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:n_results]
+
+    def __len__(self):
+        return len(self.documents)
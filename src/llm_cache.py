@@ -0,0 +1,132 @@
+# src/llm_cache.py
+
+import os, json, hashlib, threading, time
+
+DEFAULT_CACHE_DIR = os.path.join("2_intermediate_data", "llm_cache")
+DEFAULT_MAX_SIZE_MB = 512
+DEFAULT_MAX_AGE_DAYS = 30
+# Al superar el límite se poda hasta este porcentaje para no podar en cada escritura.
+PRUNE_TARGET_RATIO = 0.9
+
+
+def make_cache_key(model_name: str, temperature: float, prompt: str) -> str:
+    """Hash de contenido de (modelo, temperatura, prompt renderizado)."""
+    payload = json.dumps([model_name, temperature, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Caché en disco de respuestas del LLM, direccionada por contenido.
+    Cada entrada es un archivo JSON; su mtime actúa como marca de último acceso (LRU).
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size_mb: float = DEFAULT_MAX_SIZE_MB,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.cache_dir = os.path.abspath(cache_dir)  # Ruta fija aunque luego cambie el directorio de trabajo
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._total_size = None  # Se calcula perezosamente en la primera escritura
+
+    @classmethod
+    def from_config(cls, config: dict):
+        cache_config = config.get("cache", {})
+        return cls(cache_dir=cache_config.get("directory", DEFAULT_CACHE_DIR),
+                   max_size_mb=cache_config.get("max_size_mb", DEFAULT_MAX_SIZE_MB),
+                   max_age_days=cache_config.get("max_age_days", DEFAULT_MAX_AGE_DAYS))
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _is_expired(self, mtime: float) -> bool:
+        return self.max_age_seconds is not None and time.time() - mtime > self.max_age_seconds
+
+    def get(self, key: str):
+        """Devuelve la respuesta cacheada o None. Un acierto renueva la marca LRU."""
+        path = self._entry_path(key)
+        try:
+            if self._is_expired(os.path.getmtime(path)):
+                self._remove(path)
+                raise FileNotFoundError(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                response = json.load(f)["response"]
+            os.utime(path, None)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return response
+
+    def put(self, key: str, response: str, model_name: str, temperature: float):
+        """Guarda una respuesta válida. Las respuestas de error nunca deben llegar aquí."""
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"model_name": model_name, "temperature": temperature,
+                 "created_at": time.time(), "response": response}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.writes += 1
+            if self._total_size is None:
+                self._total_size = self._scan_total_size()
+            else:
+                self._total_size += os.path.getsize(path) - old_size
+            if self._total_size > self.max_size_bytes:
+                self._prune_locked()
+
+    def _iter_entries(self):
+        if not os.path.isdir(self.cache_dir): return
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".json"):
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _scan_total_size(self) -> int:
+        return sum(size for _, size, _ in self._iter_entries())
+
+    def _remove(self, path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+    def _prune_locked(self):
+        """Elimina entradas caducadas y después las menos usadas hasta bajar del límite."""
+        entries = sorted(self._iter_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_size_bytes * PRUNE_TARGET_RATIO
+        for path, size, mtime in entries:
+            if total <= target and not self._is_expired(mtime):
+                continue
+            total -= self._remove(path)
+            self.evictions += 1
+        self._total_size = total
+
+    def prune(self):
+        with self._lock:
+            self._prune_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes,
+                    "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
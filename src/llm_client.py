@@ -2,10 +2,24 @@
 
 import os
 import json
+import random
+import threading
+import time
 import google.generativeai as genai
 from dotenv import load_dotenv
+from .llm_cache import LLMResponseCache, make_cache_key
+from .rate_limiter import AdaptiveConcurrencyLimiter, TokenBucketRateLimiter, estimate_tokens
 
 CONFIG_PATH = os.path.join("config", "llm_config.json")
+# Si se define (ej. LLM_CACHE_BYPASS=1) se ignoran las lecturas de la caché, pero se refrescan sus entradas.
+CACHE_BYPASS_ENV = "LLM_CACHE_BYPASS"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """La llamada al LLM falló definitivamente (tras agotar los reintentos o por un error no recuperable)."""
 
 
 def initialize_llm():
@@ -25,28 +39,172 @@ def initialize_llm():
         return False
 
 
-def generate_text(prompt: str) -> str:
+def _status_code(error: Exception):
+    """Código HTTP de una excepción de google.api_core (ResourceExhausted -> 429, etc.), si lo tiene."""
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def _is_network_error(error: Exception) -> bool:
+    """Conexión reiniciada, timeout, DNS...: errores transitorios sin código HTTP (OSError y subclases)."""
+    return isinstance(error, OSError) and _status_code(error) is None
+
+
+class LLMClient:
     """
-    Envía un prompt al LLM y devuelve la respuesta en texto.
+    Sesión reutilizable contra Gemini: carga la configuración una sola vez, reutiliza los modelos,
+    reintenta 429/5xx y errores de red con backoff exponencial con jitter y adapta la concurrencia (AIMD).
     """
-    try:
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-            config = json.load(f)
 
-        model = genai.GenerativeModel(config['model_name'])
+    def __init__(self, config_path: str = CONFIG_PATH):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.model_name = self.config['model_name']
+        self.temperature = self.config.get('temperature', 0.2)
+        retry_config = self.config.get("retry", {})
+        self.max_retries = retry_config.get("max_retries", 5)
+        self.base_delay = retry_config.get("base_delay_seconds", 1.0)
+        self.max_delay = retry_config.get("max_delay_seconds", 60.0)
+
+        self.cache = LLMResponseCache.from_config(self.config) \
+            if self.config.get("cache", {}).get("enabled", True) else None
+        self.rate_limiter = TokenBucketRateLimiter.from_config(self.config)
+        self.concurrency = AdaptiveConcurrencyLimiter.from_config(self.config)
+        self.generation_config = genai.types.GenerationConfig(temperature=self.temperature)
+        self.json_generation_config = genai.types.GenerationConfig(temperature=self.temperature,
+                                                                   response_mime_type="application/json")
+        self._models = {}
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "successes": 0, "failures": 0, "retries": 0,
+                         "throttles": 0, "server_errors": 0, "network_errors": 0, "latency_total": 0.0, "latency_max": 0.0}
+
+    def get_model(self, model_name: str = None):
+        model_name = model_name or self.model_name
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def _count(self, key: str, amount=1):
+        with self._lock:
+            self.counters[key] += amount
 
-        generation_config = genai.types.GenerationConfig(
-            temperature=config.get('temperature', 0.2)
-        )
+    def _backoff_delay(self, attempt: int) -> float:
+        # "Full jitter": espera aleatoria en [0, min(max, base * 2^intento)].
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
 
-        response = model.generate_content(prompt, generation_config=generation_config)
+    def _call_model(self, prompt: str, json_output: bool = False) -> str:
+        model = self.get_model()
+        generation_config = self.json_generation_config if json_output else self.generation_config
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(estimate_tokens(prompt))
+            self.concurrency.acquire()
+            start = time.monotonic()
+            try:
+                self._count("requests")
+                response = model.generate_content(prompt, generation_config=generation_config)
+            except Exception as e:
+                code = _status_code(e)
+                if code == 429:
+                    self._count("throttles")
+                    self.concurrency.on_throttle()
+                elif code is not None and code >= 500:
+                    self._count("server_errors")
+                elif _is_network_error(e):
+                    self._count("network_errors")
+                else:
+                    self._count("failures")
+                    raise LLMError(f"Falló la llamada a la API de Gemini: {e}") from e
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise LLMError(f"Falló la llamada a la API de Gemini tras {attempt + 1} intentos: {e}") from e
+                response = None
+                reason = f"respondió {code}" if code is not None else f"falló por un error de red ({type(e).__name__})"
+            finally:
+                latency = time.monotonic() - start
+                self.concurrency.release()
+                with self._lock:
+                    self.counters["latency_total"] += latency
+                    self.counters["latency_max"] = max(self.counters["latency_max"], latency)
 
-        if response.parts:
-            return response.text.strip()
-        else:
+            if response is None:
+                # La espera se hace fuera del cupo de concurrencia para no bloquear a otros hilos.
+                delay = self._backoff_delay(attempt)
+                print(f"    [WARN] Gemini {reason}; reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s.")
+                self._count("retries")
+                time.sleep(delay)
+                continue
+
+            self._count("successes")
+            self.concurrency.on_success()
+            if response.parts:
+                return response.text.strip()
             print("    [WARN] La respuesta del LLM estaba vacía. Puede que el contenido haya sido bloqueado.")
+            return None
+        # Solo se llega aquí si max_retries < 0
+        raise LLMError("No se realizó ninguna llamada al LLM.")
+
+    def generate(self, prompt: str, use_cache: bool = True, json_output: bool = False) -> str:
+        """
+        Devuelve la respuesta del LLM para el prompt, consultando antes la caché en disco.
+        Con `json_output` se pide salida estructurada (application/json).
+        Lanza LLMError si la API falla definitivamente; una respuesta vacía/bloqueada devuelve un aviso.
+        """
+        cache_prompt = "[json]" + prompt if json_output else prompt
+        cache_key = make_cache_key(self.model_name, self.temperature, cache_prompt) if self.cache else None
+        if self.cache and use_cache and not os.getenv(CACHE_BYPASS_ENV):
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        text = self._call_model(prompt, json_output)
+        if text is None:
             return "Error: La respuesta del modelo estaba vacía."
 
-    except Exception as e:
-        print(f"    [ERROR] Falló la llamada a la API de Gemini: {e}")
-        return f"Error al generar la documentación: {e}"
\ No newline at end of file
+        # Solo se cachean respuestas válidas; los mensajes de error nunca llegan a la caché.
+        if self.cache:
+            try:
+                self.cache.put(cache_key, text, self.model_name, self.temperature)
+            except OSError as e:
+                print(f"    [WARN] No se pudo escribir en la caché del LLM: {e}")
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        calls = stats["requests"]
+        stats["latency_avg"] = round(stats["latency_total"] / calls, 3) if calls else 0.0
+        stats["concurrency_limit"] = round(self.concurrency.limit, 2)
+        stats["rate_limit_wait_seconds"] = round(self.rate_limiter.total_wait_seconds, 2)
+        return stats
+
+
+def get_client() -> LLMClient:
+    """Sesión LLM compartida por todo el proceso (se crea en el primer uso)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = LLMClient()
+        return _session
+
+
+def get_cache_stats() -> dict:
+    """Contadores de aciertos/fallos de la caché de respuestas (vacío si no se ha usado)."""
+    return _session.cache.stats() if _session and _session.cache else {}
+
+
+def get_client_stats() -> dict:
+    """Latencias, reintentos y throttling de la sesión (vacío si no se ha usado)."""
+    return _session.stats() if _session else {}
+
+
+def generate_text(prompt: str, use_cache: bool = True, json_output: bool = False) -> str:
+    """
+    Envía un prompt al LLM y devuelve la respuesta en texto.
+    Las respuestas válidas se guardan en una caché en disco indexada por (modelo, temperatura, prompt).
+    """
+    try:
+        return get_client().generate(prompt, use_cache=use_cache, json_output=json_output)
+    except LLMError as e:
+        print(f"    [ERROR] {e}")
+        raise
@@ -0,0 +1,209 @@
+# src/pdf_ingestion.py
+
+import os, time, queue, threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource  # Solo disponible en sistemas Unix
+except ImportError:
+    resource = None
+
+PAGES_PER_TASK = 16
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_QUEUE_SIZE = 1024
+_END_OF_DOCUMENT = object()
+_END_OF_STREAM = object()
+
+
+def _extract_page_range(file_path: str, start: int, end: int):
+    """Trabajador: extrae el texto de las páginas [start, end) de un PDF."""
+    import fitz  # PyMuPDF; se importa en el trabajador para no depender del proceso padre
+    try:
+        with fitz.open(file_path) as doc:
+            return [doc[i].get_text() for i in range(start, min(end, doc.page_count))], None
+    except Exception as e:
+        return [], str(e)
+
+
+def count_pages(file_path: str) -> int:
+    import fitz
+    with fitz.open(file_path) as doc:
+        return doc.page_count
+
+
+def peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso y sus trabajadores (MB), si el sistema lo expone."""
+    if resource is None: return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)  # ru_maxrss está en KB en Linux
+
+
+def stream_pdf_pages(pdf_paths, executor, max_in_flight: int, pages_per_task: int = PAGES_PER_TASK):
+    """
+    Genera (ruta, nº de página, texto) en orden, extrayendo rangos de páginas en el pool de procesos.
+    Como mucho hay `max_in_flight` rangos pendientes, así que la memoria no crece con el corpus.
+    Al terminar cada documento genera (ruta, None, error o None).
+    """
+    def tasks():
+        for file_path in pdf_paths:
+            try:
+                page_count = count_pages(file_path)
+            except Exception as e:
+                yield file_path, None, str(e)
+                continue
+            for start in range(0, page_count, pages_per_task):
+                yield file_path, start, executor.submit(_extract_page_range, file_path, start, start + pages_per_task)
+            yield file_path, None, None
+
+    pending = deque()
+    in_flight = 0
+    failed = set()
+
+    def drain_one():
+        nonlocal in_flight
+        file_path, start, future = pending.popleft()
+        if start is None:
+            error = future or ("error de extracción" if file_path in failed else None)
+            yield file_path, None, error
+            return
+        in_flight -= 1
+        texts, error = future.result()
+        if file_path in failed: return
+        if error:
+            failed.add(file_path)
+            print(f"      [WARN] No se pudo extraer el PDF {os.path.basename(file_path)}: {error}")
+            return
+        for offset, text in enumerate(texts):
+            yield file_path, start + offset, text
+
+    for task in tasks():
+        pending.append(task)
+        if task[1] is not None:
+            in_flight += 1
+        while in_flight > max_in_flight:
+            yield from drain_one()
+    while pending:
+        yield from drain_one()
+
+
+class StreamingChunker:
+    """
+    Fragmentación de un documento completo equivalente a text[i:i + size] para i en
+    range(0, len, size - overlap), pero alimentada página a página sin acumular el texto entero.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, metadata: dict = None):
+        self.chunk_size = chunk_size
+        self.step = chunk_size - chunk_overlap
+        self.metadata = metadata or {}
+        self.buffer = ""
+
+    def feed(self, text: str, page: int = None):
+        self.buffer += text
+        while len(self.buffer) >= self.chunk_size:
+            yield self.buffer[:self.chunk_size], self.metadata
+            self.buffer = self.buffer[self.step:]
+
+    def finish(self):
+        tail, self.buffer = self.buffer, ""
+        for i in range(0, len(tail), self.step):
+            yield tail[i:i + self.chunk_size], self.metadata
+
+
+class PageChunker:
+    """Fragmenta cada página por separado con `split_text` y anota la página en los metadatos."""
+
+    def __init__(self, split_text, metadata: dict = None):
+        self.split_text = split_text
+        self.metadata = metadata or {}
+
+    def feed(self, text: str, page: int = None):
+        for chunk in self.split_text(text):
+            yield chunk, {**self.metadata, "page": page}
+
+    def finish(self):
+        return iter(())
+
+
+class PDFIngestionPipeline:
+    """
+    Extracción de PDFs en un pool de procesos -> fragmentación en streaming -> cola acotada ->
+    inserción por lotes de tamaño fijo. La memoria pico depende del tamaño de lote y de la cola,
+    no del número ni del tamaño de los documentos.
+
+    `make_chunker(ruta)` devuelve un objeto con feed(texto, página) y finish() que generan
+    (texto, metadatos); `sink(lote)` recibe listas de (ruta, texto, metadatos);
+    `on_document_end(ruta, error)` se llama al terminar cada documento, tras insertar sus lotes.
+    """
+
+    def __init__(self, workers: int = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, pages_per_task: int = PAGES_PER_TASK):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.pages_per_task = pages_per_task
+
+    def _produce(self, pdf_paths, make_chunker, out_queue, stats):
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                chunker, current = None, None
+                for file_path, page, payload in stream_pdf_pages(pdf_paths, executor, self.workers * 2,
+                                                                 self.pages_per_task):
+                    if page is None:
+                        if chunker is not None and payload is None:
+                            for text, metadata in chunker.finish():
+                                out_queue.put((file_path, text, metadata))
+                        out_queue.put((_END_OF_DOCUMENT, file_path, payload))
+                        chunker, current = None, None
+                        continue
+                    if current != file_path:
+                        chunker, current = make_chunker(file_path), file_path
+                    stats["pages"] += 1
+                    for text, metadata in chunker.feed(payload, page):
+                        out_queue.put((file_path, text, metadata))
+        except Exception as e:
+            out_queue.put((_END_OF_STREAM, None, str(e)))
+            return
+        out_queue.put((_END_OF_STREAM, None, None))
+
+    def run(self, pdf_paths, make_chunker, sink, on_document_end=None) -> dict:
+        stats = {"documents": len(pdf_paths), "pages": 0, "chunks": 0}
+        if not pdf_paths: return stats
+        start = time.monotonic()
+        out_queue = queue.Queue(maxsize=self.queue_size)
+        producer = threading.Thread(target=self._produce, args=(pdf_paths, make_chunker, out_queue, stats),
+                                    daemon=True)
+        producer.start()
+
+        batch = []
+        while True:
+            first, second, third = out_queue.get()
+            if first is _END_OF_STREAM:
+                if third: print(f"    [ERROR] Falló la extracción de PDFs: {third}")
+                break
+            if first is _END_OF_DOCUMENT:
+                # Los fragmentos del documento se insertan antes de notificar su fin.
+                if batch: sink(batch); batch = []
+                if on_document_end: on_document_end(second, third)
+                continue
+            batch.append((first, second, third))
+            stats["chunks"] += 1
+            if len(batch) >= self.batch_size:
+                sink(batch); batch = []
+        if batch: sink(batch)
+        producer.join()
+
+        elapsed = time.monotonic() - start
+        stats["seconds"] = round(elapsed, 2)
+        stats["pages_per_second_per_core"] = round(stats["pages"] / elapsed / self.workers, 2) if elapsed else 0.0
+        stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 2) if elapsed else 0.0
+        stats["peak_rss_mb"] = peak_rss_mb()
+        return stats
+
+
+def format_ingestion_stats(stats: dict) -> str:
+    return (f"{stats['documents']} PDFs, {stats['pages']} páginas, {stats['chunks']} fragmentos en "
+            f"{stats.get('seconds', 0)}s ({stats.get('pages_per_second_per_core', 0)} páginas/s por núcleo, "
+            f"{stats.get('chunks_per_second', 0)} fragmentos/s), pico de memoria: {stats.get('peak_rss_mb')} MB")
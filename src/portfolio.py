@@ -0,0 +1,172 @@
+# src/portfolio.py
+
+import os, json, time, shutil
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .step1_discover import SOURCE_ROOT, list_project_dirs, run_discovery_phase
+from .step2_preprocess import run_preprocessing_phase
+from .step5_build_html import run_html_build_phase
+
+PORTFOLIO_DIR = "portfolio"
+REPORT_FILE = os.path.join(PORTFOLIO_DIR, "portfolio_report.json")
+LOG_FILENAME = "pipeline.log"
+# Cada espacio de trabajo lleva su copia de la configuración y la plantilla: las fases las leen con rutas relativas.
+SHARED_CONFIG_DIR = "config"
+SHARED_TEMPLATE = "template.html"
+LOCAL_PHASES = {"1", "2", "5"}
+
+
+def prepare_workspace(project: str) -> str:
+    """Crea (o actualiza) portfolio/<proyecto>/ con la configuración compartida; devuelve su ruta absoluta."""
+    workspace = os.path.abspath(os.path.join(PORTFOLIO_DIR, project))
+    os.makedirs(workspace, exist_ok=True)
+    if os.path.isdir(SHARED_CONFIG_DIR):
+        shutil.copytree(SHARED_CONFIG_DIR, os.path.join(workspace, SHARED_CONFIG_DIR), dirs_exist_ok=True)
+    if os.path.exists(SHARED_TEMPLATE):
+        shutil.copy2(SHARED_TEMPLATE, os.path.join(workspace, SHARED_TEMPLATE))
+    return workspace
+
+
+def run_local_phases(task):
+    """
+    Trabajador del pool compartido: ejecuta las fases sin LLM (1-2 o 5) de un proyecto dentro de
+    su espacio de trabajo. La salida va al log del proyecto para no mezclarse con la de los demás.
+    """
+    _, workspace, project_root, phases, html_mode = task
+    os.chdir(workspace)
+    timings = {}
+    with open(LOG_FILENAME, 'a', encoding='utf-8') as log, redirect_stdout(log):
+        for phase in sorted(phases & LOCAL_PHASES):
+            start = time.monotonic()
+            if phase == "1":
+                run_discovery_phase(project_root)
+            elif phase == "2":
+                run_preprocessing_phase(workers=1, project_root=project_root)
+            else:
+                run_html_build_phase(workers=1, mode=html_mode)
+            timings[phase] = round(time.monotonic() - start, 2)
+    return timings
+
+
+def count_processes(workspace: str) -> int:
+    try:
+        with open(os.path.join(workspace, "2_intermediate_data", "project_map.json"), 'r', encoding='utf-8') as f:
+            artifacts = json.load(f).get("artifacts", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+    return sum(1 for data in artifacts.values() if data.get("type") == "process")
+
+
+def run_llm_phases(project: str, workspace: str, phases, rag_handler) -> dict:
+    """Fases 3 y 4 de un proyecto en el proceso principal: comparten el cliente LLM, su caché y la base RAG."""
+    from .step3_documenter import OUTPUT_DOCS_DIR, run_atomic_documentation_phase
+    from .step4_assembler import run_assembly_phase
+    timings = {}
+    base_dir = os.getcwd()
+    os.chdir(workspace)
+    try:
+        if "3" in phases:
+            start = time.monotonic()
+            run_atomic_documentation_phase()
+            rag_handler.update_from_generated_docs(os.path.join(workspace, OUTPUT_DOCS_DIR), project=project)
+            timings["3"] = round(time.monotonic() - start, 2)
+        if "4" in phases:
+            start = time.monotonic()
+            run_assembly_phase(rag_handler, project=project)
+            timings["4"] = round(time.monotonic() - start, 2)
+    finally:
+        os.chdir(base_dir)
+    return timings
+
+
+def run_portfolio(phases, workers: int = 1, html_mode: str = "single", rag_handler=None) -> dict:
+    """
+    Documenta todos los proyectos de SOURCE_ROOT en una sola ejecución, cada uno en portfolio/<proyecto>/.
+    Las fases 1, 2 y 5 de los proyectos se reparten en un pool de procesos compartido; las fases 3 y 4
+    se ejecutan en el proceso principal (un único cliente LLM con su limitador y caché, un único modelo
+    de embeddings y una única base RAG) en cuanto el proyecto termina su pre-procesamiento, así que
+    el trabajo de CPU de unos proyectos se solapa con las llamadas al LLM de otros.
+    """
+    print(f"\n--- Modo Portafolio: procesando todos los proyectos de '{SOURCE_ROOT}' ---")
+    if not os.path.isdir(SOURCE_ROOT):
+        print(f"[ERROR] Directorio fuente '{SOURCE_ROOT}' no encontrado."); return {}
+    projects = list_project_dirs()
+    if not projects:
+        print(f"[ERROR] No se encontró ninguna carpeta de proyecto TIBCO en '{SOURCE_ROOT}'."); return {}
+    phases = set(phases)
+    llm_phases = phases & {"3", "4"}
+    if llm_phases and rag_handler is None:
+        print("[ERROR] Las fases 3 y 4 del portafolio necesitan la base de conocimiento RAG."); return {}
+
+    if llm_phases:
+        from . import llm_client
+        llm_client.get_client()  # Sesión creada desde el directorio base: la caché de respuestas es común
+
+    workers = max(1, workers)
+    print(f"  -> {len(projects)} proyectos, pool compartido de {workers} procesos. Logs en '{PORTFOLIO_DIR}/<proyecto>/{LOG_FILENAME}'.")
+    start = time.monotonic()
+    report = {name: {"workspace": prepare_workspace(name), "timings": {}, "status": "ok"} for name in projects}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit(name, local_phases):
+            task = (name, report[name]["workspace"], os.path.abspath(os.path.join(SOURCE_ROOT, name)),
+                    local_phases, html_mode)
+            return executor.submit(run_local_phases, task)
+
+        preparing = {submit(name, phases & {"1", "2"}): name for name in projects}
+        building = {}
+        for future in as_completed(preparing):
+            name = preparing[future]
+            entry = report[name]
+            try:
+                entry["timings"].update(future.result())
+            except Exception as e:
+                print(f"  [ERROR] Falló el pre-procesamiento del proyecto '{name}': {e}")
+                entry["status"] = "error"
+                continue
+            entry["processes"] = count_processes(entry["workspace"])
+            print(f"  -> [{name}] Fases 1-2 completadas ({entry['processes']} procesos).")
+            if llm_phases:
+                print(f"\n===== Proyecto '{name}': fases con LLM =====")
+                try:
+                    entry["timings"].update(run_llm_phases(name, entry["workspace"], llm_phases, rag_handler))
+                except Exception as e:
+                    print(f"  [ERROR] Fallaron las fases con LLM del proyecto '{name}': {e}")
+                    entry["status"] = "error"
+                    continue
+            if "5" in phases:
+                building[submit(name, {"5"})] = name
+
+        for future in as_completed(building):
+            name = building[future]
+            try:
+                report[name]["timings"].update(future.result())
+                print(f"  -> [{name}] HTML generado.")
+            except Exception as e:
+                print(f"  [ERROR] Falló la Fase 5 del proyecto '{name}': {e}")
+                report[name]["status"] = "error"
+
+    elapsed = time.monotonic() - start
+    summary = summarize_portfolio(report, elapsed, workers)
+    os.makedirs(PORTFOLIO_DIR, exist_ok=True)
+    with open(REPORT_FILE, 'w', encoding='utf-8') as f:
+        json.dump({"summary": summary, "projects": report}, f, indent=2, ensure_ascii=False)
+    print(f"\n--- Portafolio completado: {summary['projects_ok']}/{summary['projects']} proyectos, "
+          f"{summary['processes']} procesos en {summary['seconds']}s ({summary['processes_per_minute']} procesos/min). "
+          f"Tiempo acumulado por fase: {summary['phase_seconds']} "
+          f"(solapamiento x{summary['overlap_factor']}). Informe: '{REPORT_FILE}' ---")
+    return summary
+
+
+def summarize_portfolio(report: dict, elapsed: float, workers: int) -> dict:
+    phase_seconds = {}
+    for entry in report.values():
+        for phase, seconds in entry["timings"].items():
+            phase_seconds[phase] = round(phase_seconds.get(phase, 0.0) + seconds, 2)
+    busy = sum(phase_seconds.values())
+    processes = sum(entry.get("processes", 0) for entry in report.values())
+    return {"projects": len(report), "projects_ok": sum(1 for e in report.values() if e["status"] == "ok"),
+            "processes": processes, "workers": workers, "seconds": round(elapsed, 2),
+            "processes_per_minute": round(processes / elapsed * 60, 1) if elapsed else 0.0,
+            "phase_seconds": dict(sorted(phase_seconds.items())),
+            "overlap_factor": round(busy / elapsed, 2) if elapsed else 0.0}
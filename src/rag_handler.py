@@ -1,130 +1,491 @@
 # src/rag_handler.py
 
-import os, json, fitz  # PyMuPDF
+import os, json, hashlib, threading
+from collections import OrderedDict
 import chromadb
-from chromadb.utils import embedding_functions
+from . import source_manifest
+from .lexical_index import BM25Index, is_identifier_query, reciprocal_rank_fusion
+from .embedding_service import embed_texts, format_embedding_stats, get_embedding_engine, get_embedding_function
+from .pdf_ingestion import PDFIngestionPipeline, StreamingChunker, format_ingestion_stats
 
 DB_PATH = "vector_db"
 COLLECTION_NAME = "tibco_knowledge_base"
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 CHUNK_SIZE = 1500
 CHUNK_OVERLAP = 150
+INGEST_MANIFEST_FILENAME = "ingest_manifest.json"
+DELETE_BATCH_SIZE = 5000
+INGEST_WORKERS = None  # None = todos los núcleos
+INGEST_BATCH_SIZE = 256
+QUERY_CACHE_SIZE = 1024
+LEXICAL_INDEX_FILENAME = "lexical_index.json"
+# "dense" (solo embeddings), "lexical" (solo BM25) o "hybrid": identificadores exactos por BM25 sin
+# embeddings y el resto fusionando ambos rankings.
+DEFAULT_QUERY_MODE = "hybrid"
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+# Sección del manifiesto con los documentos generados; en modo portafolio hay una por proyecto.
+GENERATED_DOCS_SECTION = "generated_docs"
+# Valor de 'project' de los fragmentos comunes a todos los proyectos (PDFs de referencia y documentos
+# generados fuera del modo portafolio): todo fragmento lleva la clave, así el filtro puede ser positivo.
+SHARED_PROJECT = "shared"
+# Marca del manifiesto: los fragmentos anteriores a la etiqueta 'project' ya se etiquetaron.
+PROJECT_TAGS_KEY = "project_tags"
+
+
+def generated_docs_section(project: str = None) -> str:
+    return f"{GENERATED_DOCS_SECTION}:{project}" if project else GENERATED_DOCS_SECTION
 
 
 class RAGHandler:
-    def __init__(self):
+    def __init__(self, db_path: str = DB_PATH):
+        # Ruta absoluta: el modo portafolio cambia de directorio de trabajo entre proyectos.
+        self.db_path = os.path.abspath(db_path)
+        self.manifest_path = os.path.join(self.db_path, INGEST_MANIFEST_FILENAME)
+        # Caché LRU de consultas: (consulta, n_results, versión de la colección) -> contexto
+        self.collection_version = 0
+        self.query_cache = OrderedDict()
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+        self._query_lock = threading.Lock()
+        self._lexical_index = None
         print("  -> Inicializando Cliente de Base de Datos Vectorial (ChromaDB)...")
         try:
-            self.client = chromadb.PersistentClient(path=DB_PATH)
-            self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name=EMBEDDING_MODEL)
+            self.client = chromadb.PersistentClient(path=self.db_path)
+            # El modelo de embeddings se carga en la primera ingesta o consulta, no aquí.
+            self.embedding_function = get_embedding_function()
             self.collection = self.client.get_or_create_collection(
                 name=COLLECTION_NAME,
                 embedding_function=self.embedding_function,
                 metadata={"hnsw:space": "cosine"}
             )
             print(f"     - Conectado a la colección '{COLLECTION_NAME}'.")
+            self._tag_untagged_chunks()
         except Exception as e:
             print(f"    [FATAL] No se pudo inicializar ChromaDB: {e}")
             self.client = None
 
+    def _tag_untagged_chunks(self):
+        """Migración única: los fragmentos sin clave 'project' (PDFs y documentos sin proyecto) pasan a SHARED_PROJECT."""
+        manifest = self._load_ingest_manifest()
+        if manifest.get(PROJECT_TAGS_KEY): return
+        tagged, offset = 0, 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=DELETE_BATCH_SIZE, offset=offset)
+            if not page["ids"]: break
+            offset += len(page["ids"])
+            untagged = [(doc_id, {**(metadata or {}), "project": SHARED_PROJECT})
+                        for doc_id, metadata in zip(page["ids"], page["metadatas"])
+                        if not metadata or "project" not in metadata]
+            if untagged:
+                ids, metadatas = (list(x) for x in zip(*untagged))
+                self.collection.update(ids=ids, metadatas=metadatas)
+                tagged += len(ids)
+        if tagged: print(f"     - {tagged} fragmentos sin proyecto etiquetados como '{SHARED_PROJECT}'.")
+        manifest[PROJECT_TAGS_KEY] = True
+        self._save_ingest_manifest(manifest)
+
     def _chunk_text(self, text: str):
         """Función auxiliar para dividir un texto largo en fragmentos."""
         return [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE - CHUNK_OVERLAP)]
 
+    def _load_ingest_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_ingest_manifest(self, manifest: dict):
+        os.makedirs(self.db_path, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def _chunk_id(prefix: str, source: str, chunk: str) -> str:
+        """ID direccionado por contenido: el mismo fragmento del mismo documento conserva su ID entre ejecuciones."""
+        digest = hashlib.sha256(f"{source}\0{chunk}".encode('utf-8')).hexdigest()[:32]
+        return f"{prefix}_{digest}"
+
+    def _mark_modified(self):
+        """Cualquier ingesta o borrado invalida las consultas cacheadas."""
+        with self._query_lock:
+            self.collection_version += 1
+            self.query_cache.clear()
+
+    @property
+    def lexical_index(self) -> BM25Index:
+        """Índice BM25 junto a la colección; si no existe se reconstruye una vez desde ChromaDB."""
+        if self._lexical_index is None:
+            index = BM25Index(os.path.join(self.db_path, LEXICAL_INDEX_FILENAME))
+            if not index.load() and self.client and self.collection.count():
+                print("  -> Construyendo el índice léxico (BM25) desde la colección existente...")
+                existing = self.collection.get(include=["documents"])
+                for doc_id, document in zip(existing["ids"], existing["documents"]):
+                    index.add(doc_id, document or "")
+                index.save()
+            self._lexical_index = index
+        return self._lexical_index
+
+    def _delete_ids(self, ids):
+        ids = list(ids)
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.collection.delete(ids=ids[i:i + DELETE_BATCH_SIZE])
+        if ids:
+            self.lexical_index.remove(ids)
+            self._mark_modified()
+
+    def _upsert(self, documents, metadatas, ids):
+        self.collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=embed_texts(documents))
+        for doc_id, document in zip(ids, documents):
+            self.lexical_index.add(doc_id, document)
+        self._mark_modified()
+
     def populate_from_external_docs(self, external_docs_dir: str):
-        """Puebla la base de conocimiento desde fuentes externas como PDFs."""
+        """
+        Puebla la base de conocimiento desde fuentes externas como PDFs de forma incremental:
+        los PDFs sin cambios solo cuestan una comprobación de stat/hash, los modificados se
+        re-fragmentan e insertan solo sus fragmentos nuevos, y los eliminados se purgan.
+        """
         if not self.client: return
         print(f"\n--- Poblando RAG desde Documentos Externos en '{external_docs_dir}' ---")
 
-        try:
-            self.client.delete_collection(name=COLLECTION_NAME)
-            self.collection = self.client.get_or_create_collection(name=COLLECTION_NAME,
-                                                                   embedding_function=self.embedding_function)
-            print("  -> Colección anterior limpiada y recreada.")
-        except Exception as e:
-            print(f"    [INFO] No se pudo eliminar la colección (puede que no existiera). Error: {e}")
-
-        all_chunks, all_metadatas, all_ids = [], [], []
-        chunk_id = 0
+        manifest = self._load_ingest_manifest()
+        if "external_docs" not in manifest:
+            # Primera ingesta incremental: se purgan los IDs secuenciales del esquema anterior.
+            legacy_ids = [i for i in self.collection.get(include=[])["ids"] if i.startswith("pdf_chunk_")]
+            if legacy_ids: self._delete_ids(legacy_ids)
+        previous_docs = manifest.get("external_docs", {})
+        current_docs, to_process = {}, {}
+        stale_ids, unchanged = set(), 0
 
         if os.path.isdir(external_docs_dir):
-            for filename in os.listdir(external_docs_dir):
+            for filename in sorted(os.listdir(external_docs_dir)):
                 if filename.lower().endswith(".pdf"):
                     file_path = os.path.join(external_docs_dir, filename)
-                    print(f"    - Procesando PDF: {filename}")
+                    previous = previous_docs.get(filename)
                     try:
-                        with fitz.open(file_path) as doc:
-                            full_text = "".join(page.get_text() for page in doc)
-
-                        chunks = self._chunk_text(full_text)
-                        for chunk in chunks:
-                            all_chunks.append(chunk)
-                            all_metadatas.append({"source": f"Documentation: {filename}"})
-                            all_ids.append(f"pdf_chunk_{chunk_id}")
-                            chunk_id += 1
-                    except Exception as e:
-                        print(f"      [WARN] No se pudo procesar el PDF {filename}: {e}")
+                        fingerprint = source_manifest.fingerprint_file(file_path, previous)
+                    except OSError as e:
+                        print(f"      [WARN] No se pudo leer el PDF {filename}: {e}")
+                        continue
+                    if previous and "chunk_ids" in previous and fingerprint["sha256"] == previous["sha256"]:
+                        current_docs[filename] = fingerprint
+                        unchanged += 1
+                        continue
+                    print(f"    - Procesando PDF: {filename}")
+                    to_process[file_path] = (filename, fingerprint)
         else:
             print(f"  [WARN] El directorio de conocimiento externo '{external_docs_dir}' no existe.")
 
-        if not all_chunks:
-            print("  [WARN] No se encontraron documentos externos para añadir a la base de conocimiento.")
-            return
+        # Extracción en paralelo y escritura por lotes: la memoria no depende del tamaño del corpus.
+        # Dict como conjunto ordenado: pertenencia O(1) y los IDs en el orden de los fragmentos.
+        doc_chunk_ids = {file_path: {} for file_path in to_process}
+        added = 0
 
-        print(f"  -> Añadiendo {len(all_chunks)} fragmentos de documentos externos...")
-        if all_chunks:
-            self.collection.add(documents=all_chunks, metadatas=all_metadatas, ids=all_ids)
-            print("  -> Base de conocimiento poblada con documentos externos.")
+        def make_chunker(file_path):
+            filename = to_process[file_path][0]
+            return StreamingChunker(CHUNK_SIZE, CHUNK_OVERLAP, {"source": f"Documentation: {filename}",
+                                                                    "project": SHARED_PROJECT})
+
+        def sink(batch):
+            nonlocal added
+            chunks, metadatas, ids = [], [], []
+            for file_path, chunk, metadata in batch:
+                chunk_id = self._chunk_id("pdf", to_process[file_path][0], chunk)
+                if chunk_id in doc_chunk_ids[file_path]: continue  # Fragmento repetido
+                doc_chunk_ids[file_path][chunk_id] = None
+                chunks.append(chunk); metadatas.append(metadata); ids.append(chunk_id)
+            # Solo se embeben los fragmentos que aún no están en la colección.
+            existing = set(self.collection.get(ids=ids, include=[])["ids"]) if ids else set()
+            new_items = [(c, m, i) for c, m, i in zip(chunks, metadatas, ids) if i not in existing]
+            if new_items:
+                chunks, metadatas, ids = (list(x) for x in zip(*new_items))
+                self._upsert(chunks, metadatas, ids)
+                added += len(ids)
+
+        def on_document_end(file_path, error):
+            filename, fingerprint = to_process[file_path]
+            previous = previous_docs.get(filename)
+            chunk_ids = list(doc_chunk_ids.pop(file_path))
+            if error:
+                print(f"      [WARN] No se pudo procesar el PDF {filename}: {error}")
+                if previous: current_docs[filename] = previous  # Se reintentará en la próxima ejecución
+                # Los fragmentos ya insertados de la extracción fallida no los registra ningún manifiesto.
+                stale_ids.update(set(chunk_ids) - set(previous.get("chunk_ids", []) if previous else []))
+                return
+            if previous: stale_ids.update(set(previous.get("chunk_ids", [])) - set(chunk_ids))
+            current_docs[filename] = {**fingerprint, "chunk_ids": chunk_ids}
+
+        if to_process:
+            pipeline = PDFIngestionPipeline(workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE)
+            stats = pipeline.run(list(to_process), make_chunker, sink, on_document_end)
+            print(f"  -> Ingesta: {format_ingestion_stats(stats)}. {added} fragmentos nuevos añadidos.")
+            if added:
+                print(f"  -> Embeddings: {format_embedding_stats(get_embedding_engine().stats())}.")
+
+        # PDFs eliminados: sus fragmentos se recolectan como basura.
+        for filename in set(previous_docs) - set(current_docs):
+            stale_ids.update(previous_docs[filename].get("chunk_ids", []))
+        if stale_ids:
+            print(f"  -> Eliminando {len(stale_ids)} fragmentos obsoletos de documentos modificados o borrados...")
+            self._delete_ids(stale_ids)
+
+        manifest["external_docs"] = current_docs
+        self._save_ingest_manifest(manifest)
+        self.lexical_index.save()
+        print(f"  -> Base de conocimiento externa sincronizada: {unchanged} PDFs sin cambios, "
+              f"{len(current_docs) - unchanged} procesados, {len(set(previous_docs) - set(current_docs))} eliminados.")
 
-    def update_from_generated_docs(self, generated_docs_dir: str):
-        """Añade los .md generados a la base de conocimiento existente."""
+    @staticmethod
+    def _generated_chunk_id(source_name: str, ordinal: int, chunk: str) -> str:
+        """ID de un fragmento generado: (ruta del documento, ordinal del fragmento, hash del contenido)."""
+        source_digest = hashlib.sha256(source_name.encode('utf-8')).hexdigest()[:16]
+        chunk_digest = hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:16]
+        return f"md_{source_digest}_{ordinal}_{chunk_digest}"
+
+    def update_from_generated_docs(self, generated_docs_dir: str, project: str = None):
+        """
+        Sincroniza los .md generados con la base de conocimiento: solo se embeben los fragmentos
+        nuevos o modificados de los documentos que cambiaron, y se eliminan los fragmentos de
+        documentos borrados o que se acortaron. Con `project` (modo portafolio) los documentos
+        se registran en su propia sección del manifiesto y sus fragmentos se etiquetan con el proyecto
+        (sin él, con SHARED_PROJECT).
+        """
         if not self.client: return
         print(f"\n--- Actualizando RAG con Documentos Generados en '{generated_docs_dir}' ---")
 
+        manifest = self._load_ingest_manifest()
+        section = generated_docs_section(project)
+        if GENERATED_DOCS_SECTION not in manifest and not project:
+            # Primera sincronización: se purgan los IDs secuenciales del esquema anterior.
+            legacy_ids = [i for i in self.collection.get(include=[])["ids"] if i.startswith("md_chunk_")]
+            if legacy_ids: self._delete_ids(legacy_ids)
+        previous_docs = manifest.get(section, {})
+        current_docs = {}
+        stale_ids, unchanged = set(), 0
         all_chunks, all_metadatas, all_ids = [], [], []
-        # Empezamos el ID donde lo dejó la ingesta de PDFs
-        chunk_id = self.collection.count()
 
         for root, _, files in os.walk(generated_docs_dir):
-            for file in files:
+            for file in sorted(files):
                 if file.endswith(".md"):
                     file_path = os.path.join(root, file)
+                    source_name = os.path.relpath(file_path, generated_docs_dir).replace('\\', '/')
+                    previous = previous_docs.get(source_name)
                     try:
+                        fingerprint = source_manifest.fingerprint_file(file_path, previous)
+                        if previous and "chunk_ids" in previous and fingerprint["sha256"] == previous["sha256"]:
+                            current_docs[source_name] = fingerprint
+                            unchanged += 1
+                            continue
                         with open(file_path, 'r', encoding='utf-8') as f:
                             content = f.read()
-                        source_name = os.path.relpath(file_path, generated_docs_dir).replace('\\', '/')
-
-                        chunks = self._chunk_text(content)
-                        for chunk in chunks:
-                            all_chunks.append(chunk)
-                            all_metadatas.append({"source": f"Generated Doc: {source_name}"})
-                            all_ids.append(f"md_chunk_{chunk_id}")
-                            chunk_id += 1
                     except Exception as e:
                         print(f"    [WARN] No se pudo procesar el MD {file}: {e}")
+                        if previous: current_docs[source_name] = previous
+                        continue
 
-        if not all_chunks:
-            print("  [WARN] No se encontraron documentos generados para añadir.")
-            return
+                    chunk_ids = []
+                    previous_ids = set(previous.get("chunk_ids", [])) if previous else set()
+                    chunk_source = f"{project}/{source_name}" if project else source_name
+                    for ordinal, chunk in enumerate(self._chunk_text(content)):
+                        chunk_id = self._generated_chunk_id(chunk_source, ordinal, chunk)
+                        chunk_ids.append(chunk_id)
+                        if chunk_id in previous_ids: continue  # Fragmento sin cambios: no se re-embebe
+                        all_chunks.append(chunk)
+                        all_metadatas.append({"source": f"Generated Doc: {chunk_source}",
+                                              "project": project or SHARED_PROJECT})
+                        all_ids.append(chunk_id)
+                    stale_ids.update(previous_ids - set(chunk_ids))
+                    current_docs[source_name] = {**fingerprint, "chunk_ids": chunk_ids}
+
+        removed = set(previous_docs) - set(current_docs)
+        for source_name in removed:
+            stale_ids.update(previous_docs[source_name].get("chunk_ids", []))
 
-        print(f"  -> Añadiendo {len(all_chunks)} fragmentos de documentos generados...")
+        if not current_docs:
+            print("  [WARN] No se encontraron documentos generados para añadir.")
+        if stale_ids:
+            print(f"  -> Eliminando {len(stale_ids)} fragmentos obsoletos de documentos modificados o borrados...")
+            self._delete_ids(stale_ids)
         if all_chunks:
-            self.collection.add(documents=all_chunks, metadatas=all_metadatas, ids=all_ids)
-            print("  -> Base de conocimiento actualizada con documentos generados.")
+            print(f"  -> Añadiendo {len(all_chunks)} fragmentos nuevos o modificados de documentos generados...")
+            for i in range(0, len(all_chunks), INGEST_BATCH_SIZE):
+                batch = slice(i, i + INGEST_BATCH_SIZE)
+                self._upsert(all_chunks[batch], all_metadatas[batch], all_ids[batch])
+
+        manifest[section] = current_docs
+        self._save_ingest_manifest(manifest)
+        self.lexical_index.save()
+        print(f"  -> Documentos generados sincronizados: {unchanged} sin cambios, "
+              f"{len(current_docs) - unchanged} actualizados, {len(removed)} eliminados.")
+
+    def close(self):
+        """Libera el cliente de ChromaDB (y sus conexiones a SQLite); el handler deja de poder usarse."""
+        if self.client is not None and hasattr(self.client, "close"):
+            self.client.close()
+        self.client = self.collection = None
 
-    def query_for_context(self, query_text: str, n_results: int = 5) -> str:
+    def compact(self) -> dict:
+        """
+        Elimina de la colección los fragmentos que ningún documento del manifiesto referencia
+        (restos de ejecuciones interrumpidas) y compacta la base de datos en disco.
+        Cierra el handler antes de compactar: 'chroma vacuum' no debe ejecutarse con un cliente abierto.
+        """
+        if not self.client: return {}
+        manifest = self._load_ingest_manifest()
+        referenced = set()
+        for section in [s for s in manifest if s == "external_docs" or s.startswith(GENERATED_DOCS_SECTION)]:
+            for entry in manifest[section].values():
+                referenced.update(entry.get("chunk_ids", []))
+        if not referenced:
+            # Sin manifiesto (o vacío) todos los fragmentos parecerían huérfanos: no se borra nada.
+            print(f"    [WARN] El manifiesto de ingesta '{self.manifest_path}' no existe o no referencia "
+                  f"ningún fragmento; se omite la compactación.")
+            return {"skipped": True}
+        orphan_ids = [i for i in self.collection.get(include=[])["ids"] if i not in referenced]
+        if orphan_ids:
+            print(f"  -> Eliminando {len(orphan_ids)} fragmentos huérfanos...")
+            self._delete_ids(orphan_ids)
+            self.lexical_index.save()
+        self.close()
+        stats = compact_vector_db(self.db_path)
+        stats["orphans_removed"] = len(orphan_ids)
+        return stats
+
+    def query_for_context(self, query_text: str, n_results: int = 5, mode: str = DEFAULT_QUERY_MODE,
+                          project: str = None) -> str:
         """Busca en la Vector DB y devuelve el contexto relevante."""
-        if not self.client or self.collection.count() == 0:
-            print("    [WARN] La base de conocimiento está vacía. No se puede recuperar contexto.")
-            return "Contexto no disponible."
+        return self.query_many([query_text], n_results, mode, project)[0]
+
+    def query_many(self, query_texts, n_results: int = 5, mode: str = DEFAULT_QUERY_MODE, project: str = None):
+        """
+        Devuelve el contexto de cada consulta de `query_texts`, en el mismo orden. Las consultas no
+        cacheadas que necesitan búsqueda densa se embeben y se buscan en una sola llamada a la Vector DB.
+        Con `project` se excluyen los documentos generados de los demás proyectos del portafolio.
+        """
+        query_texts = list(query_texts)
+        if not query_texts: return []
+        if not self.client:
+            return ["Contexto no disponible."] * len(query_texts)
+
+        with self._query_lock:
+            version = self.collection_version
+            contexts, misses = {}, []
+            for query_text in dict.fromkeys(query_texts):
+                key = (query_text, n_results, mode, project, version)
+                if key in self.query_cache:
+                    self.query_cache.move_to_end(key)
+                    contexts[query_text] = self.query_cache[key]
+                    self.query_cache_hits += 1
+                else:
+                    misses.append(query_text)
+                    self.query_cache_misses += 1
+
+        if misses:
+            count = self.collection.count()
+            if count == 0:
+                print("    [WARN] La base de conocimiento está vacía. No se puede recuperar contexto.")
+                return [contexts.get(q, "Contexto no disponible.") for q in query_texts]
+            try:
+                rankings = self._rank(misses, n_results, count, mode, project)
+            except Exception as e:
+                print(f"    [ERROR] Falló la consulta a la Vector DB: {e}")
+                return [contexts.get(q, "Error al consultar la base de conocimiento.") for q in query_texts]
+            with self._query_lock:
+                for query_text in misses:
+                    contexts[query_text] = CONTEXT_SEPARATOR.join(rankings[query_text])
+                    if version == self.collection_version:  # No se cachean resultados de una versión ya invalidada
+                        self.query_cache[(query_text, n_results, mode, project, version)] = contexts[query_text]
+                while len(self.query_cache) > QUERY_CACHE_SIZE:
+                    self.query_cache.popitem(last=False)
+        return [contexts[q] for q in query_texts]
+
+    def _other_project_chunk_ids(self, project: str) -> set:
+        """IDs de los fragmentos generados de los proyectos ajenos a `project`, según el manifiesto de ingesta."""
+        if not project: return set()
+        excluded = set()
+        for section, docs in self._load_ingest_manifest().items():
+            if section.startswith(GENERATED_DOCS_SECTION + ":") and section != generated_docs_section(project):
+                excluded.update(chunk_id for entry in docs.values() for chunk_id in entry.get("chunk_ids", []))
+        return excluded
+
+    def _rank(self, query_texts, n_results: int, count: int, mode: str, project: str = None) -> dict:
+        """Devuelve {consulta: [documentos]} según el modo de búsqueda."""
+        # Para fusionar rankings se piden más candidatos de cada fuente que los que se devuelven.
+        candidates = min(n_results if mode == "dense" else n_results * 2, count)
+        n_results = min(n_results, count)
+        excluded = self._other_project_chunk_ids(project)
+        lexical = {}
+        if mode != "dense":
+            lexical = {q: [doc_id for doc_id, _ in self.lexical_index.search(q, candidates, exclude=excluded)]
+                       for q in query_texts}
+        # Los identificadores exactos con coincidencias léxicas no necesitan embeddings.
+        dense_queries = [] if mode == "lexical" else \
+            [q for q in query_texts if mode == "dense" or not (is_identifier_query(q) and lexical[q])]
+
+        ranked_ids, documents = {}, {}
+        if dense_queries:
+            # Filtro positivo: un fragmento sin la clave 'project' quedaría fuera, no dentro.
+            where = {"project": {"$in": [project, SHARED_PROJECT]}} if project else None
+            results = self.collection.query(query_embeddings=embed_texts(dense_queries), n_results=candidates,
+                                            where=where, include=["documents"])
+            for query_text, ids, docs in zip(dense_queries, results["ids"], results["documents"]):
+                documents.update(zip(ids, docs))
+                ranked_ids[query_text] = ids if mode == "dense" else \
+                    reciprocal_rank_fusion([ids, lexical[query_text]])
+        for query_text in query_texts:
+            ranked_ids[query_text] = ranked_ids.get(query_text, lexical.get(query_text, []))[:n_results]
+
+        missing = list({doc_id for ids in ranked_ids.values() for doc_id in ids if doc_id not in documents})
+        if missing:
+            fetched = self.collection.get(ids=missing, include=["documents"])
+            documents.update(zip(fetched["ids"], fetched["documents"]))
+        return {q: [documents[doc_id] for doc_id in ids if doc_id in documents] for q, ids in ranked_ids.items()}
+
+    def query_cache_stats(self) -> dict:
+        with self._query_lock:
+            total = self.query_cache_hits + self.query_cache_misses
+            return {"hits": self.query_cache_hits, "misses": self.query_cache_misses,
+                    "hit_rate": self.query_cache_hits / total if total else 0.0, "entries": len(self.query_cache)}
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+def is_client_open(db_path: str) -> bool:
+    """True si algún cliente de ChromaDB de este proceso mantiene abierta la base de `db_path`."""
+    from chromadb.api.shared_system_client import SharedSystemClient
+    return os.path.abspath(db_path) in getattr(SharedSystemClient, "_identifier_to_system", {})
+
+
+def compact_vector_db(db_path: str = DB_PATH) -> dict:
+    """
+    Purga el log de escritura de ChromaDB y ejecuta VACUUM; devuelve el espacio recuperado.
+    Requiere que no haya clientes abiertos sobre la base (ver RAGHandler.close).
+    """
+    db_path = os.path.abspath(db_path)
+    if is_client_open(db_path):
+        print(f"    [WARN] Hay un cliente de ChromaDB abierto sobre '{db_path}'; se omite la compactación.")
+        return {"skipped": True}
+    before = directory_size(db_path)
+    try:
+        import chromadb_rust_bindings
+        chromadb_rust_bindings.cli(["chroma", "vacuum", "--path", db_path, "--force"])
+    except Exception as e:
+        # Sin la CLI de Chroma: VACUUM directo sobre el SQLite (no purga el log, pero libera páginas).
+        print(f"    [WARN] No se pudo usar 'chroma vacuum' ({e}); se ejecuta VACUUM sobre SQLite.")
+        import sqlite3
+        connection = sqlite3.connect(os.path.join(db_path, "chroma.sqlite3"))
         try:
-            results = self.collection.query(
-                query_texts=[query_text],
-                n_results=min(n_results, self.collection.count())
-            )
-            context = "\n\n---\n\n".join(results['documents'][0])
-            return context
-        except Exception as e:
-            print(f"    [ERROR] Falló la consulta a la Vector DB: {e}")
-            return "Error al consultar la base de conocimiento."
\ No newline at end of file
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+    after = directory_size(db_path)
+    return {"bytes_before": before, "bytes_after": after, "bytes_reclaimed": max(0, before - after)}
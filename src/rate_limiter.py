@@ -0,0 +1,113 @@
+# src/rate_limiter.py
+
+import threading, time
+
+# Aproximación habitual para texto en español/inglés: ~4 caracteres por token.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class TokenBucketRateLimiter:
+    """
+    Limitador compartido entre hilos con dos cubetas de tokens:
+    peticiones por minuto (RPM) y tokens por minuto (TPM).
+    Un límite a None o 0 deshabilita la cubeta correspondiente.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute or None
+        self.tokens_per_minute = tokens_per_minute or None
+        self._request_allowance = float(self.requests_per_minute or 0)
+        self._token_allowance = float(self.tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self.total_wait_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config: dict):
+        rate_config = config.get("rate_limit")
+        if rate_config is None:
+            # Compatibilidad con configuraciones antiguas basadas en una pausa fija.
+            delay = config.get("request_delay_seconds", 1)
+            return cls(requests_per_minute=60 / delay if delay else None)
+        return cls(requests_per_minute=rate_config.get("requests_per_minute"),
+                   tokens_per_minute=rate_config.get("tokens_per_minute"))
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_allowance = min(float(self.requests_per_minute),
+                                          self._request_allowance + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._token_allowance = min(float(self.tokens_per_minute),
+                                        self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def _seconds_until_available(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests_per_minute and self._request_allowance < 1:
+            wait = max(wait, (1 - self._request_allowance) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._token_allowance < tokens:
+            wait = max(wait, (tokens - self._token_allowance) * 60 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, tokens: int = 1):
+        """Bloquea hasta que haya cupo para una petición de `tokens` tokens estimados."""
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)  # Una petición enorme no debe bloquear para siempre
+        while True:
+            with self._lock:
+                self._refill()
+                wait = self._seconds_until_available(tokens)
+                if wait <= 0:
+                    if self.requests_per_minute: self._request_allowance -= 1
+                    if self.tokens_per_minute: self._token_allowance -= tokens
+                    return
+                self.total_wait_seconds += wait
+            time.sleep(wait)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Límite de llamadas simultáneas ajustado con AIMD: cada éxito suma 1/límite (≈ +1 por ventana)
+    y cada respuesta de throttling (429) divide el límite a la mitad.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config: dict):
+        max_workers = config.get("max_workers", 1)
+        concurrency = config.get("concurrency", {})
+        return cls(initial=concurrency.get("initial", max_workers),
+                   minimum=concurrency.get("min", 1),
+                   maximum=concurrency.get("max", max_workers))
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            self.limit = max(float(self.minimum), self.limit / 2)
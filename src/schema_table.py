@@ -0,0 +1,106 @@
+# src/schema_table.py
+
+import re, hashlib
+from collections import Counter
+from .context_projection import take_entries
+from .rate_limiter import CHARS_PER_TOKEN
+
+# Los esquemas XML de un proceso se guardan una sola vez en la tabla de esquemas del almacén
+# intermedio y los artefactos los referencian por el hash de su contenido ("schema:<hash>").
+SCHEMA_REF_PREFIX = "schema:"
+SCHEMA_REF_PATTERN = re.compile(r'schema:([0-9a-f]{16})')
+SCHEMA_MIN_LENGTH = 64  # Textos más cortos ("No definido", esquemas triviales) se dejan en línea
+REFERENCED_SCHEMAS_HEADER = ("\n\n**Esquemas XML referenciados** (cada `schema:<hash>` de los JSON anteriores "
+                             "es uno de estos esquemas):\n")
+
+
+def schema_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def ref_hash(value):
+    """Hash de una referencia "schema:<hash>", o None si el valor no es una referencia."""
+    if not isinstance(value, str): return None
+    match = SCHEMA_REF_PATTERN.fullmatch(value)
+    return match.group(1) if match else None
+
+
+def _schema_slots(data: dict):
+    """(contenedor, clave) de cada campo de esquema de un proceso pre-procesado."""
+    for key in ("input_schema_xml", "output_schema_xml"):
+        if key in data: yield data, key
+    for variable in data.get("process_variables") or []:
+        if "schema_xml" in variable: yield variable, "schema_xml"
+    for activity in data.get("activities") or []:
+        if "activity_input_schema_xml" in activity: yield activity, "activity_input_schema_xml"
+
+
+def intern_schemas(data: dict, schemas: dict) -> Counter:
+    """
+    Sustituye en `data` cada esquema XML por su referencia y añade los textos nuevos a `schemas`
+    (hash -> texto). Devuelve cuántas veces referencia el artefacto a cada esquema.
+    """
+    references = Counter()
+    for container, key in _schema_slots(data):
+        text = container[key]
+        if not isinstance(text, str) or len(text) < SCHEMA_MIN_LENGTH or ref_hash(text): continue
+        digest = schema_hash(text)
+        schemas.setdefault(digest, text)
+        container[key] = SCHEMA_REF_PREFIX + digest
+        references[digest] += 1
+    return references
+
+
+def expand_schemas(data: dict, resolve) -> dict:
+    """Copia de `data` con las referencias sustituidas por el texto de cada esquema (`resolve(valor)`)."""
+    expanded = {**data}
+    if "process_variables" in data:
+        expanded["process_variables"] = [{**v} for v in data["process_variables"] or []]
+    if "activities" in data:
+        expanded["activities"] = [{**a} for a in data["activities"] or []]
+    for container, key in _schema_slots(expanded):
+        container[key] = resolve(container[key])
+    return expanded
+
+
+def append_referenced_schemas(prompt: str, load_schema, budget_tokens: int = None) -> str:
+    """
+    Añade al final del prompt, una sola vez cada uno, los esquemas que referencia el texto.
+    Con `budget_tokens` solo se añaden los esquemas completos que caben, en orden de aparición.
+    """
+    blocks = []
+    for digest in dict.fromkeys(SCHEMA_REF_PATTERN.findall(prompt)):
+        text = load_schema(digest)
+        if text is not None:
+            blocks.append(f"{SCHEMA_REF_PREFIX}{digest}:\n```xml\n{text}\n```")
+    if not blocks: return prompt
+    if budget_tokens is not None:
+        kept = take_entries(blocks, max(0, budget_tokens) * CHARS_PER_TOKEN)
+        if len(kept) < len(blocks):
+            kept.append(f"({len(blocks) - len(kept)} esquemas omitidos por el presupuesto de contexto)")
+        blocks = kept
+    return prompt + REFERENCED_SCHEMAS_HEADER + "\n".join(blocks)
+
+
+def dedup_stats(references: dict, sizes: dict) -> dict:
+    """
+    `references`: artefacto -> {hash: nº de referencias}; `sizes`: hash -> bytes del esquema.
+    Compara lo que ocuparían los esquemas en línea con lo que ocupa la tabla.
+    """
+    totals = Counter()
+    for counts in references.values():
+        totals.update(counts)
+    inline_bytes = sum(count * sizes.get(digest, 0) for digest, count in totals.items())
+    stored_bytes = sum(sizes.get(digest, 0) for digest in totals)
+    occurrences = sum(totals.values())
+    return {"references": occurrences, "unique": len(totals),
+            "ratio": round(occurrences / len(totals), 2) if totals else 0.0,
+            "inline_bytes": inline_bytes, "stored_bytes": stored_bytes,
+            "byte_ratio": round(inline_bytes / stored_bytes, 2) if stored_bytes else 0.0}
+
+
+def format_dedup_stats(stats: dict) -> str:
+    mb = 1024 * 1024
+    return (f"{stats['references']} referencias a {stats['unique']} esquemas únicos (deduplicación x{stats['ratio']}; "
+            f"{stats['inline_bytes'] / mb:.1f} MB en línea -> {stats['stored_bytes'] / mb:.1f} MB en la tabla, "
+            f"x{stats['byte_ratio']})")
@@ -0,0 +1,70 @@
+# src/source_manifest.py
+
+import os, json, hashlib
+
+INTERMEDIATE_DIR = "2_intermediate_data"
+MANIFEST_FILE = os.path.join(INTERMEDIATE_DIR, "source_manifest.json")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Estructura del manifiesto:
+#   "files":            {ruta_relativa: {"size", "mtime_ns", "sha256", ["dependency_names"]}}  (Fase 1)
+#   "enriched":         {ruta_relativa: {"sha256", "data"}}  entradas con las que se generó cada JSON (Fase 2)
+#   "dirty_processes":  [ruta_relativa, ...]  procesos pendientes de documentar (Fase 2 -> Fase 3)
+
+
+def load_manifest(path: str = MANIFEST_FILE) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(manifest, sort_keys=True, separators=(',', ':')))  # Codificador en C; ver call_graph
+    os.replace(tmp_path, path)
+
+
+def hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_unchanged(file_path: str, previous_entry: dict = None) -> bool:
+    """True si tamaño y mtime coinciden con la entrada previa (el archivo no se vuelve a leer)."""
+    if not previous_entry: return False
+    stat = os.stat(file_path)
+    return previous_entry.get("size") == stat.st_size and previous_entry.get("mtime_ns") == stat.st_mtime_ns
+
+
+def fingerprint_file(file_path: str, previous_entry: dict = None, content: bytes = None) -> dict:
+    """
+    Devuelve la huella (tamaño, mtime, sha256) de un archivo.
+    Si tamaño y mtime coinciden con la entrada previa no se vuelve a leer el archivo, y si
+    el contenido no cambió se conservan los datos derivados (ej. 'dependency_names').
+    Con `content` (el archivo ya leído por el llamador) el hash se calcula sobre esos bytes.
+    """
+    stat = os.stat(file_path)
+    if previous_entry and previous_entry.get("size") == stat.st_size \
+            and previous_entry.get("mtime_ns") == stat.st_mtime_ns:
+        return dict(previous_entry)
+    sha256 = hashlib.sha256(content).hexdigest() if content is not None else hash_file(file_path)
+    if previous_entry and previous_entry.get("sha256") == sha256:
+        entry = dict(previous_entry)
+    else:
+        entry = {"sha256": sha256}
+    entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    return entry
+
+
+def find_callers(project_map: dict, changed_paths) -> set:
+    """Procesos que dependen directamente de alguno de los artefactos indicados."""
+    changed_paths = set(changed_paths)
+    return {path for path, data in project_map.get("artifacts", {}).items()
+            if data.get("type") == "process" and changed_paths.intersection(data.get("dependencies", []))}
@@ -1,6 +1,7 @@
 # src/step1_discover.py (Versión 6 - Exhaustiva)
 
-import os, json, re
+import os, json
+from . import artifact_model, call_graph, source_manifest
 
 SOURCE_ROOT = "1_tibco_project_source"
 OUTPUT_DIR = "2_intermediate_data"
@@ -11,24 +12,37 @@ def get_project_relative_path(full_path, root_dir):
     return os.path.relpath(full_path, root_dir).replace('\\', '/')
 
 
-def parse_process_file(file_path):
-    dependencies = set()
+def parse_process_file(file_path, content: bytes = None):
+    """Dependencias con un escaneo de los bytes, sin parsear el XML; el modelo (y su corrección) es de la Fase 2."""
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            xml_content = f.read()
-
-        repo_paths = re.findall(r'>/([\w/.-]+)</', xml_content)
-        for path in repo_paths:
-            dependencies.add(os.path.basename(path))
-
-        global_vars = re.findall(r'%%([\w/.-]+)%%', xml_content)
-        for var in global_vars:
-            dependencies.add(os.path.basename(var.split('/')[0]) + ".substvar")
-
+        if content is None:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+        dependencies = artifact_model.scan_dependency_names(content)
     except Exception as e:
         print(f"  [ERROR] Ocurrió un error procesando {file_path}. Error: {e}")
         return None
-    return {"dependencies": sorted(list(dependencies))}
+    return {"dependencies": dependencies}
+
+
+def build_search_index(project_root: str) -> dict:
+    """Nombre de archivo -> ruta relativa de cada archivo del proyecto (las dependencias se citan por nombre)."""
+    search_index = {}
+    for dirpath, _, filenames in os.walk(project_root):
+        for filename in filenames:
+            search_index[filename] = get_project_relative_path(os.path.join(dirpath, filename), project_root)
+    return search_index
+
+
+def resolve_dependencies(dependency_names, search_index: dict):
+    return sorted({search_index[name] for name in dependency_names if name in search_index})
+
+
+def find_entry_points(artifacts: dict):
+    """Procesos a los que no llama ningún otro proceso."""
+    called = {dependency for data in artifacts.values() for dependency in data.get("dependencies", [])
+              if dependency.endswith(".process")}
+    return sorted(path for path, data in artifacts.items() if data.get("type") == "process" and path not in called)
 
 
 def parse_generic_artifact(file_path):
@@ -42,53 +56,75 @@ def parse_generic_artifact(file_path):
     return {"type": artifact_type_map.get(extension, "unknown")}
 
 
-def run_discovery_phase():
+def list_project_dirs(source_root: str = SOURCE_ROOT):
+    """Carpetas de proyecto TIBCO bajo `source_root`, en orden alfabético."""
+    return sorted(d for d in os.listdir(source_root) if os.path.isdir(os.path.join(source_root, d)))
+
+
+def run_discovery_phase(project_root: str = None):
+    """Sin `project_root` se analiza la primera carpeta de proyecto de SOURCE_ROOT."""
     print("--- Iniciando Fase 1 (v6 - Exhaustiva): Descubrimiento y Mapeo ---")
-    if not os.path.isdir(SOURCE_ROOT):
+    if project_root is None and not os.path.isdir(SOURCE_ROOT):
         print(f"[ERROR] Directorio fuente '{SOURCE_ROOT}' no encontrado.");
         return
 
-    project_map = {"artifacts": {}, "search_index": {}}
-    all_called_processes = set()
-
-    project_dirs = [d for d in os.listdir(SOURCE_ROOT) if os.path.isdir(os.path.join(SOURCE_ROOT, d))]
-    if not project_dirs:
-        print(f"[ERROR] No se encontró ninguna carpeta de proyecto TIBCO en '{SOURCE_ROOT}'.");
-        return
-    tibco_project_root = os.path.join(SOURCE_ROOT, project_dirs[0])
+    project_map = {"artifacts": {}}
+    manifest = source_manifest.load_manifest()
+    previous_files = manifest.get("files", {})
+    current_files = {}
+
+    if project_root is None:
+        project_dirs = list_project_dirs()
+        if not project_dirs:
+            print(f"[ERROR] No se encontró ninguna carpeta de proyecto TIBCO en '{SOURCE_ROOT}'.");
+            return
+        project_root = os.path.join(SOURCE_ROOT, project_dirs[0])
+    tibco_project_root = project_root
     print(f"Analizando proyecto en: '{tibco_project_root}'")
 
-    for dirpath, _, filenames in os.walk(tibco_project_root):
-        for filename in filenames:
-            relative_path = get_project_relative_path(os.path.join(dirpath, filename), tibco_project_root)
-            project_map["search_index"][filename] = relative_path
+    search_index = build_search_index(tibco_project_root)
 
-    for filename, relative_path in list(project_map["search_index"].items()):
+    for filename, relative_path in list(search_index.items()):
         full_path = os.path.join(tibco_project_root, relative_path)
         artifact_data = parse_generic_artifact(full_path)
         if artifact_data:
+            previous_entry = previous_files.get(relative_path)
+            content = None
+            if artifact_data["type"] == "process" and not source_manifest.is_unchanged(full_path, previous_entry):
+                # Una sola lectura del proceso modificado: sirve para el hash y para el escaneo.
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+            file_entry = source_manifest.fingerprint_file(full_path, previous_entry, content)
+            current_files[relative_path] = file_entry
             if artifact_data["type"] == "process":
-                process_details = parse_process_file(full_path)
+                # Solo se vuelve a escanear si el contenido cambió desde la última ejecución.
+                if "dependency_names" in file_entry:
+                    process_details = {"dependencies": file_entry["dependency_names"]}
+                else:
+                    process_details = parse_process_file(full_path, content)
+                    if process_details:
+                        file_entry["dependency_names"] = process_details["dependencies"]
                 if process_details:
-                    resolved_deps = set()
-                    for dep_name in process_details.get("dependencies", []):
-                        if dep_name in project_map["search_index"]:
-                            resolved_path = project_map["search_index"][dep_name]
-                            resolved_deps.add(resolved_path)
-                            if resolved_path.endswith(".process"):
-                                all_called_processes.add(resolved_path)
-                    artifact_data["dependencies"] = sorted(list(resolved_deps))
+                    artifact_data["dependencies"] = resolve_dependencies(process_details["dependencies"], search_index)
             project_map["artifacts"][relative_path] = artifact_data
 
-    all_processes = {path for path, data in project_map["artifacts"].items() if data.get("type") == "process"}
-    entry_points = sorted(list(all_processes - all_called_processes))
+    entry_points = find_entry_points(project_map["artifacts"])
     project_map["entry_points"] = entry_points
-    del project_map["search_index"]
 
     print(f"\nAnálisis completado. Se encontraron {len(project_map['artifacts'])} artefactos relevantes.")
     print(f"Se identificaron {len(entry_points)} puntos de entrada.")
+    changed = [path for path, entry in current_files.items()
+               if previous_files.get(path, {}).get("sha256") != entry["sha256"]]
+    removed = set(previous_files) - set(current_files)
+    print(f"Cambios desde la última ejecución: {len(changed)} modificados/nuevos, {len(removed)} eliminados.")
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         json.dump(project_map, f, indent=2)
+    graph = call_graph.build_call_graph(project_map)
+    call_graph.save_call_graph(graph)
+    recursive = sum(1 for component in graph["components"] if len(component) > 1)
+    print(f"Grafo de llamadas guardado en '{call_graph.GRAPH_FILE}' ({recursive} ciclos de llamadas detectados).")
+    manifest["files"] = current_files
+    source_manifest.save_manifest(manifest)
     print(f"\n--- Fase 1 Completada. Mapa del proyecto guardado en: '{OUTPUT_FILE}' ---")
\ No newline at end of file
@@ -1,130 +1,29 @@
 # src/step2_preprocess.py (Versión 6.1 - Captura de Esquemas Internos)
 
 import os, json
+from concurrent.futures import ProcessPoolExecutor
 from lxml import etree as ET
+from . import artifact_model, call_graph, intermediate_store, schema_table, source_manifest
+from .artifact_model import NAMESPACES, get_text, element_to_string
+from .step1_discover import list_project_dirs, build_search_index, resolve_dependencies, find_entry_points
 
 # --- Configuración ---
 SOURCE_ROOT = "1_tibco_project_source"
 INTERMEDIATE_DIR = "2_intermediate_data"
 MAP_FILE = os.path.join(INTERMEDIATE_DIR, "project_map.json")
-OUTPUT_DIR = os.path.join(INTERMEDIATE_DIR, "preprocessed")
-
-
-# --- Funciones de Ayuda ---
-def get_text(element, query, namespaces, default=None):
-    if element is None: return default
-    node = element.find(query, namespaces)
-    return node.text if node is not None else default
-
-
-def element_to_string(element):
-    if element is None: return "No definido"
-    for elem in element.getiterator():
-        if '}' in elem.tag: elem.tag = elem.tag.split('}', 1)[1]
-    ET.indent(element, space="  ")
-    return ET.tostring(element, pretty_print=True, encoding='unicode')
-
-
-def parse_xslt_logic(element, namespaces):
-    if element is None: return None
-    choose_node = element.find('xsl:choose', namespaces)
-    if choose_node is not None:
-        logic = {"type": "conditional", "conditions": []}
-        for when_node in choose_node.findall('xsl:when', namespaces):
-            value_node = when_node.find('.//xsl:value-of', namespaces)
-            logic["conditions"].append({
-                "if": when_node.get("test"),
-                "then": value_node.get('select') if value_node is not None else "N/A"
-            })
-        otherwise_node = choose_node.find('xsl:otherwise', namespaces)
-        if otherwise_node is not None:
-            value_node = otherwise_node.find('.//xsl:value-of', namespaces)
-            logic["conditions"].append({
-                "if": "otherwise",
-                "then": value_node.get('select') if value_node is not None else "N/A"
-            })
-        return logic
-    value_of_node = element.find('.//xsl:value-of', namespaces)
-    if value_of_node is not None:
-        return {"type": "direct", "source": value_of_node.get('select')}
-    copy_of_node = element.find('.//xsl:copy-of', namespaces)
-    if copy_of_node is not None:
-        return {"type": "copy", "source": copy_of_node.get('select')}
-    return {"type": "unknown"}
-
-
-# --- Funciones de Análisis Semántico ---
-def analyze_process_metadata(root, namespaces):
-    metadata = {"paradigm": "Subproceso", "style": "N/A", "pattern": "N/A"}
-    starter = root.find('pd:starter', namespaces)
-    if starter is None: return metadata
-    starter_type = get_text(starter, 'pd:type', namespaces, "")
-    if "HTTPEventSource" in starter_type:
-        metadata["paradigm"] = "Servicio Web";
-        metadata["style"] = "REST"
-        response_activity = root.find('.//pd:activity[pd:type="com.tibco.plugin.http.HTTPResponseActivity"]',
-                                      namespaces)
-        metadata[
-            "pattern"] = "Síncrono (Request-Reply)" if response_activity is not None else "Asíncrono (Fire-and-Forget)"
-    elif "SOAPEventSource" in starter_type:
-        metadata["paradigm"] = "Servicio Web";
-        metadata["style"] = "SOAP";
-        metadata["pattern"] = "Síncrono (Request-Reply)"
-    elif "TimerEventSource" in starter_type:
-        metadata["paradigm"] = "Proceso Programado (Batch)";
-        metadata["pattern"] = "Asíncrono"
-    elif "JMSEventSource" in starter_type:
-        metadata["paradigm"] = "Consumidor de Mensajes";
-        metadata["pattern"] = "Asíncrono"
-    return metadata
+# Versión del formato de los artefactos guardados: al cambiarla se re-enriquecen todos una vez.
+# 2: los esquemas XML de los procesos se guardan en la tabla de esquemas y se referencian por hash.
+ARTIFACT_FORMAT = 2
 
 
 # --- Funciones de Enriquecimiento ---
 def enrich_process(file_path, data, namespaces):
-    parser = ET.XMLParser(recover=True)
-    tree = ET.parse(file_path, parser)
-    root = tree.getroot()
-
-    data['metadata'] = analyze_process_metadata(root, namespaces)
-    data['name'] = get_text(root, 'pd:name', namespaces)
-    data['input_schema_xml'] = element_to_string(root.find('pd:startType', namespaces))
-    data['output_schema_xml'] = element_to_string(root.find('pd:endType', namespaces))
-
-    data['process_variables'] = []
-    variables_element = root.find('pd:processVariables', namespaces)
-    if variables_element is not None:
-        for var_container in variables_element:
-            var_def = var_container.find('.//xsd:element', namespaces)
-            if var_def is not None:
-                data['process_variables'].append(
-                    {"name": var_def.get("name"), "schema_xml": element_to_string(var_def)})
-
-    data['activities'] = []
-    for act in root.findall('.//pd:activity', namespaces):
-        config_element = act.find('config')
-        config_data = {c.tag.split('}')[-1]: c.text for c in config_element} if config_element is not None else {}
-
-        input_bindings = act.find('pd:inputBindings', namespaces)
-        mappings = []
-        input_schema = None
-        if input_bindings is not None and len(list(input_bindings)) > 0:
-            payload_root = list(input_bindings)[0]
-            input_schema = element_to_string(payload_root)  # Captura el esquema de entrada de la actividad
-            for field in payload_root:
-                mappings.append({
-                    "target_field": field.tag.split('}')[-1],
-                    "mapping_logic": parse_xslt_logic(field, namespaces)
-                })
-
-        data['activities'].append({
-            "name": act.get('name'), "type": get_text(act, 'pd:type', namespaces),
-            "config": config_data, "input_bindings": mappings,
-            "activity_input_schema_xml": input_schema
-        })
-
-    data['transitions'] = [{"from": get_text(t, 'pd:from', namespaces), "to": get_text(t, 'pd:to', namespaces),
-                            "condition": get_text(t, 'pd:conditionType', namespaces)} for t in
-                           root.findall('pd:transition', namespaces)]
+    # Un único parseo del XML por proceso; ver artifact_model. 'dependency_names' lo consume
+    # run_preprocessing_phase para corregir el escaneo de la Fase 1 y no se guarda con el artefacto.
+    model = artifact_model.parse_process(file_path)
+    for key in ('metadata', 'name', 'starter', 'input_schema_xml', 'output_schema_xml',
+                'process_variables', 'activities', 'transitions', 'dependency_names'):
+        data[key] = model[key]
     return data
 
 
@@ -178,37 +77,143 @@ def enrich_shared_parse(file_path, data, namespaces):
     return data
 
 
-def run_preprocessing_phase():
+ENRICHER_MAP = {
+    "process": enrich_process, "schema-ae": enrich_schema_ae,
+    "global-variables": enrich_global_variables, "shared-http": enrich_shared_http,
+    "shared-parse": enrich_shared_parse
+}
+
+
+def enrich_artifact(task):
+    """
+    Enriquece un artefacto. Es una función de módulo para poder ejecutarse en un pool de procesos;
+    el resultado y los avisos se devuelven al proceso principal, que los escribe en el almacén por lotes.
+    """
+    relative_path, artifact_type, full_path, data = task
+    try:
+        # Copia propia: la tarea no retiene el resultado mientras la lista de tareas siga viva.
+        return relative_path, None, ENRICHER_MAP[artifact_type](full_path, data.copy(), NAMESPACES)
+    except Exception as e:
+        return relative_path, f"Falló el enriquecimiento para {relative_path}: {e}", None
+
+
+def run_enrichment_tasks(tasks, workers: int = 1):
+    """Ejecuta las tareas en serie o en un pool de procesos; genera los resultados en el orden de `tasks`."""
+    if workers <= 1 or len(tasks) <= 1:
+        yield from (enrich_artifact(task) for task in tasks)
+        return
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(enrich_artifact, tasks, chunksize=chunksize)
+
+
+def run_preprocessing_phase(workers: int = 1, project_root: str = None):
+    """Sin `project_root` se usa la primera carpeta de proyecto de SOURCE_ROOT, igual que en la Fase 1."""
     print("--- Iniciando Fase 2 (v6.1 - Captura de Esquemas Internos): Pre-procesamiento ---")
     if not os.path.exists(MAP_FILE): print(f"[ERROR] Mapa no encontrado."); return
     with open(MAP_FILE, 'r') as f:
         project_map = json.load(f)
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    project_dirs = [d for d in os.listdir(SOURCE_ROOT) if os.path.isdir(os.path.join(SOURCE_ROOT, d))]
-    if not project_dirs: print(f"[ERROR] No se encontró proyecto TIBCO."); return
-    tibco_project_root = os.path.join(SOURCE_ROOT, project_dirs[0])
-
-    enricher_map = {
-        "process": enrich_process, "schema-ae": enrich_schema_ae,
-        "global-variables": enrich_global_variables, "shared-http": enrich_shared_http,
-        "shared-parse": enrich_shared_parse
-    }
+    store = intermediate_store.open_store()
+    stored_paths = set(store.paths())
+    if project_root is None:
+        project_dirs = list_project_dirs(SOURCE_ROOT)
+        if not project_dirs: print(f"[ERROR] No se encontró proyecto TIBCO."); return
+        project_root = os.path.join(SOURCE_ROOT, project_dirs[0])
+    tibco_project_root = project_root
+
+    # Entradas con las que se generó cada JSON en la ejecución anterior: si no cambian, se reutiliza.
+    manifest = source_manifest.load_manifest()
+    file_hashes = {path: entry.get("sha256") for path, entry in manifest.get("files", {}).items()}
+    enriched = manifest.get("enriched", {})
+    schema_refs = manifest.get("schema_refs", {})
+    changed_paths, skipped = set(), 0
+    tasks, task_inputs = [], {}
+    search_index, corrected = None, set()
 
     for relative_path, data in project_map["artifacts"].items():
         full_path = os.path.join(tibco_project_root, relative_path)
-        output_path = os.path.join(OUTPUT_DIR, relative_path + ".json")
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         if os.path.exists(full_path):
             artifact_type = data.get("type")
-            if artifact_type in enricher_map:
+            if artifact_type in ENRICHER_MAP:
+                enrichment_inputs = {"sha256": file_hashes.get(relative_path), "format": ARTIFACT_FORMAT, "data": data}
+                if enrichment_inputs["sha256"] and enriched.get(relative_path) == enrichment_inputs \
+                        and relative_path in stored_paths:
+                    skipped += 1
+                    continue
                 print(f"Enriqueciendo ({artifact_type}): {relative_path}")
-                namespaces = {'pd': 'http://xmlns.tibco.com/bw/process/2003',
-                              'xsl': 'http://www.w3.org/1999/XSL/Transform', 'xsd': 'http://www.w3.org/2001/XMLSchema'}
-                try:
-                    enriched_data = enricher_map[artifact_type](full_path, data.copy(), namespaces)
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        json.dump(enriched_data, f, indent=2)
-                except Exception as e:
-                    print(f"    [WARN] Falló el enriquecimiento para {relative_path}: {e}")
\ No newline at end of file
+                tasks.append((relative_path, artifact_type, full_path, data))
+                task_inputs[relative_path] = enrichment_inputs
+
+    if workers > 1 and tasks:
+        print(f"  -> Enriqueciendo {len(tasks)} artefactos con {workers} procesos...")
+    batch, new_schemas = [], {}
+
+    def flush():
+        # Los esquemas se escriben antes que los artefactos que los referencian.
+        store.write_schemas(new_schemas); new_schemas.clear()
+        store.write_many(batch); batch.clear()
+
+    for relative_path, warning, enriched_data in run_enrichment_tasks(tasks, workers):
+        if warning:
+            print(f"    [WARN] {warning}")
+            continue
+        dependency_names = enriched_data.pop("dependency_names", None)
+        file_entry = manifest.get("files", {}).get(relative_path)
+        if dependency_names is not None and file_entry is not None \
+                and file_entry.get("dependency_names") != dependency_names:
+            # El escaneo de bytes de la Fase 1 no coincide con el modelo: manda el modelo.
+            if search_index is None: search_index = build_search_index(tibco_project_root)
+            file_entry["dependency_names"] = dependency_names
+            dependencies = resolve_dependencies(dependency_names, search_index)
+            project_map["artifacts"][relative_path]["dependencies"] = enriched_data["dependencies"] = dependencies
+            corrected.add(relative_path)
+        references = schema_table.intern_schemas(enriched_data, new_schemas)
+        if references: schema_refs[relative_path] = dict(references)
+        else: schema_refs.pop(relative_path, None)
+        batch.append((relative_path, enriched_data))
+        if len(batch) >= intermediate_store.WRITE_BATCH_SIZE: flush()
+        enriched[relative_path] = task_inputs[relative_path]
+        changed_paths.add(relative_path)
+    if batch: flush()
+
+    if corrected:
+        # Mapa y grafo de llamadas con las dependencias corregidas, antes de propagar los cambios.
+        project_map["entry_points"] = find_entry_points(project_map["artifacts"])
+        with open(MAP_FILE, 'w', encoding='utf-8') as f:
+            json.dump(project_map, f, indent=2)
+        call_graph.save_call_graph(call_graph.build_call_graph(project_map))
+        print(f"  [INFO] Dependencias corregidas con el modelo en {len(corrected)} procesos; "
+              f"mapa y grafo de llamadas actualizados.")
+
+    # Artefactos que ya no existen: se eliminan del almacén y se invalidan sus llamadores.
+    stale_paths = sorted(set(enriched) - set(project_map["artifacts"]))
+    store.delete(stale_paths)
+    for relative_path in stale_paths:
+        del enriched[relative_path]
+        schema_refs.pop(relative_path, None)
+        changed_paths.add(relative_path)
+
+    # Esquemas que ya no referencia ningún artefacto.
+    schema_sizes = store.schema_sizes()
+    unreferenced = set(schema_sizes).difference(*schema_refs.values())
+    store.delete_schemas(unreferenced)
+    if schema_refs:
+        stats = schema_table.dedup_stats(schema_refs, schema_sizes)
+        print(f"  -> Tabla de esquemas: {schema_table.format_dedup_stats(stats)}.")
+
+    dirty = set(manifest.get("dirty_processes", []))
+    dirty.update(path for path in changed_paths if path.endswith(".process") and path in project_map["artifacts"])
+    graph = call_graph.CallGraph.load()
+    if graph is not None:
+        dirty.update(caller for path in changed_paths for caller in graph.callers(path))
+    else:
+        dirty.update(source_manifest.find_callers(project_map, changed_paths))
+    dirty.intersection_update(project_map["artifacts"])
+    manifest["enriched"] = enriched
+    manifest["schema_refs"] = schema_refs
+    manifest["dirty_processes"] = sorted(dirty)
+    source_manifest.save_manifest(manifest)
+    print(f"  -> {len(changed_paths)} artefactos enriquecidos/eliminados, {skipped} sin cambios reutilizados. "
+          f"{len(dirty)} procesos marcados para documentar.")
\ No newline at end of file
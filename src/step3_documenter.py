@@ -1,12 +1,39 @@
 # src/step3_documenter.py (Versión 11 - "Agente de Análisis de Interacciones")
 
-import os, json, time
-from . import llm_client
+import os, json
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import call_graph, intermediate_store, llm_client, schema_table, source_manifest
+from .context_projection import DEFAULT_BUDGET_TOKENS, ProcessContextProjector, fit_to_budget, project_subprocess
+from .interaction_batch import DEFAULT_BATCH_BUDGET_TOKENS, submit_interaction_batch
+from .interaction_store import InteractionAnalysisStore, make_interaction_key
 
-PREPROCESSED_DIR = os.path.join("2_intermediate_data", "preprocessed")
+PREPROCESSED_DIR = intermediate_store.JSON_TREE_DIR
 OUTPUT_DOCS_DIR = "3_output_documentation"
 PROMPT_DIR = os.path.join("config", "prompt_templates")
 CONFIG_PATH = os.path.join("config", "llm_config.json")
+SUMMARIES_FILE = os.path.join("2_intermediate_data", "process_summaries.json")
+SUBPROCESS_SUMMARY_BUDGET_TOKENS = 400
+CALL_PROCESS_ACTIVITY = "com.tibco.pe.core.CallProcessActivity"
+
+
+class DocumentationRun:
+    """Estado de una ejecución de la Fase 3, compartido por los procesos que se documentan en ella."""
+
+    def __init__(self, config: dict = None, process_summaries: dict = None):
+        """Sin `config` (un proceso suelto) se usan los valores por defecto y no se reutilizan interacciones."""
+        # Almacén de análisis de interacciones reutilizables entre procesos (None = deshabilitado).
+        self.interaction_store = InteractionAnalysisStore().load() \
+            if config is not None and config.get("deduplicate_interactions", True) else None
+        config = config or {}
+        # Presupuesto de tokens del contexto de cada prompt de interacción.
+        self.interaction_budget_tokens = config.get("interaction_context_budget_tokens", DEFAULT_BUDGET_TOKENS)
+        # Modo opcional: todas las interacciones de un proceso en una sola petición estructurada.
+        self.batch_interactions = config.get("batch_interactions", False)
+        self.batch_budget_tokens = config.get("batch_interaction_budget_tokens", DEFAULT_BATCH_BUDGET_TOKENS)
+        # Resúmenes ya generados de cada proceso (ruta -> resumen breve); los llamadores los reciben en lugar del JSON.
+        self.process_summaries = process_summaries if process_summaries is not None else {}
+        # Resúmenes visibles en el nivel en curso: los del inicio del nivel, igual en serie que en paralelo.
+        self.known_summaries = dict(self.process_summaries)
 
 
 def load_prompt(prompt_name: str) -> str:
@@ -17,18 +44,124 @@ def load_prompt(prompt_name: str) -> str:
         return ""
 
 
-def generate_documentation_for_process(json_path: str, delay: int):
+def get_json_path(artifact_path: str) -> str:
+    """Ruta del JSON pre-procesado del artefacto (con el almacén SQLite, la que tendría al exportarlo)."""
+    return os.path.join(PREPROCESSED_DIR, artifact_path + ".json")
+
+
+def get_artifact_path(json_path: str) -> str:
+    """Ruta del artefacto TIBCO (clave de project_map) a partir de su JSON pre-procesado."""
+    return os.path.relpath(json_path, PREPROCESSED_DIR).replace('\\', '/')[:-len(".json")]
+
+
+def load_process_summaries() -> dict:
+    try:
+        with open(SUMMARIES_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_process_summaries(process_summaries: dict):
+    os.makedirs(os.path.dirname(SUMMARIES_FILE), exist_ok=True)
+    with open(SUMMARIES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(process_summaries, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def get_output_markdown_path(json_path: str) -> str:
+    relative_path = os.path.relpath(json_path, PREPROCESSED_DIR)
+    md_path = relative_path.replace('.json', '.md')
+    return os.path.join(OUTPUT_DOCS_DIR, md_path)
+
+
+def submit_llm_call(llm_executor, prompt: str, json_output: bool = False, schema_budget_tokens: int = None) -> Future:
+    """
+    Encola una llamada al LLM; sin executor se resuelve en el acto (modo serie).
+    Los esquemas referenciados en el prompt ("schema:<hash>") se añaden al final una sola vez cada uno.
+    """
+    prompt = schema_table.append_referenced_schemas(prompt, intermediate_store.open_store().load_schema,
+                                                    schema_budget_tokens)
+    if llm_executor is not None:
+        return llm_executor.submit(llm_client.generate_text, prompt, json_output=json_output)
+    future = Future()
+    try:
+        future.set_result(llm_client.generate_text(prompt, json_output=json_output))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def resolve_doc_part(part):
+    """
+    (texto, falló) de una parte del documento. Un Future que lanza excepción (LLMError) se sustituye por
+    un aviso en su lugar, así el resto del documento se conserva.
+    """
+    if not isinstance(part, Future):
+        return part, False
+    try:
+        text = part.result()
+    except Exception as e:
+        return f"*   **Error:** No se pudo generar esta sección: {e}", True
+    return text, text.startswith("Error:")
+
+
+def load_subprocess(store, run: DocumentationRun, activity: dict):
+    """Nombre y datos del subproceso que llama `activity` (None si no está en el almacén)."""
+    subprocess_name = activity.get("config", {}).get("processName", "").lstrip('/')
+    # Decodificado una sola vez aunque se llame desde muchas actividades (caché del almacén).
+    subprocess_data = store.load(subprocess_name)
+    # El subproceso se documentó en un nivel anterior: su resumen sustituye a los metadatos.
+    if subprocess_data is not None and run.known_summaries.get(subprocess_name):
+        subprocess_data = {**subprocess_data, "summary": run.known_summaries[subprocess_name]}
+    return subprocess_name, subprocess_data
+
+
+def interaction_key(store, activity: dict, subprocess_name: str, subprocess_data: dict, interaction_prompt: str) -> str:
+    # Clave sobre el mapeo con el esquema expandido: la normalización ignora espacios y xmlns.
+    bindings = {**activity, "activity_input_schema_xml": store.resolve_schema(activity.get("activity_input_schema_xml"))}
+    return make_interaction_key(subprocess_name, bindings, project_subprocess(subprocess_data), interaction_prompt)
+
+
+def begin_level(level, run: DocumentationRun):
+    """
+    Prepara un nivel: fija los resúmenes visibles y asigna cada interacción reutilizable a su primer
+    punto de llamada en el orden de una ejecución en serie (proceso, después actividad). Así el
+    análisis compartido no depende de qué hilo llegue antes.
+    """
+    run.known_summaries = dict(run.process_summaries)
+    if run.interaction_store is None: return
+    store = intermediate_store.open_store()
+    interaction_prompt = load_prompt("interaction_prompt.txt")
+    for json_path in level:
+        process_data = store.load(get_artifact_path(json_path))
+        for activity in (process_data or {}).get("activities", []):
+            if activity.get("type") != CALL_PROCESS_ACTIVITY: continue
+            subprocess_name, subprocess_data = load_subprocess(store, run, activity)
+            if subprocess_data is not None:
+                run.interaction_store.plan(interaction_key(store, activity, subprocess_name, subprocess_data,
+                                                           interaction_prompt), json_path, activity.get("name"))
+
+
+def generate_documentation_for_process(json_path: str, run: DocumentationRun = None, llm_executor=None):
     """
     Actúa como un agente que documenta un proceso iterando sobre sus interacciones.
+    Las llamadas al LLM se lanzan en paralelo en `llm_executor` y el documento se
+    ensambla en el orden original, por lo que la salida es idéntica a la de una ejecución en serie.
     """
+    run = run or DocumentationRun()
     print(f"  Agente analizando: {os.path.basename(json_path)}...")
+    # En modo agrupado las interacciones se reservan en el bucle y se envían juntas al final.
+    batch_targets = []
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            main_process_data = json.load(f)
+        store = intermediate_store.open_store()
+        main_process_data = store.load(get_artifact_path(json_path))
+        if main_process_data is None:
+            raise FileNotFoundError(f"{get_artifact_path(json_path)} no está en el almacén intermedio")
 
         # --- 1. Cargar Prompts del Agente ---
         summary_prompt = load_prompt("process_summary_prompt.txt")
         interaction_prompt = load_prompt("interaction_prompt.txt")
+        batch_prompt = load_prompt("batch_interaction_prompt.txt") if run.batch_interactions else ""
 
         # --- 2. Ensamblar el Documento Final por Partes ---
         doc_parts = [f"# Especificación Técnica: {main_process_data.get('name', 'N/A')}"]
@@ -37,38 +170,57 @@ def generate_documentation_for_process(json_path: str, delay: int):
         print("    -> Generando resumen...")
         summary_context = {"metadata": main_process_data.get("metadata"),
                            "activities": main_process_data.get("activities")}
-        summary = llm_client.generate_text(
-            summary_prompt.replace("{json_content}", json.dumps(summary_context, indent=2)))
+        summary = submit_llm_call(
+            llm_executor, summary_prompt.replace("{json_content}", json.dumps(summary_context, indent=2)))
         doc_parts.append(summary)
         doc_parts.append("\n---\n")
 
         # Parte B: Contratos de Interfaz (Directo)
         doc_parts.append("## Contrato de Interfaz del Proceso")
         doc_parts.append("### Esquema de Entrada (`<startType>`)")
-        doc_parts.append(f"```xml\n{main_process_data.get('input_schema_xml', 'No definido')}\n```")
+        doc_parts.append(f"```xml\n{store.resolve_schema(main_process_data.get('input_schema_xml', 'No definido'))}\n```")
         doc_parts.append("### Esquema de Salida (`<endType>`)")
-        doc_parts.append(f"```xml\n{main_process_data.get('output_schema_xml', 'No definido')}\n```")
+        doc_parts.append(f"```xml\n{store.resolve_schema(main_process_data.get('output_schema_xml', 'No definido'))}\n```")
         doc_parts.append("\n---\n")
 
         # Parte C: Bucle de Interacciones (LLM por cada interacción)
+        # El proceso llamador se serializa una vez; cada prompt recibe solo su proyección.
+        projector = ProcessContextProjector(main_process_data, run.interaction_budget_tokens, store.resolve_schema)
         doc_parts.append("## Secuencia de Actividades y Análisis de Interacciones")
+
+        # Llamada al LLM para una interacción específica
+        def submit_interaction(activity, subprocess_data):
+            main_json, subprocess_json, calling_json = projector.build_interaction_context(
+                activity.get("name"), subprocess_data)
+            prompt = interaction_prompt.replace("{main_process_json}", main_json)
+            prompt = prompt.replace("{subprocess_json}", subprocess_json)
+            prompt = prompt.replace("{calling_activity_json}", calling_json)
+            return submit_llm_call(llm_executor, prompt, schema_budget_tokens=run.interaction_budget_tokens)
+
+        def reserve_interaction(activity, subprocess_data):
+            if not batch_prompt:
+                return submit_interaction(activity, subprocess_data)
+            target = Future()
+            batch_targets.append((activity, subprocess_data, target))
+            return target
+
         for activity in main_process_data.get("activities", []):
             activity_type = activity.get("type")
 
-            if activity_type == "com.tibco.pe.core.CallProcessActivity":
+            if activity_type == CALL_PROCESS_ACTIVITY:
                 print(f"    -> Analizando interacción con: {activity.get('name')}")
-                subprocess_name = activity.get("config", {}).get("processName", "").lstrip('/')
-                subprocess_json_path = os.path.join(PREPROCESSED_DIR, subprocess_name + ".json")
-
-                if os.path.exists(subprocess_json_path):
-                    with open(subprocess_json_path, 'r', encoding='utf-8') as f:
-                        subprocess_data = json.load(f)
-
-                    # Llamada al LLM para esta interacción específica
-                    prompt = interaction_prompt.replace("{main_process_json}", json.dumps(main_process_data, indent=2))
-                    prompt = prompt.replace("{subprocess_json}", json.dumps(subprocess_data, indent=2))
-                    prompt = prompt.replace("{calling_activity_json}", json.dumps(activity, indent=2))
-                    interaction_md = llm_client.generate_text(prompt)
+                subprocess_name, subprocess_data = load_subprocess(store, run, activity)
+
+                if subprocess_data is not None:
+                    submit = lambda activity=activity, subprocess_data=subprocess_data: \
+                        reserve_interaction(activity, subprocess_data)
+                    if run.interaction_store is not None:
+                        # Misma llamada (subproceso + mapeo) ya analizada en otro proceso: se reutiliza.
+                        key = interaction_key(store, activity, subprocess_name, subprocess_data, interaction_prompt)
+                        interaction_md = run.interaction_store.get_or_submit(key, activity.get("name"), subprocess_name,
+                                                                             submit, json_path)
+                    else:
+                        interaction_md = submit()
                     doc_parts.append(interaction_md)
                 else:
                     doc_parts.append(
@@ -79,35 +231,142 @@ def generate_documentation_for_process(json_path: str, delay: int):
                 doc_parts.append(f"*   **Tipo:** `{activity_type}`")
                 # (Se puede añadir más lógica aquí para otros tipos de actividades si es necesario)
 
+        if batch_targets:
+            if len(batch_targets) > 1:
+                print(f"    -> Documentando {len(batch_targets)} interacciones en una sola petición...")
+            submit_interaction_batch(batch_targets, batch_prompt, projector,
+                                     lambda prompt: submit_llm_call(llm_executor, prompt, json_output=True,
+                                                                    schema_budget_tokens=run.batch_budget_tokens),
+                                     submit_interaction, run.batch_budget_tokens)
+            # Desde aquí cada Future del lote está resuelto o enlazado a una petición.
+            batch_targets = []
+
         # --- 3. Guardar el Documento Ensamblado ---
-        final_doc = "\n".join(doc_parts)
-        relative_path = os.path.relpath(json_path, PREPROCESSED_DIR)
-        md_path = relative_path.replace('.json', '.md')
-        output_path = os.path.join(OUTPUT_DOCS_DIR, md_path)
+        resolved_parts = [resolve_doc_part(part) for part in doc_parts]
+        final_doc = "\n".join(text for text, _ in resolved_parts)
+        output_path = get_output_markdown_path(json_path)
 
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(final_doc)
+        if summary.exception() is None and not summary.result().startswith("Error:"):
+            run.process_summaries[get_artifact_path(json_path)] = fit_to_budget(summary.result().strip(),
+                                                                                SUBPROCESS_SUMMARY_BUDGET_TOKENS)
 
+        # Igual que en InteractionAnalysisStore: una respuesta "Error:" no cuenta como documentada.
+        # El documento parcial se conserva, pero el proceso sigue pendiente para la próxima ejecución.
+        failed_parts = sum(1 for _, failed in resolved_parts if failed)
+        if failed_parts:
+            print(f"    [WARN] {failed_parts} partes del documento fallaron; {output_path} queda pendiente de regenerar.")
+            return False
         print(f"    -> Documento ensamblado guardado en: {output_path}")
-        time.sleep(delay)
+        return True
 
     except Exception as e:
         print(f"    [ERROR] Falló la generación para {os.path.basename(json_path)}: {e}")
+        # Las interacciones reservadas y nunca enviadas no deben dejar esperando a otros procesos.
+        for _, _, target in batch_targets:
+            if not target.done(): target.set_exception(e)
+        return False
+    finally:
+        if run.interaction_store is not None:
+            run.interaction_store.abandon(json_path, RuntimeError(
+                f"{os.path.basename(json_path)} no llegó a enviar el análisis de la interacción"))
+
+
+def remove_orphan_documents(artifact_paths):
+    """Elimina la documentación de procesos que ya no están en el almacén pre-procesado."""
+    if not os.path.isdir(OUTPUT_DOCS_DIR): return
+    for root, _, files in os.walk(OUTPUT_DOCS_DIR):
+        for file in files:
+            if file.endswith(".process.md"):
+                md_path = os.path.join(root, file)
+                relative_path = os.path.relpath(md_path, OUTPUT_DOCS_DIR).replace('\\', '/')
+                if relative_path[:-len(".md")] not in artifact_paths:
+                    print(f"  -> Eliminando documentación obsoleta: {md_path}")
+                    os.remove(md_path)
 
 
-def run_atomic_documentation_phase():
+def run_atomic_documentation_phase(only_dirty: bool = True):
+    """
+    Documenta los procesos pre-procesados. Con `only_dirty` solo se regeneran los procesos
+    marcados como modificados por la Fase 2 (o sin documento), conservando el resto.
+    """
     print("\n--- Iniciando Fase 3 (Agente de Análisis): Documentación Detallada ---")
-    if not os.path.isdir(PREPROCESSED_DIR): print(f"[ERROR] Directorio pre-procesado no encontrado."); return
+    store = intermediate_store.open_store()
+    if not store.available(): print(f"[ERROR] Almacén pre-procesado no encontrado."); return
     try:
         with open(CONFIG_PATH, 'r') as f:
             config = json.load(f)
-        delay = config.get("request_delay_seconds", 1)
+        max_workers = max(1, int(config.get("max_workers", 1)))
     except FileNotFoundError as e:
         print(f"[FATAL] Archivo de config no encontrado: {e}"); return
 
-    for root, _, files in os.walk(PREPROCESSED_DIR):
-        for file in files:
-            if file.endswith(".process.json"):
-                json_path = os.path.join(root, file)
-                generate_documentation_for_process(json_path, delay)
\ No newline at end of file
+    artifact_paths = set(store.paths())
+    json_paths = [get_json_path(path) for path in sorted(artifact_paths) if path.endswith(".process")]
+
+    manifest = source_manifest.load_manifest()
+    incremental = only_dirty and "dirty_processes" in manifest
+    if incremental:
+        remove_orphan_documents(artifact_paths)
+        dirty = set(manifest["dirty_processes"])
+        total = len(json_paths)
+        json_paths = [p for p in json_paths
+                      if get_artifact_path(p) in dirty or not os.path.exists(get_output_markdown_path(p))]
+        print(f"  -> Modo incremental: {len(json_paths)} de {total} procesos requieren documentación.")
+
+    run = DocumentationRun(config, load_process_summaries())
+    levels = schedule_by_dependency_level(json_paths, call_graph.CallGraph.load())
+    results = _document_processes(levels, max_workers, run)
+    save_process_summaries(run.process_summaries)
+
+    if run.interaction_store is not None:
+        run.interaction_store.save()
+        store_stats = run.interaction_store.stats()
+        print(f"  -> Análisis de interacciones: {store_stats['generated']} generados, "
+              f"{store_stats['reused']} reutilizados (llamadas al LLM evitadas).")
+
+    if incremental:
+        documented = {get_artifact_path(p) for p, ok in results.items() if ok}
+        manifest["dirty_processes"] = sorted(set(manifest["dirty_processes"]) - documented)
+        source_manifest.save_manifest(manifest)
+
+
+def schedule_by_dependency_level(json_paths, graph):
+    """
+    Agrupa los procesos por nivel del grafo de llamadas, de abajo arriba: primero los que no llaman
+    a otros procesos, así cada llamador encuentra ya generado el resumen de sus subprocesos.
+    Sin grafo de llamadas todos los procesos forman un único nivel.
+    """
+    json_paths = sorted(json_paths)
+    if graph is None: return [json_paths] if json_paths else []
+    process_levels = graph.process_levels()
+    levels = {}
+    for json_path in json_paths:
+        levels.setdefault(process_levels.get(get_artifact_path(json_path), 0), []).append(json_path)
+    return [levels[level] for level in sorted(levels)]
+
+
+def _document_processes(levels, max_workers: int, run: DocumentationRun) -> dict:
+    """Documenta nivel a nivel; los procesos de un mismo nivel son independientes y van en paralelo."""
+    results = {}
+    if max_workers == 1:
+        for level in levels:
+            begin_level(level, run)
+            for json_path in level:
+                results[json_path] = generate_documentation_for_process(json_path, run)
+        return results
+
+    # El ritmo lo marca el limitador RPM/TPM compartido de llm_client, no una pausa fija.
+    # Se usan dos pools para que los procesos que esperan a sus llamadas no bloqueen a estas.
+    print(f"  -> Documentando {sum(len(level) for level in levels)} procesos en {len(levels)} niveles de dependencia "
+          f"con {max_workers} trabajadores concurrentes...")
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm") as llm_executor, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="process") as process_executor:
+        for depth, level in enumerate(levels):
+            print(f"  -> Nivel {depth}: {len(level)} procesos.")
+            begin_level(level, run)
+            futures = {json_path: process_executor.submit(generate_documentation_for_process, json_path, run, llm_executor)
+                       for json_path in level}
+            results.update((json_path, future.result()) for json_path, future in futures.items())
+    return results
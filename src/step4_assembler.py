@@ -8,8 +8,11 @@ MAP_FILE = os.path.join("2_intermediate_data", "project_map.json")
 PROMPT_TEMPLATE_PATH = os.path.join("config", "prompt_templates", "final_summary_prompt.txt")
 
 
-def run_assembly_phase(rag_handler: RAGHandler):
-    """Usa RAG para buscar contexto y luego crea un README.md de alto nivel."""
+def run_assembly_phase(rag_handler: RAGHandler, project: str = None):
+    """
+    Usa RAG para buscar contexto y luego crea un README.md de alto nivel.
+    En modo portafolio, `project` limita el contexto a la documentación de ese proyecto y a la externa.
+    """
     print("\n--- Iniciando Fase 4 (Ensamblaje con RAG): Creando Resumen de Alto Nivel ---")
 
     try:
@@ -28,7 +31,7 @@ def run_assembly_phase(rag_handler: RAGHandler):
     print(f"  -> Buscando contexto en la Vector DB para: '{query}'...")
 
     # FIX: Cambiar 'query_knowledge_base' por el nombre correcto 'query_for_context'
-    rag_context = rag_handler.query_for_context(query, n_results=5)
+    rag_context = rag_handler.query_for_context(query, n_results=5, project=project)
 
     print("  -> Llamando al LLM para el resumen final con contexto RAG...")
     try:
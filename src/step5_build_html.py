@@ -1,14 +1,23 @@
 # src/step5_build_html.py (Versión 4.1 - Corrección de Codec)
 
-import os, json, markdown2, re
+import os, json, markdown2, re, hashlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from . import call_graph, html_site, intermediate_store
 
 OUTPUT_DOCS_DIR = "3_output_documentation"
 TEMPLATE_PATH = "template.html"
 FINAL_HTML_PATH = os.path.join(OUTPUT_DOCS_DIR, "TIBCO_Migration_Specification.html")
 PROJECT_TITLE = "Especificación de Migración de TIBCO"
-PREPROCESSED_DIR = os.path.join("2_intermediate_data", "preprocessed")
 MAP_FILE = os.path.join("2_intermediate_data", "project_map.json")
+FRAGMENT_CACHE_DIR = os.path.join("2_intermediate_data", "html_fragments")
+# Cambiar esta versión invalida todos los fragmentos cacheados (ej. al modificar el renderizado).
+RENDERER_VERSION = "1"
+MARKDOWN_EXTRAS = ["tables", "fenced-code-blocks", "header-ids"]
+TEMPLATE_PLACEHOLDER_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+# "single": un único HTML con todo el contenido; "site": índice + una página cargada bajo demanda por documento.
+OUTPUT_MODE_SINGLE = "single"
+OUTPUT_MODE_SITE = "site"
 
 
 def create_anchor_id(filepath):
@@ -25,7 +34,7 @@ def generate_mermaid_for_process(process_data):
 
     mermaid_code = ["graph TD"]
     nodes = {}
-    starter_name = process_data.get("starter", {}).get("name", "Start")
+    starter_name = (process_data.get("starter") or {}).get("name", "Start")
     nodes[starter_name] = f'{clean_id(starter_name)}["🏁 {starter_name}"]'
     for act in process_data.get("activities", []):
         nodes[act.get("name")] = f'{clean_id(act.get("name"))}["📄 {act.get("name")}"]'
@@ -39,11 +48,11 @@ def generate_mermaid_for_process(process_data):
         if from_node in nodes and to_node in nodes:
             link_style = "-- Error -->" if t.get("condition") == "error" else "-->"
             mermaid_code.append(f"    {clean_id(from_node)} {link_style} {clean_id(to_node)}")
-    return f'<h3>Diagrama de Flujo de Actividades</h3>\n<div class="mermaid">\n{"\n".join(mermaid_code)}\n</div>'
+    mermaid_body = "\n".join(mermaid_code)
+    return f'<h3>Diagrama de Flujo de Actividades</h3>\n<div class="mermaid">\n{mermaid_body}\n</div>'
 
 
-def get_ordered_markdown_files(project_map):
-    # ... (Esta función no necesita cambios) ...
+def get_ordered_markdown_files(project_map, graph=None):
     print("  -> Ordenando documentos según el flujo de ejecución...")
     all_md_paths = {os.path.join(root, file) for root, _, files in os.walk(OUTPUT_DOCS_DIR) for file in files if
                     file.endswith(".md")}
@@ -52,23 +61,127 @@ def get_ordered_markdown_files(project_map):
     if readme_path in all_md_paths:
         ordered_files.append(readme_path);
         processed_paths.add(readme_path)
-    queue = list(project_map.get("entry_points", []))
-    bfs_processed = set()
-    while queue:
-        process_path = queue.pop(0)
-        if process_path in bfs_processed: continue
-        bfs_processed.add(process_path)
+    # El recorrido desde los puntos de entrada lo precalcula la Fase 1 en el grafo de llamadas.
+    for process_path in (graph.bfs_order() if graph is not None else bfs_process_order(project_map)):
         md_path = os.path.join(OUTPUT_DOCS_DIR, process_path.replace('.process', '.md'))
         if md_path in all_md_paths and md_path not in processed_paths:
             ordered_files.append(md_path);
             processed_paths.add(md_path)
-        for dep_path in project_map.get("artifacts", {}).get(process_path, {}).get("dependencies", []):
-            if dep_path.endswith(".process"): queue.append(dep_path)
     ordered_files.extend(sorted(list(all_md_paths - processed_paths)))
     return ordered_files
 
 
-def run_html_build_phase():
+def bfs_process_order(project_map):
+    """Orden de recorrido en anchura desde los puntos de entrada, para mapas sin grafo de llamadas."""
+    return call_graph.build_call_graph(project_map)["bfs_order"]
+
+
+def get_process_artifact_path(relative_path):
+    if not relative_path.endswith(".process.md"): return None
+    return relative_path[:-len(".md")]
+
+
+def read_bytes(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except (FileNotFoundError, TypeError):
+        return None
+
+
+def fragment_key(relative_path, md_bytes, json_bytes):
+    """Hash del Markdown, del JSON del proceso (para el diagrama) y de la ruta (para el ancla)."""
+    digest = hashlib.sha256(f"{RENDERER_VERSION}\0{relative_path}\0".encode('utf-8'))
+    digest.update(md_bytes)
+    digest.update(b"\0" + (json_bytes if json_bytes is not None else b"\0missing"))
+    return digest.hexdigest()
+
+
+def render_section(task):
+    """Trabajador: convierte un documento (Markdown + diagrama Mermaid) en su sección HTML y sus términos de búsqueda."""
+    relative_path, md_bytes, json_bytes = task
+    md_text = md_bytes.decode('utf-8')
+    html_content = markdown2.markdown(md_text, extras=MARKDOWN_EXTRAS)
+
+    diagram_html = ""
+    if json_bytes is not None:
+        try:
+            process_data = json.loads(json_bytes.decode('utf-8'))
+            diagram_html = generate_mermaid_for_process(process_data)
+        except json.JSONDecodeError:
+            print(f"    [WARN] No se pudo leer JSON para diagrama de: {relative_path}")
+
+    anchor_id = create_anchor_id(relative_path)
+    section_html = f'<section id="{anchor_id}" class="document-part">\n{diagram_html}\n{html_content}\n</section>'
+    return section_html, html_site.extract_search_terms(md_text)
+
+
+def render_sections(tasks, workers):
+    """Renderiza las secciones no cacheadas, en paralelo si hay más de una."""
+    if len(tasks) <= 1 or workers <= 1:
+        return [render_section(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render_section, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+
+def fragment_path(key, extension=".html"):
+    return os.path.join(FRAGMENT_CACHE_DIR, f"{key}{extension}")
+
+
+def write_fragment(key, section_html, search_terms):
+    for extension, text in ((".terms.json", json.dumps(search_terms, ensure_ascii=False)), (".html", section_html)):
+        tmp_path = fragment_path(key, extension) + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, fragment_path(key, extension))
+
+
+def read_fragment(key, extension=".html"):
+    with open(fragment_path(key, extension), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def read_search_terms(key):
+    return json.loads(read_fragment(key, ".terms.json"))
+
+
+def prune_fragment_cache(used_keys):
+    """Elimina los fragmentos que ya no corresponden a ningún documento actual."""
+    removed = 0
+    for file in os.listdir(FRAGMENT_CACHE_DIR):
+        if file.split(".", 1)[0] not in used_keys:
+            os.remove(os.path.join(FRAGMENT_CACHE_DIR, file))
+            removed += 1
+    return removed
+
+
+def write_html(template, values, f):
+    """Escribe la plantilla sustituyendo cada marcador por el texto o las partes (iterables) de `values`."""
+    position = 0
+    for match in TEMPLATE_PLACEHOLDER_PATTERN.finditer(template):
+        f.write(template[position:match.start()])
+        value = values.get(match.group(1))
+        if value is None:
+            f.write(match.group(0))
+        elif isinstance(value, str):
+            f.write(value)
+        else:
+            for i, part in enumerate(value()):
+                if i: f.write("\n")
+                f.write(part)
+        position = match.end()
+    f.write(template[position:])
+
+
+def write_page(template, values, path):
+    """Escribe una página a un fichero temporal y lo renombra al terminar."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        write_html(template, values, f)
+    os.replace(tmp_path, path)
+
+
+def run_html_build_phase(workers=None, mode=OUTPUT_MODE_SINGLE):
     print("\n--- Iniciando Fase 5 (Build HTML Ordenado): Creando Documento Final ---")
     if not os.path.isdir(OUTPUT_DOCS_DIR): print(f"[ERROR] Directorio de documentación no encontrado."); return
     try:
@@ -78,10 +191,11 @@ def run_html_build_phase():
     except FileNotFoundError:
         print(f"[FATAL] Mapa del proyecto no encontrado."); return
 
-    ordered_md_files = get_ordered_markdown_files(project_map)
+    ordered_md_files = get_ordered_markdown_files(project_map, call_graph.CallGraph.load())
     if not ordered_md_files: print("[WARN] No se encontraron archivos .md para construir."); return
 
-    toc_html_parts, content_html_parts = [], []
+    toc_html_parts, entries, misses = [], [], []
+    store = intermediate_store.open_store()
     print("  -> Procesando archivos y generando diagramas en orden de flujo...")
     for md_path in ordered_md_files:
         relative_path = os.path.relpath(md_path, OUTPUT_DOCS_DIR).replace('\\', '/')
@@ -89,36 +203,40 @@ def run_html_build_phase():
         title = "Visión General del Proyecto" if relative_path == "README.md" else relative_path
         toc_html_parts.append(f'<li><a href="#{anchor_id}">{title}</a></li>')
 
-        # FIX: Añadir encoding='utf-8'
-        with open(md_path, 'r', encoding='utf-8') as f:
-            html_content = markdown2.markdown(f.read(), extras=["tables", "fenced-code-blocks", "header-ids"])
-
-        diagram_html = ""
-        if relative_path.endswith(".process.md"):
-            json_path = os.path.join(PREPROCESSED_DIR, relative_path.replace('.md', '.json'))
-            if os.path.exists(json_path):
-                try:
-                    # FIX: Añadir encoding='utf-8'
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        process_data = json.load(f)
-                    diagram_html = generate_mermaid_for_process(process_data)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    print(f"    [WARN] No se pudo leer JSON para diagrama de: {relative_path}")
-
-        content_html_parts.append(
-            f'<section id="{anchor_id}" class="document-part">\n{diagram_html}\n{html_content}\n</section>')
+        # Solo se re-renderizan los documentos cuyo Markdown o JSON de proceso cambió.
+        md_bytes = read_bytes(md_path)
+        artifact_path = get_process_artifact_path(relative_path)
+        json_bytes = store.load_bytes(artifact_path) if artifact_path else None
+        key = fragment_key(relative_path, md_bytes, json_bytes)
+        entries.append((anchor_id, title, key))
+        if not (os.path.exists(fragment_path(key)) and os.path.exists(fragment_path(key, ".terms.json"))):
+            misses.append((key, (relative_path, md_bytes, json_bytes)))
+
+    os.makedirs(FRAGMENT_CACHE_DIR, exist_ok=True)
+    print(f"  -> {len(entries) - len(misses)} secciones recuperadas de la caché, {len(misses)} por renderizar.")
+    if misses:
+        rendered = render_sections([task for _, task in misses], workers or os.cpu_count() or 1)
+        for (key, _), (section_html, search_terms) in zip(misses, rendered):
+            write_fragment(key, section_html, search_terms)
+    prune_fragment_cache({key for _, _, key in entries})
+
+    def sections():
+        for _, _, key in entries:
+            yield read_fragment(key)
 
     print("  -> Ensamblando el archivo HTML final...")
     try:
         # FIX: Añadir encoding='utf-8'
         with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
             template = f.read()
-        final_html = template.replace("{{TITLE}}", PROJECT_TITLE)
-        final_html = final_html.replace("{{TOC}}", "\n".join(toc_html_parts))
-        final_html = final_html.replace("{{CONTENT}}", "\n".join(content_html_parts))
-        final_html = final_html.replace("{{GENERATION_DATE}}", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        with open(FINAL_HTML_PATH, 'w', encoding='utf-8') as f:
-            f.write(final_html)
+        values = {"TITLE": PROJECT_TITLE, "TOC": lambda: iter(toc_html_parts), "CONTENT": sections,
+                  "GENERATION_DATE": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        if mode == OUTPUT_MODE_SITE:
+            html_site.write_site(OUTPUT_DOCS_DIR, template, values, entries, read_fragment, read_search_terms,
+                                 write_page)
+            return
+        # El HTML se escribe sección a sección, sin construir el documento completo en memoria.
+        write_page(template, values, FINAL_HTML_PATH)
         print(f"    -> Documento HTML final guardado en: {FINAL_HTML_PATH}")
     except Exception as e:
-        print(f"    [ERROR] Falló la construcción del HTML: {e}")
\ No newline at end of file
+        print(f"    [ERROR] Falló la construcción del HTML: {e}")
@@ -0,0 +1,315 @@
+# src/synthetic_project.py
+
+import os, random
+from xml.sax.saxutils import escape, quoteattr
+
+# Generador de proyectos TIBCO BW sintéticos para medir el pipeline a escala (1k-50k artefactos).
+# El proyecto de ejemplo tiene cuatro procesos; aquí se controla el tamaño y la forma del grafo de llamadas.
+DEFAULT_PROJECT_NAME = "SYNTHETIC_BW_PROJECT"
+PD_NAMESPACES = ('xmlns:pd="http://xmlns.tibco.com/bw/process/2003" '
+                 'xmlns:xsl="http://www.w3.org/1999/XSL/Transform" '
+                 'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+                 'xmlns:tib="http://www.tibco.com/bw/xslt/custom-functions"')
+VERBS = ["Get", "Create", "Update", "Validate", "Map", "Publish", "Enrich", "Route", "Resolve", "Sync"]
+NOUNS = ["Customer", "Order", "Invoice", "Payment", "Shipment", "Product", "Account", "Contract", "Claim", "Ledger"]
+# Actividades "de relleno" (además de las llamadas a subprocesos y la respuesta HTTP de los puntos de entrada).
+FILLER_ACTIVITIES = [
+    ("com.tibco.plugin.mapper.MapperActivity", "ae.activities.MapperActivity"),
+    ("com.tibco.pe.core.WriteToLogActivity", "ae.activities.log"),
+    ("com.tibco.pe.core.AssignActivity", "ae.activities.assignActivity"),
+]
+HTTP_RESPONSE_ACTIVITY = ("com.tibco.plugin.http.HTTPResponseActivity", "httppalette.httpResponseActivity")
+CALL_PROCESS_ACTIVITY = ("com.tibco.pe.core.CallProcessActivity", "ae.process.subprocess")
+GROUP_EVERY = 8  # Un grupo de bucle (pd:group) por cada tantas actividades
+
+
+def level_sizes(processes: int, depth: int, fan_out: int):
+    """Procesos por nivel del grafo de llamadas: crece con el fan-out y cada nivel tiene al menos uno."""
+    depth = max(1, min(depth, processes))
+    weights = [max(1, fan_out) ** k for k in range(depth)]
+    sizes = [max(1, processes * w // sum(weights)) for w in weights]
+    sizes[-1] += processes - sum(sizes)
+    while sizes[-1] < 1:  # El redondeo dejó sin procesos el último nivel: se toman del mayor
+        largest = sizes.index(max(sizes[:-1]))
+        sizes[largest] -= 1; sizes[-1] += 1
+    return sizes
+
+
+def plan_call_graph(processes: int, depth: int, fan_out: int, rng: random.Random):
+    """
+    Devuelve [(nivel, [índices llamados])] por proceso. Los procesos del nivel 0 son los puntos de
+    entrada; cada proceso de un nivel llama a `fan_out` procesos del siguiente y todo proceso de un
+    nivel inferior tiene al menos un llamador.
+    """
+    levels, start = [], 0
+    for size in level_sizes(processes, depth, fan_out):
+        levels.append(list(range(start, start + size))); start += size
+    plan = [None] * processes
+    for k, members in enumerate(levels):
+        below = levels[k + 1] if k + 1 < len(levels) else []
+        calls = {index: [] for index in members}
+        for i, callee in enumerate(below):  # Cobertura: todos los del nivel inferior tienen llamador
+            calls[members[i % len(members)]].append(callee)
+        for index in members:
+            missing = min(fan_out, len(below)) - len(calls[index])
+            if missing > 0:
+                candidates = [c for c in below if c not in calls[index]]
+                calls[index].extend(rng.sample(candidates, missing))
+            plan[index] = (k, sorted(calls[index]))
+    return plan
+
+
+def process_name(index: int) -> str:
+    return f"P{index:05d}_{VERBS[index % len(VERBS)]}{NOUNS[(index // len(VERBS)) % len(NOUNS)]}"
+
+
+def process_path(index: int, level: int) -> str:
+    return f"Processes/Level{level}/{process_name(index)}.process"
+
+
+def xsd_element(name: str, fields, indent: str) -> str:
+    lines = [f'{indent}<xsd:element name="{name}">', f'{indent}    <xsd:complexType>', f'{indent}        <xsd:sequence>']
+    optional = ' minOccurs="0"'
+    lines += [f'{indent}            <xsd:element name="{field}" type="xsd:string"{optional if i % 4 == 3 else ""}/>'
+              for i, field in enumerate(fields)]
+    lines += [f'{indent}        </xsd:sequence>', f'{indent}    </xsd:complexType>', f'{indent}</xsd:element>']
+    return "\n".join(lines)
+
+
+def schema_root(schema_index: int) -> str:
+    return f"{NOUNS[schema_index % len(NOUNS)]}Document{schema_index}"
+
+
+def schema_fields(schema_index: int, count: int):
+    """Campos del esquema `schema_index` del catálogo compartido (los procesos reutilizan esquemas, como en BW)."""
+    noun = NOUNS[schema_index % len(NOUNS)].lower()
+    return [f"{noun}Field{schema_index}_{j}" for j in range(count)]
+
+
+def binding_block(root_name: str, fields, source_xpath: str, indent: str) -> str:
+    """Mapeo XSLT de entrada de una actividad: value-of directos, algún choose y alguna variable global."""
+    lines = [f"{indent}<pd:inputBindings>", f"{indent}    <{root_name}>"]
+    for j, field in enumerate(fields):
+        inner = indent + "        "
+        lines.append(f"{inner}<{field}>")
+        if j % 5 == 2:
+            lines += [f"{inner}    <xsl:choose>",
+                      f'{inner}        <xsl:when test="string-length({source_xpath}/{field}) &gt; 0">',
+                      f'{inner}            <xsl:value-of select="{source_xpath}/{field}"/>',
+                      f"{inner}        </xsl:when>",
+                      f"{inner}        <xsl:otherwise>",
+                      f"{inner}            <xsl:value-of select=\"'%%Domain%%'\"/>",
+                      f"{inner}        </xsl:otherwise>",
+                      f"{inner}    </xsl:choose>"]
+        else:
+            lines.append(f'{inner}    <xsl:value-of select="{source_xpath}/{field}"/>')
+        lines.append(f"{inner}</{field}>")
+    lines += [f"{indent}    </{root_name}>", f"{indent}</pd:inputBindings>"]
+    return "\n".join(lines)
+
+
+def activity_xml(name: str, kind, config: str, bindings: str, position: int, indent: str) -> str:
+    return (f"{indent}<pd:activity name={quoteattr(name)}>\n"
+            f"{indent}    <pd:type>{kind[0]}</pd:type>\n"
+            f"{indent}    <pd:resourceType>{kind[1]}</pd:resourceType>\n"
+            f"{indent}    <pd:x>{100 + position * 120}</pd:x>\n"
+            f"{indent}    <pd:y>60</pd:y>\n"
+            f"{indent}    <config>\n{config}\n{indent}    </config>\n"
+            f"{bindings}\n"
+            f"{indent}</pd:activity>\n")
+
+
+def transition_xml(source: str, target: str, indent: str = "    ") -> str:
+    return (f"{indent}<pd:transition>\n"
+            f"{indent}    <pd:from>{escape(source)}</pd:from>\n"
+            f"{indent}    <pd:to>{escape(target)}</pd:to>\n"
+            f"{indent}    <pd:lineType>Default</pd:lineType>\n"
+            f"{indent}    <pd:lineColor>-16777216</pd:lineColor>\n"
+            f"{indent}    <pd:conditionType>always</pd:conditionType>\n"
+            f"{indent}</pd:transition>\n")
+
+
+def build_process(index: int, level: int, callees, plan, options: dict, rng: random.Random) -> str:
+    """XML de un .process: starter HTTP en los puntos de entrada, llamadas a sus subprocesos y mapeos XSLT."""
+    fields_per_schema, schema_pool = options["fields_per_schema"], options["schema_pool"]
+    in_schema, out_schema = index % schema_pool, (index + 1) % schema_pool
+    in_fields, out_fields = schema_fields(in_schema, fields_per_schema), schema_fields(out_schema, fields_per_schema)
+    is_entry = level == 0
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n', f"<pd:ProcessDefinition {PD_NAMESPACES}>\n",
+             f"    <pd:name>{process_path(index, level)}</pd:name>\n"]
+    if is_entry:
+        start_name = "HTTP Receiver"
+        channel = f"/SharedResources/HTTPConnection{index % options['http_resources']}.sharedhttp"
+        parts.append(f"    <pd:startName>{start_name}</pd:startName>\n"
+                     f"    <pd:starter name=\"{start_name}\">\n"
+                     f"        <pd:type>com.tibco.plugin.http.HTTPEventSource</pd:type>\n"
+                     f"        <pd:resourceType>httppalette.httpEventSource</pd:resourceType>\n"
+                     f"        <config>\n"
+                     f"            <outputMode>String</outputMode>\n"
+                     f"            <sharedChannel>{channel}</sharedChannel>\n"
+                     f"            <parsePostData>true</parsePostData>\n"
+                     f"        </config>\n"
+                     f"        <pd:inputBindings/>\n"
+                     f"    </pd:starter>\n")
+        source_root = "$HTTP-Receiver/ProcessStarterOutput/parameters"
+    else:
+        start_name = "Start"
+        parts.append(f"    <pd:startName>{start_name}</pd:startName>\n"
+                     f"    <pd:startType>\n{xsd_element(schema_root(in_schema), in_fields, '        ')}\n    </pd:startType>\n")
+        source_root = f"$Start/{schema_root(in_schema)}"
+    parts.append(f"    <pd:endName>End</pd:endName>\n"
+                 f"    <pd:endType>\n{xsd_element(schema_root(out_schema), out_fields, '        ')}\n    </pd:endType>\n"
+                 f"    <pd:errorSchemas/>\n"
+                 f"    <pd:processVariables>\n"
+                 f"        <Error>\n{xsd_element('Error', ['code', 'msg', 'detail'], '            ')}\n        </Error>\n"
+                 f"        <Context>\n{xsd_element('Context', ['correlationId', 'user'], '            ')}\n        </Context>\n"
+                 f"    </pd:processVariables>\n"
+                 f"    <pd:targetNamespace>http://xmlns.example.com/synthetic/{index}</pd:targetNamespace>\n")
+
+    # Secuencia de actividades: primero las llamadas a subprocesos, después actividades de relleno.
+    activities = []
+    for callee in callees:
+        callee_name = process_name(callee)
+        config = f"        <processName>/{process_path(callee, plan[callee][0])}</processName>"
+        activities.append((f"Call {callee_name}", CALL_PROCESS_ACTIVITY, config, schema_root(callee % schema_pool),
+                           schema_fields(callee % schema_pool, fields_per_schema)))
+    fillers = options["activities"] - len(activities) - (1 if is_entry else 0)
+    for j in range(max(0, fillers)):
+        kind = FILLER_ACTIVITIES[(index + j) % len(FILLER_ACTIVITIES)]
+        if kind[0].endswith("MapperActivity"):
+            config = f"        <element>\n{xsd_element('root', out_fields, '            ')}\n        </element>"
+            root, fields = "root", out_fields
+        elif kind[0].endswith("WriteToLogActivity"):
+            config = "        <role>User</role>\n        <suppressJobInfo>%%LogSuppressJobInfo%%</suppressJobInfo>"
+            root, fields = "ActivityInput", ["message", "msgCode"]
+        else:
+            config = "        <variableName>Context</variableName>"
+            root, fields = "Context", ["correlationId", "user"]
+        activities.append((f"{kind[0].rsplit('.', 1)[1].replace('Activity', '')} {j + 1}", kind, config, root, fields))
+    if is_entry:
+        config = "        <closeConnection>true</closeConnection>"
+        activities.append(("Send HTTP Response", HTTP_RESPONSE_ACTIVITY, config, "ResponseActivityInput",
+                           ["asciiContent", "Headers"]))
+
+    # En procesos largos la segunda y tercera actividad van dentro de un grupo de bucle.
+    grouped = set(range(1, min(3, len(activities)))) if len(activities) >= GROUP_EVERY else set()
+    group_name, names, previous = "Iterate Items", [], None
+    for position, (activity_name, kind, config, root, fields) in enumerate(activities):
+        # La mitad de los mapeos leen la salida de la actividad anterior ($Actividad-Anterior/...).
+        source_xpath = f"${previous[0].replace(' ', '-')}/{previous[1]}" if previous and rng.random() < 0.5 \
+            else source_root
+        indent = "        " if position in grouped else "    "
+        if position in grouped and position == min(grouped):
+            parts.append(f"    <pd:group name=\"{group_name}\">\n"
+                         f"        <pd:type>com.tibco.pe.core.LoopGroup</pd:type>\n"
+                         f"        <pd:resourceType>ae.process.group</pd:resourceType>\n"
+                         f"        <config>\n"
+                         f"            <pd:groupType>inputLoop</pd:groupType>\n"
+                         f"            <pd:over>{source_root}/item</pd:over>\n"
+                         f"            <pd:iterationElementSlot>current</pd:iterationElementSlot>\n"
+                         f"        </config>\n")
+            names.append(group_name)
+        parts.append(activity_xml(activity_name, kind, config, binding_block(root, fields, source_xpath, indent + "    "),
+                                  position, indent))
+        if position in grouped and position == max(grouped):
+            inner = [activities[i][0] for i in sorted(grouped)]
+            parts.extend(transition_xml(source, target, "        ")
+                         for source, target in zip(["start"] + inner, inner + ["end"]))
+            parts.append("    </pd:group>\n")
+        if position not in grouped:
+            names.append(activity_name)
+        previous = (activity_name, root)
+
+    for source, target in zip([start_name] + names, names + ["End"]):
+        parts.append(transition_xml(source, target))
+    parts.append("</pd:ProcessDefinition>\n")
+    return "".join(parts)
+
+
+def build_substvar(variables: int) -> str:
+    names = ["Deployment", "Domain", "LogSuppressJobInfo"] + [f"Setting{i:04d}" for i in range(max(0, variables - 3))]
+    rows = "".join(f"\t\t<globalVariable>\n\t\t\t<name>{name}</name>\n\t\t\t<value>value{i}</value>\n"
+                   f"\t\t\t<deploymentSettable>true</deploymentSettable>\n\t\t\t<serviceSettable>false</serviceSettable>\n"
+                   f"\t\t\t<type>String</type>\n\t\t\t<modTime>1357991244494</modTime>\n\t\t</globalVariable>\n"
+                   for i, name in enumerate(names))
+    return ('<?xml version = "1.0" encoding = "UTF-8"?>\n'
+            '<repository xmlns:xsi = "http://www.w3.org/2001/XMLSchema-instance" '
+            'xmlns = "http://www.tibco.com/xmlns/repo/types/2002">\n'
+            f"\t<globalVariables>\n{rows}\t</globalVariables>\n</repository>\n")
+
+
+def build_shared_http(index: int) -> str:
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<ns0:httpSharedResource xmlns:ns0="www.tibco.com/shared/HTTPConnection">\n'
+            "    <config>\n"
+            f"        <Host>host{index}.example.com</Host>\n"
+            "        <serverType>Tomcat</serverType>\n"
+            f"        <Port>{9090 + index}</Port>\n"
+            "    </config>\n"
+            "</ns0:httpSharedResource>\n")
+
+
+def build_aeschema(index: int, classes: int) -> str:
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+             '<Repository:repository xmlns="http://www.tibco.com/xmlns/aemeta/types/2002" '
+             'xmlns:Repository="http://www.tibco.com/xmlns/repo/types/2002" '
+             'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n']
+    for c in range(classes):
+        parts.append(f'    <class xmlns:AESchema="http://www.tibco.com/xmlns/aemeta/types/2002" name="Domain{index}Class{c}">\n')
+        if c > 0:
+            parts.append(f'        <superclass isRef="true">/AESchemas/Domain{index}.aeschema#class.Domain{index}Class0</superclass>\n')
+        for a in range(4):
+            parts.append(f"        <attribute>\n            <name>attr{a}</name>\n"
+                         f'            <attributeType isRef="true">/AESchemas/ae.aeschema#scalar.string</attributeType>\n'
+                         f"        </attribute>\n")
+        parts.append("    </class>\n")
+    parts.append("</Repository:repository>\n")
+    return "".join(parts)
+
+
+def write_file(root: str, relative_path: str, content: str):
+    path = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def generate_project(output_root: str, project_name: str = DEFAULT_PROJECT_NAME, processes: int = 100,
+                     activities: int = 6, depth: int = 4, fan_out: int = 3, global_variables: int = 50,
+                     http_resources: int = None, aeschemas: int = None, schema_pool: int = 20,
+                     fields_per_schema: int = 8, seed: int = 1) -> dict:
+    """
+    Escribe un proyecto BW sintético en <output_root>/<project_name>/ y devuelve sus parámetros y
+    recuentos. `depth` es el número de niveles del grafo de llamadas (el nivel 0 son los puntos de
+    entrada HTTP) y `fan_out` el número de subprocesos a los que llama cada proceso. Con la misma
+    semilla el árbol generado es idéntico.
+    """
+    rng = random.Random(seed)
+    processes = max(1, processes)
+    options = {"activities": max(1, activities), "fields_per_schema": max(1, fields_per_schema),
+               "schema_pool": max(1, schema_pool),
+               "http_resources": max(1, http_resources if http_resources is not None else processes // 50)}
+    aeschemas = max(1, aeschemas if aeschemas is not None else processes // 25)
+    project_root = os.path.join(output_root, project_name)
+    plan = plan_call_graph(processes, depth, fan_out, rng)
+
+    files = 0
+    for folder in ["", "Processes", "SharedResources", "AESchemas", "defaultVars"]:
+        write_file(project_root, os.path.join(folder, ".folder"), ""); files += 1
+    write_file(project_root, "vcrepo.dat", "RepoType=xml\n"); files += 1
+    write_file(project_root, "defaultVars/defaultVars.substvar", build_substvar(global_variables)); files += 1
+    for i in range(options["http_resources"]):
+        write_file(project_root, f"SharedResources/HTTPConnection{i}.sharedhttp", build_shared_http(i)); files += 1
+    for i in range(aeschemas):
+        write_file(project_root, f"AESchemas/Domain{i}.aeschema", build_aeschema(i, 5)); files += 1
+    for index, (level, callees) in enumerate(plan):
+        write_file(project_root, process_path(index, level), build_process(index, level, callees, plan, options, rng))
+        files += 1
+
+    return {"project_root": project_root, "processes": processes, "activities": options["activities"],
+            "depth": len({level for level, _ in plan}), "fan_out": fan_out, "global_variables": global_variables,
+            "http_resources": options["http_resources"], "aeschemas": aeschemas,
+            "schema_pool": options["schema_pool"], "fields_per_schema": options["fields_per_schema"],
+            "seed": seed, "files": files,
+            "entry_points": sum(1 for level, _ in plan if level == 0),
+            "calls": sum(len(callees) for _, callees in plan)}
@@ -1,14 +1,12 @@
 # src/vector_db_client.py
 
 import chromadb
-from sentence_transformers import SentenceTransformer
 import os
+from .embedding_service import embed_texts, get_embedding_function
 
 # --- Configuración ---
 DB_PATH = os.path.join("2_intermediate_data", "vector_db")
 COLLECTION_NAME = "tibco_knowledge_base"
-# Modelo de embeddings multilingüe y de alto rendimiento que se ejecuta localmente.
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 
 
 class VectorDBClient:
@@ -28,10 +26,8 @@ class VectorDBClient:
         # Asegurarse que el directorio para la DB persistente exista
         os.makedirs(DB_PATH, exist_ok=True)
 
-        # 1. Cargar el modelo de embeddings localmente
-        # Este modelo convierte texto a vectores numéricos. Se descarga automáticamente la primera vez.
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        print(f"     - Modelo de embeddings '{EMBEDDING_MODEL_NAME}' cargado.")
+        # 1. Función de embeddings compartida con RAGHandler: el modelo se carga en el primer uso.
+        self.embedding_function = get_embedding_function()
 
         # 2. Inicializar el cliente de la base de datos que persiste en disco
         self.client = chromadb.PersistentClient(path=DB_PATH)
@@ -39,6 +35,7 @@ class VectorDBClient:
         # 3. Obtener o crear la colección donde se almacenarán los datos
         self.collection = self.client.get_or_create_collection(
             name=COLLECTION_NAME,
+            embedding_function=self.embedding_function,
             metadata={"hnsw:space": "cosine"}  # Usar similitud de coseno
         )
         print(f"     - Conectado a la colección '{COLLECTION_NAME}'.")
@@ -54,9 +51,16 @@ class VectorDBClient:
             ids=[f"{doc.metadata.get('source', 'unknown')}_page{doc.metadata.get('page', 0)}_{i}" for i, doc in
                  enumerate(documents)],
             documents=[doc.page_content for doc in documents],
-            metadatas=[doc.metadata for doc in documents]
+            metadatas=[doc.metadata for doc in documents],
+            embeddings=embed_texts([doc.page_content for doc in documents])
         )
 
+    def add_chunks(self, texts, metadatas, ids):
+        """Añade un lote de fragmentos ya divididos (texto, metadatos e IDs explícitos)."""
+        if not texts:
+            return
+        self.collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embed_texts(texts))
+
     def query(self, query_text: str, n_results: int = 3) -> str:
         """Busca en la DB los fragmentos más relevantes para una consulta."""
         if self.collection.count() == 0:
@@ -64,7 +68,7 @@ class VectorDBClient:
             return "La base de conocimiento está vacía. No se pudo recuperar contexto."
 
         results = self.collection.query(
-            query_texts=[query_text],
+            query_embeddings=embed_texts([query_text]),
             n_results=n_results
         )
 
@@ -74,8 +78,3 @@ class VectorDBClient:
         # Concatena los fragmentos recuperados en un solo string
         context_str = "\n\n---\n\n".join(results['documents'][0])
         return context_str
-
-
-# Instancia global para ser usada por otros módulos
-# La inicialización se dispara la primera vez que se importa este módulo.
-db_client = VectorDBClient()
\ No newline at end of file